@@ -0,0 +1,302 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from enum import Enum
+from logging import getLogger
+from pathlib import Path
+from typing import IO, Dict, Optional, Set
+
+from anno3d.model.input_files import InputData
+
+logger = getLogger(__name__)
+
+ALL_DATA_FILE = "_all_data.jsonl"
+
+_IN_PROGRESS_SUFFIX = ".in_progress"
+"""出力中のフレームのディレクトリと同じ階層に作成する、マーカーファイルの拡張子"""
+
+_FSYNC_INTERVAL = 100
+"""この行数を書き込むごとに、ファイルの内容をディスクに書き出す"""
+
+_MAX_OPEN_SHARDS = 64
+"""`ShardedAllDataWriter`が同時に開いておくシャードの`_all_data.jsonl`の最大数"""
+
+
+class AllDataWriter:
+    """
+    ローカルに出力した入力データの一覧（`_all_data.jsonl`）を、1件ずつ追記していくクラスです。
+
+    フレームの出力が完了するごとに追記するため、処理が途中で中断されても出力済みの入力データは失われません。
+    既に`_all_data.jsonl`が存在する場合は、その内容を読み込んで続きから追記します。
+    書き込み途中で中断された行は、読み込み時に取り除きます。
+
+    Args:
+        output_dir: 出力先ディレクトリ
+    """
+
+    _written: Set[str]
+    """出力済みの入力データID"""
+    _writer: Optional[IO[str]]
+
+    def __init__(self, output_dir: Path):
+        self._file = output_dir / ALL_DATA_FILE
+        self._written = set()
+        self._writer = None
+        self._unsynced = 0
+        self._lock = threading.Lock()
+        if self._file.exists():
+            self._load()
+
+    def _load(self) -> None:
+        lines = []
+        broken = False
+        with self._file.open(encoding="UTF-8") as reader:
+            for line in reader:
+                try:
+                    if not line.endswith("\n"):
+                        raise ValueError("改行されていません")
+                    input_data_id = InputData.from_dict(json.loads(line)).id
+                except (ValueError, KeyError):
+                    broken = True
+                    continue
+                self._written.add(input_data_id)
+                lines.append(line)
+
+        if broken:
+            # 書き込み途中で中断された行を取り除いた内容で置き換える
+            logger.warning("読み込めなかった行を取り除きます: %s", self._file.absolute())
+            temp = self._file.with_name(f".{self._file.name}.tmp")
+            with temp.open("w", encoding="UTF-8") as writer:
+                writer.writelines(lines)
+                writer.flush()
+                os.fsync(writer.fileno())
+            os.replace(temp, self._file)
+
+        logger.info("出力済みの入力データを%d件読み込みました: %s", len(self._written), self._file.absolute())
+
+    @property
+    def file(self) -> Path:
+        return self._file
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._written)
+
+    def is_written(self, input_data_id: str) -> bool:
+        with self._lock:
+            return input_data_id in self._written
+
+    def write(self, input_data: InputData) -> None:
+        """
+        入力データを追記します。 同じ入力データIDの入力データが出力済みの場合は何もしません。
+        """
+        line = input_data.to_json(ensure_ascii=False, sort_keys=True)
+        with self._lock:
+            if input_data.id in self._written:
+                return
+            if self._writer is None:
+                self._file.parent.mkdir(parents=True, exist_ok=True)
+                self._writer = self._file.open("a", encoding="UTF-8")  # pylint: disable=consider-using-with
+            self._writer.write(line + "\n")
+            self._writer.flush()
+            self._written.add(input_data.id)
+            self._unsynced += 1
+            if self._unsynced >= _FSYNC_INTERVAL:
+                os.fsync(self._writer.fileno())
+                self._unsynced = 0
+
+    def release(self) -> None:
+        """
+        ファイルを閉じます。 次に書き込む際に、追記モードで開き直します。
+        ディスクへの書き出しは行わず、以降の書き込みや`close`の際にまとめて行います。
+        """
+        with self._lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+
+    def close(self) -> None:
+        with self._lock:
+            if self._writer is None and self._unsynced > 0:
+                # `release`で閉じた後、ディスクに書き出していない内容がある
+                self._writer = self._file.open("a", encoding="UTF-8")  # pylint: disable=consider-using-with
+            if self._writer is not None:
+                self._writer.flush()
+                os.fsync(self._writer.fileno())
+                self._writer.close()
+                self._writer = None
+                self._unsynced = 0
+
+
+class ShardingKind(Enum):
+    """
+    フレームのディレクトリの分け方
+
+    * none: 出力先ディレクトリの直下にフレームのディレクトリを作成する
+    * hash: フレームIDのハッシュ値の先頭の文字列ごとに分ける
+    * bucket: フレームの順番で、一定の数ごとに分ける
+    """
+
+    NONE = "none"
+    HASH = "hash"
+    BUCKET = "bucket"
+
+
+@dataclass(frozen=True)
+class OutputLayout:
+    """
+    ローカルに出力するフレームのディレクトリの配置
+
+    Args:
+        kind: フレームのディレクトリの分け方
+        hash_length: hashの場合に、ディレクトリ名に利用するハッシュ値（16進数）の文字数。
+                     ディレクトリの数は16^hash_lengthとなる
+        bucket_size: bucketの場合に、1つのディレクトリに含めるフレームの数
+    """
+
+    kind: ShardingKind = ShardingKind.NONE
+    hash_length: int = 2
+    bucket_size: int = 1000
+
+    def __post_init__(self):
+        if self.hash_length <= 0 or self.bucket_size <= 0:
+            raise ValueError(
+                f"hash_lengthとbucket_sizeは1以上である必要があります: hash_length={self.hash_length}, "
+                f"bucket_size={self.bucket_size}"
+            )
+
+    def shard(self, frame_id: str, index: int) -> Optional[str]:
+        """
+        フレームを配置するシャードのディレクトリ名を求めます。 シャードに分けない場合はNoneを返します。
+
+        Args:
+            frame_id: フレームID
+            index: シーン内でのフレームの順番
+        """
+        if self.kind == ShardingKind.HASH:
+            return hashlib.sha256(frame_id.encode("UTF-8")).hexdigest()[: self.hash_length]
+        if self.kind == ShardingKind.BUCKET:
+            return f"{index // self.bucket_size:06d}"
+        return None
+
+
+class ShardedAllDataWriter:
+    """
+    シャードに分けて出力した入力データの一覧を書き込むクラスです。
+
+    出力先ディレクトリ直下の`_all_data.jsonl`に全入力データを追記するのに加えて、
+    各シャードのディレクトリにも、そのシャードの入力データのみの`_all_data.jsonl`を追記します。
+    シャードごとの一覧は別々のファイルに書き込むため、複数のスレッドから並行に書き込めます。
+    出力済みかどうかは、出力先ディレクトリ直下の`_all_data.jsonl`で判定します。
+
+    フレームの出力は`start_frame`で開始し、`write`で完了します。 その間はフレームのディレクトリと同じ階層に
+    出力中であることを表すマーカーファイルを置きます。 中断後に再実行した際には、マーカーの残っているディレクトリのみを
+    出力が完了していないものとして削除します。
+    マーカーの無いディレクトリは、このクラスが出力したものか分からないため削除しません。
+
+    シャードの数はフレーム数に比例して増えるため、ファイルディスクリプタを使い切らないように、
+    開いておくシャードのファイルは最近書き込んだ`max_open_shards`個までとします。
+    それ以外のシャードのファイルは閉じておき、次に書き込む際に追記モードで開き直します。
+
+    Args:
+        output_dir: 出力先ディレクトリ
+        layout: フレームのディレクトリの配置
+        max_open_shards: 同時に開いておくシャードのファイルの最大数
+    """
+
+    _shards: Dict[str, AllDataWriter]
+    _open_shards: "OrderedDict[str, AllDataWriter]"
+    """ファイルを開いている可能性のあるシャード。 最近書き込んだものほど後ろに並ぶ"""
+
+    def __init__(self, output_dir: Path, layout: OutputLayout, max_open_shards: int = _MAX_OPEN_SHARDS):
+        if max_open_shards <= 0:
+            raise ValueError(f"max_open_shardsは1以上である必要があります: {max_open_shards}")
+        self._output_dir = output_dir
+        self._layout = layout
+        self._max_open_shards = max_open_shards
+        self._index = AllDataWriter(output_dir)
+        self._shards = {}
+        self._open_shards = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def file(self) -> Path:
+        return self._index.file
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def frame_parent_dir(self, frame_id: str, index: int) -> Path:
+        """フレームのディレクトリを作成するディレクトリを求めます。"""
+        shard = self._layout.shard(frame_id, index)
+        return self._output_dir / shard if shard is not None else self._output_dir
+
+    def is_written(self, input_data_id: str) -> bool:
+        return self._index.is_written(input_data_id)
+
+    def _in_progress_marker(self, frame_id: str, index: int) -> Path:
+        return self.frame_parent_dir(frame_id, index) / f".{frame_id}{_IN_PROGRESS_SUFFIX}"
+
+    def start_frame(self, frame_id: str, index: int) -> Path:
+        """
+        フレームの出力を開始します。 フレームのディレクトリを作成する前に呼び出します。
+
+        前回の実行で出力が完了しなかったフレームのディレクトリ（マーカーファイルが残っているもの）は削除します。
+
+        Returns:
+            フレームのディレクトリを作成するディレクトリ
+
+        Raises:
+            RuntimeError: マーカーファイルの無いフレームのディレクトリが既に存在する
+        """
+        parent_dir = self.frame_parent_dir(frame_id, index)
+        marker = self._in_progress_marker(frame_id, index)
+        frame_dir = parent_dir / frame_id
+        if frame_dir.exists():
+            if not marker.exists():
+                raise RuntimeError(f"データ生成先ディレクトリがすでに存在します: {frame_dir.absolute()}")
+            logger.warning("出力が完了していないディレクトリを削除して、出力し直します: %s", frame_dir)
+            shutil.rmtree(frame_dir)
+        parent_dir.mkdir(parents=True, exist_ok=True)
+        marker.touch()
+        return parent_dir
+
+    def _shard_writer(self, shard: str) -> AllDataWriter:
+        with self._lock:
+            writer = self._shards.get(shard)
+            if writer is None:
+                writer = self._shards[shard] = AllDataWriter(self._output_dir / shard)
+            return writer
+
+    def _mark_open(self, shard: str, writer: AllDataWriter) -> None:
+        with self._lock:
+            self._open_shards[shard] = writer
+            self._open_shards.move_to_end(shard)
+            while len(self._open_shards) > self._max_open_shards:
+                _, oldest = self._open_shards.popitem(last=False)
+                # 閉じた後に他のスレッドが書き込んだ場合は、開き直したうえで`_mark_open`で再び登録される
+                oldest.release()
+
+    def write(self, input_data: InputData, frame_id: str, index: int) -> None:
+        """
+        入力データを、シャードの一覧と全体の一覧に追記します。
+        `start_frame`で作成したマーカーファイルは、追記後に削除します。
+        """
+        shard = self._layout.shard(frame_id, index)
+        if shard is not None:
+            writer = self._shard_writer(shard)
+            writer.write(input_data)
+            self._mark_open(shard, writer)
+        self._index.write(input_data)
+        self._in_progress_marker(frame_id, index).unlink(missing_ok=True)
+
+    def close(self) -> None:
+        with self._lock:
+            writers = list(self._shards.values())
+        for writer in writers:
+            writer.close()
+        self._index.close()
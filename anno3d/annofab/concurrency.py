@@ -0,0 +1,172 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from logging import getLogger
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+from anno3d.annofab.retry import is_retryable, retry_after
+
+logger = getLogger(__name__)
+
+T = TypeVar("T")
+
+_LATENCY_SMOOTHING = 0.2
+"""レイテンシの指数移動平均の重み"""
+
+
+@dataclass
+class _Latency:
+    average: float
+    """レイテンシの指数移動平均[秒]"""
+    baseline: float
+    """混雑していない状態のレイテンシとみなす値[秒]"""
+
+
+@dataclass(frozen=True)
+class AdaptiveLimiterStats:
+    window: int
+    """現在の並行数の上限"""
+    max_window: int
+    in_flight: int
+    """実行中のリクエスト数"""
+    requests: int
+    """完了したリクエスト数（失敗を含む）"""
+    errors: int
+    """再試行可能なエラーで失敗したリクエスト数"""
+    requests_per_second: float
+
+    def describe(self) -> str:
+        return (
+            f"並行数={self.window}/{self.max_window}(実行中={self.in_flight}), "
+            f"リクエスト={self.requests}件({self.requests_per_second:.1f}件/秒), エラー={self.errors}件"
+        )
+
+
+class AdaptiveLimiter:
+    """
+    APIの応答に応じて並行数の上限を調整するリミッターです。
+
+    AIMD（加算増加・乗算減少）で並行数の上限を調整します。
+
+    * 成功したリクエストごとに上限を増やす。 最初に混雑を検知するまでは1件ごとに1増やし（スロースタート）、
+      それ以降は上限分のリクエストが成功するごとに1増やす
+    * 再試行可能なエラー（429・5xx・接続エラー）で失敗した場合は上限を半分にする
+    * レイテンシの移動平均が、混雑していない状態の`latency_factor`倍を超えた場合は、混雑しているとみなして上限を下げる。
+      レイテンシはリクエストの種類（`run`の`kind`）ごとに集計する
+    * レスポンスに`Retry-After`ヘッダがある場合は、その秒数の間は新たなリクエストを開始しない
+
+    1回の混雑で上限を何度も下げないように、上限を下げてから開始したリクエストの結果のみを次の調整に用います。
+    イベントループ内で利用することを前提としており、スレッドセーフではありません。
+
+    Args:
+        max_window: 並行数の上限の最大値
+        min_window: 並行数の上限の最小値
+        latency_factor: 混雑とみなすレイテンシの、混雑していない状態のレイテンシに対する倍率
+    """
+
+    def __init__(self, max_window: int, min_window: int = 1, latency_factor: float = 3.0):
+        if max_window < min_window or min_window < 1:
+            raise ValueError(f"並行数の範囲が不正です: min_window={min_window}, max_window={max_window}")
+        self._max_window = max_window
+        self._min_window = min_window
+        self._latency_factor = latency_factor
+        self._window = float(min(max_window, max(min_window, 4)))
+        self._slow_start = True
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._last_decreased = float("-inf")
+        self._latencies: Dict[str, _Latency] = {}
+        self._requests = 0
+        self._errors = 0
+        self._started = time.monotonic()
+        self._condition = asyncio.Condition()
+
+    @property
+    def window(self) -> int:
+        return int(self._window)
+
+    async def run(self, func: Callable[[], Awaitable[T]], kind: str) -> T:
+        """
+        並行数の上限の範囲内で`func`を1回実行し、その結果を並行数の調整に用います。
+
+        Args:
+            func: 実行する処理
+            kind: リクエストの種類。 レイテンシの集計に利用する
+        """
+        await self._acquire()
+        started = time.monotonic()
+        try:
+            result = await func()
+        except Exception as e:  # pylint: disable=broad-except
+            await self._release(kind, started, e)
+            raise
+        await self._release(kind, started, None)
+        return result
+
+    async def _acquire(self) -> None:
+        while True:
+            pause = self._paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+                continue
+            async with self._condition:
+                if self._in_flight < self.window and self._paused_until <= time.monotonic():
+                    self._in_flight += 1
+                    return
+                await self._condition.wait()
+
+    async def _release(self, kind: str, started: float, error: Optional[BaseException]) -> None:
+        now = time.monotonic()
+        async with self._condition:
+            self._in_flight -= 1
+            self._requests += 1
+            if error is None:
+                self._on_success(kind, started, now - started)
+            elif is_retryable(error):
+                self._on_congestion(started, now, error)
+            self._condition.notify_all()
+
+    def _on_success(self, kind: str, started: float, latency: float) -> None:
+        stat = self._latencies.get(kind)
+        if stat is None:
+            stat = self._latencies[kind] = _Latency(latency, latency)
+        else:
+            stat.average = (1 - _LATENCY_SMOOTHING) * stat.average + _LATENCY_SMOOTHING * latency
+            stat.baseline = min(stat.baseline, stat.average)
+        if stat.average > stat.baseline * self._latency_factor:
+            if self._decrease(started, 0.8, f"レイテンシの増加({kind}: {stat.average:.2f}秒)"):
+                # 回線の状態が変わった場合に上限を下げ続けないよう、以降は現在のレイテンシからの増加のみを混雑とみなす
+                stat.baseline = stat.average / self._latency_factor
+            return
+        self._window = min(float(self._max_window), self._window + (1.0 if self._slow_start else 1.0 / self._window))
+
+    def _on_congestion(self, started: float, now: float, error: BaseException) -> None:
+        self._errors += 1
+        wait = retry_after(error)
+        if wait is not None and now + wait > self._paused_until:
+            self._paused_until = now + wait
+            logger.info("Retry-Afterの指定に従い、%.1f秒間は新たなリクエストを開始しません", wait)
+        self._decrease(started, 0.5, f"エラー({error})")
+
+    def _decrease(self, started: float, factor: float, reason: str) -> bool:
+        if started < self._last_decreased:
+            # 前回上限を下げる前に開始したリクエストの結果は、前回の調整で考慮済み
+            return False
+        before = self.window
+        self._window = max(float(self._min_window), self._window * factor)
+        self._slow_start = False
+        self._last_decreased = time.monotonic()
+        if self.window != before:
+            logger.info("%sのため、並行数の上限を%dから%dに下げます", reason, before, self.window)
+        return True
+
+    def stats(self) -> AdaptiveLimiterStats:
+        elapsed = max(time.monotonic() - self._started, 1e-9)
+        return AdaptiveLimiterStats(
+            window=self.window,
+            max_window=self._max_window,
+            in_flight=self._in_flight,
+            requests=self._requests,
+            errors=self._errors,
+            requests_per_second=self._requests / elapsed,
+        )
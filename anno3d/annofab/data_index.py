@@ -0,0 +1,118 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from logging import getLogger
+from typing import Dict, Iterable, Optional
+
+from annofabapi import AnnofabApi
+from annofabapi import Wrapper as AnnofabApiWrapper
+
+logger = getLogger(__name__)
+
+
+class ProjectDataIndex:
+    """
+    プロジェクトに登録済みの入力データと補助情報の更新日時を保持する索引です。
+
+    入力データや補助情報を上書きする際に必要な`last_updated_datetime`を、ファイルごとにAPIを呼び出さずに取得するために利用します。
+    `load`で一括取得しなかった入力データは、初めて参照した際に取得します。
+
+    Args:
+        client:
+        project: プロジェクトID
+        parallelism: 補助情報の一括取得時に、同時に実行するAPI呼び出しの最大数
+    """
+
+    _input_data: Dict[str, str]
+    """input_data_id => updated_datetime"""
+    _supplementaries: Dict[str, Dict[str, str]]
+    """input_data_id => (supplementary_data_id => updated_datetime)"""
+
+    def __init__(self, client: AnnofabApi, project: str, parallelism: int = 8):
+        self._client = client
+        self._client_wrapper = AnnofabApiWrapper(client)
+        self._project = project
+        self._parallelism = parallelism
+        self._input_data = {}
+        self._supplementaries = {}
+        self._loaded = False
+        self._lock = threading.RLock()
+
+    def load(self, input_data_ids: Optional[Iterable[str]] = None) -> None:
+        """
+        登録済みの入力データと補助情報を一括で取得し、索引を作り直します。
+
+        Args:
+            input_data_ids: 補助情報を取得する入力データのid。 Noneの場合は、登録済みのすべての入力データが対象となります。
+        """  # noqa: E501
+        input_data_list = self._client_wrapper.get_all_input_data_list(self._project)
+        input_data = {e["input_data_id"]: e["updated_datetime"] for e in input_data_list}
+        targets = (
+            list(input_data.keys())
+            if input_data_ids is None
+            else [input_data_id for input_data_id in input_data_ids if input_data_id in input_data]
+        )
+
+        logger.info("登録済みの入力データ %d 件の補助情報を取得します", len(targets))
+        with ThreadPoolExecutor(max_workers=self._parallelism) as executor:
+            supplementaries = dict(zip(targets, executor.map(self._fetch_supplementaries, targets)))
+
+        with self._lock:
+            self._input_data = input_data
+            self._supplementaries = supplementaries
+            self._loaded = True
+
+    def _load_if_necessary(self) -> None:
+        with self._lock:
+            if not self._loaded:
+                self.load(input_data_ids=[])
+
+    def _fetch_supplementaries(self, input_data_id: str) -> Dict[str, str]:
+        supplementary_list = self._client_wrapper.get_supplementary_data_list_or_none(self._project, input_data_id)
+        if supplementary_list is None:
+            return {}
+        return {e["supplementary_data_id"]: e["updated_datetime"] for e in supplementary_list}
+
+    def input_data_updated_datetime(self, input_data_id: str) -> Optional[str]:
+        self._load_if_necessary()
+        with self._lock:
+            return self._input_data.get(input_data_id)
+
+    def supplementary_updated_datetime(self, input_data_id: str, supplementary_id: str) -> Optional[str]:
+        self._load_if_necessary()
+        with self._lock:
+            if input_data_id not in self._input_data:
+                return None
+            supplementaries = self._supplementaries.get(input_data_id)
+
+        if supplementaries is None:
+            supplementaries = self._fetch_supplementaries(input_data_id)
+            with self._lock:
+                supplementaries = self._supplementaries.setdefault(input_data_id, supplementaries)
+
+        return supplementaries.get(supplementary_id)
+
+    def update_input_data(self, input_data_id: str, updated_datetime: str) -> None:
+        with self._lock:
+            if input_data_id not in self._input_data:
+                # 新規に登録した入力データには、補助情報が存在しない
+                self._supplementaries[input_data_id] = {}
+            self._input_data[input_data_id] = updated_datetime
+
+    def update_supplementary(self, input_data_id: str, supplementary_id: str, updated_datetime: str) -> None:
+        with self._lock:
+            supplementaries = self._supplementaries.get(input_data_id)
+            if supplementaries is not None:
+                supplementaries[supplementary_id] = updated_datetime
+
+    def refresh_input_data(self, input_data_id: str) -> None:
+        """
+        更新が競合した場合などに、対象の入力データとその補助情報を取得し直します。
+        """
+        input_data = self._client_wrapper.get_input_data_or_none(self._project, input_data_id)
+        supplementaries = self._fetch_supplementaries(input_data_id) if input_data is not None else {}
+        with self._lock:
+            if input_data is None:
+                self._input_data.pop(input_data_id, None)
+            else:
+                self._input_data[input_data_id] = input_data["updated_datetime"]
+            self._supplementaries[input_data_id] = supplementaries
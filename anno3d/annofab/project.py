@@ -484,6 +484,9 @@ class ProjectApi:
 
         return [self._from_annofab_label(label.to_dict(encode_json=True)) for label in created_specs.labels]
 
+    def get_annotation_area(self, project_id: str) -> AnnotationArea:
+        return ProjectSpecifiers.annotation_area.get(self.get_annotation_specs(project_id))
+
     def set_annotation_area(self, project_id: str, area: AnnotationArea) -> ProjectMetadata:
         new_spec = self._mod_project_specs(project_id, ProjectModifiers.set_annotation_area(area))
         return ProjectSpecifiers.metadata.get(new_spec)
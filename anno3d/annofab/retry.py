@@ -0,0 +1,156 @@
+import asyncio
+import random
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from logging import getLogger
+from typing import Awaitable, Callable, Optional, TypeVar
+
+import aiohttp
+import boto3.exceptions
+import botocore.exceptions
+import requests
+
+logger = getLogger(__name__)
+
+T = TypeVar("T")
+
+
+@dataclass(frozen=True)
+class RetrySettings:
+    """
+    一時的なエラーで失敗したAPI呼び出しの再試行の設定
+
+    Args:
+        max_attempts: 最初の呼び出しを含めた、最大の試行回数
+        initial_delay: 1回目の再試行までの最大の待ち時間[秒]。 再試行のたびに2倍にする
+        max_delay: 待ち時間の上限[秒]
+    """
+
+    max_attempts: int = 5
+    initial_delay: float = 1.0
+    max_delay: float = 30.0
+
+    def delay(self, retry_count: int) -> float:
+        """
+        `retry_count`回目（1始まり）の再試行までの待ち時間を求めます。
+        同時に失敗した呼び出しの再試行が重ならないように、上限までの範囲でランダムに決めます。
+        """
+        return random.uniform(0.0, min(self.max_delay, self.initial_delay * 2 ** (retry_count - 1)))
+
+
+_THROTTLING_ERROR_CODES = {
+    "Throttling",
+    "ThrottlingException",
+    "ThrottledException",
+    "RequestThrottled",
+    "RequestThrottledException",
+    "TooManyRequestsException",
+    "RequestLimitExceeded",
+    "SlowDown",
+}
+"""AWSのAPIが、リクエストの頻度が高すぎる場合に返すエラーコード"""
+
+
+def _is_retryable_status(status: Optional[int]) -> bool:
+    return status is not None and (status == 429 or status >= 500)
+
+
+def _botocore_status(error: botocore.exceptions.ClientError) -> Optional[int]:
+    status = error.response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+    return int(status) if status is not None else None
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    再試行によって成功する可能性のあるエラー（接続エラー・タイムアウト・429・5xx・スロットリング）かどうかを判定します。
+
+    AnnofabのAPI（requests）・ストレージへのアップロード（aiohttp）・S3へのアップロード（botocore）のエラーを判定できます。
+    """
+    if isinstance(error, requests.HTTPError):
+        response = error.response
+        return response is not None and _is_retryable_status(response.status_code)
+    if isinstance(error, aiohttp.ClientResponseError):
+        return _is_retryable_status(error.status)
+    if isinstance(error, boto3.exceptions.S3UploadFailedError):
+        # `upload_file`は、失敗したリクエストのClientErrorをS3UploadFailedErrorに包んで送出する
+        cause = error.__cause__ or error.__context__
+        return cause is not None and is_retryable(cause)
+    if isinstance(error, botocore.exceptions.ClientError):
+        code = error.response.get("Error", {}).get("Code")
+        return code in _THROTTLING_ERROR_CODES or _is_retryable_status(_botocore_status(error))
+    return isinstance(
+        error,
+        (
+            requests.ConnectionError,
+            requests.Timeout,
+            aiohttp.ClientConnectionError,
+            asyncio.TimeoutError,
+            botocore.exceptions.ConnectionError,
+            botocore.exceptions.HTTPClientError,
+        ),
+    )
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """
+    エラーのレスポンスの`Retry-After`ヘッダから、再試行までに待つべき秒数を取得します。
+
+    Returns:
+        待つべき秒数。 ヘッダが無い場合や解釈できない場合はNone
+    """
+    if isinstance(error, requests.HTTPError):
+        return _parse_retry_after(error.response.headers.get("Retry-After")) if error.response is not None else None
+    if isinstance(error, aiohttp.ClientResponseError):
+        return _parse_retry_after(error.headers.get("Retry-After")) if error.headers is not None else None
+    if isinstance(error, botocore.exceptions.ClientError):
+        # botocoreはヘッダ名を小文字にして保持する
+        headers = error.response.get("ResponseMetadata", {}).get("HTTPHeaders", {})
+        return _parse_retry_after(headers.get("retry-after"))
+    return None
+
+
+async def retry_async(func: Callable[[], Awaitable[T]], settings: RetrySettings, description: str) -> T:
+    """
+    `func`を実行し、再試行可能なエラーで失敗した場合は待ち時間を空けて再試行します。
+    レスポンスに`Retry-After`ヘッダがある場合は、少なくともその秒数は待ちます。
+
+    Args:
+        func: 実行する処理
+        settings: 再試行の設定
+        description: ログに出力する処理の説明
+
+    Returns:
+        `func`の戻り値
+    """
+    retry_count = 0
+    while True:
+        try:
+            return await func()
+        except Exception as e:  # pylint: disable=broad-except
+            retry_count += 1
+            if retry_count >= settings.max_attempts or not is_retryable(e):
+                raise
+            delay = max(settings.delay(retry_count), retry_after(e) or 0.0)
+            logger.warning(
+                "%sに失敗したため、%.1f秒後に再試行します(%d/%d): %s",
+                description,
+                delay,
+                retry_count,
+                settings.max_attempts - 1,
+                e,
+            )
+            await asyncio.sleep(delay)
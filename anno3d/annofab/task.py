@@ -1,6 +1,7 @@
-from typing import Collection, List, Optional
+from typing import Collection, Dict, List, Optional
 
 from annofabapi import AnnofabApi
+from annofabapi import Wrapper as AnnofabApiWrapper
 from annofabapi import models as afm
 from annofabapi.dataclass.task import Task
 from annofabapi.models import TaskStatus
@@ -33,6 +34,20 @@ class TaskApi:
 
         return self._decode_task(result)
 
+    def get_task_input_data_ids(self, task_id_prefix: Optional[str] = None) -> Dict[str, List[str]]:
+        """
+        作成済みのタスクの入力データIDの一覧を一括で取得します。
+
+        Args:
+            task_id_prefix: 指定した場合、タスクIDにこの文字列を含むタスクのみを取得する
+
+        Returns:
+            task_id => 入力データIDの一覧
+        """
+        query_params = {"task_id": task_id_prefix} if task_id_prefix else None
+        tasks = AnnofabApiWrapper(self._client).get_all_tasks(self._project_id, query_params=query_params)
+        return {task["task_id"]: list(task["input_data_id_list"]) for task in tasks}
+
     def put_task(self, task_id: str, input_data_ids: Collection[str]) -> Task:
         client = self._client
         project_id = self._project_id
@@ -1,17 +1,32 @@
 import abc
+import asyncio
+import contextlib
+import functools
+import hashlib
+import io
 import mimetypes
+import queue
+import threading
+import uuid
 from dataclasses import dataclass
 from logging import getLogger
 from pathlib import Path
-from typing import Any, Literal, Optional
+from typing import IO, Any, Awaitable, Callable, Dict, Iterable, Iterator, List, Literal, Optional, Set, TypeVar, Union
 
+import aiohttp
 import boto3
-import more_itertools
 import requests
 from annofabapi import AnnofabApi
 from annofabapi import Wrapper as AnnofabApiWrapper
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config as BotoConfig
 from botocore.errorfactory import ClientError
 
+from anno3d.annofab.concurrency import AdaptiveLimiter
+from anno3d.annofab.data_index import ProjectDataIndex
+from anno3d.upload_cache import UploadCache
+from anno3d.upload_journal import JournalKind, UploadJournal
+
 
 @dataclass(frozen=True)
 class DataPath:
@@ -21,18 +36,129 @@ class DataPath:
 
 logger = getLogger(__name__)
 
+T = TypeVar("T")
+
+UploadSource = Union[Path, bytes, bytearray, memoryview]
+"""アップロードするデータ。 ファイルのパス、またはメモリ上のデータ"""
+
+
+async def _run_limited(limiter: Optional[AdaptiveLimiter], func: Callable[[], Awaitable[T]], kind: str) -> T:
+    """
+    `limiter`がある場合は、その並行数の上限の範囲内で`func`を実行します。
+    """
+    if limiter is None:
+        return await func()
+    return await limiter.run(func, kind)
+
 
-def _get_content_type(upload_file: Path) -> str:
+def _get_content_type(source: UploadSource) -> str:
     """
-    アップロードするファイルのContent-Typeを取得する。
+    アップロードするデータのContent-Typeを取得する。
     """
-    content_type, _ = mimetypes.guess_type(upload_file)
+    if not isinstance(source, Path):
+        return "application/octet-stream"
+
+    content_type, _ = mimetypes.guess_type(source)
     if content_type is None:
         # ファイル名から推測できない場合
         return "application/octet-stream"
     return content_type
 
 
+@contextlib.contextmanager
+def _open_source(source: UploadSource) -> Iterator[Union[IO[bytes], bytes]]:
+    """
+    アップロードするデータを、HTTPリクエストのbodyとして渡せる形で開きます。
+    """
+    if isinstance(source, Path):
+        with source.open(mode="rb") as reader:
+            yield reader
+    else:
+        yield bytes(source)
+
+
+class TempPathPool:
+    """
+    createTempPath APIで取得した一時データ保存先を、事前に取得してプールしておくクラス。
+
+    バックグラウンドのスレッドが、プールが満杯になるまで一時データ保存先を取得し続けるため、
+    ファイルのアップロード時に一時データ保存先の取得を待たずに済みます。
+    一時データ保存先のURLには有効期限があるため、プールのサイズは大きくしすぎないでください。
+
+    Args:
+        allocate: 一時データ保存先を1件取得する関数
+        size: プールしておく一時データ保存先の最大数
+        workers: プールを補充するスレッドの数
+    """
+
+    _queue: "queue.Queue[DataPath]"
+    _threads: List[threading.Thread]
+
+    def __init__(self, allocate: Callable[[], DataPath], size: int = 32, workers: int = 4):
+        self._allocate = allocate
+        self._queue = queue.Queue(maxsize=size)
+        self._workers = workers
+        self._threads = []
+        self._closed = threading.Event()
+        self._lock = threading.Lock()
+
+    def _start_if_necessary(self) -> None:
+        with self._lock:
+            if len(self._threads) > 0:
+                return
+
+            self._closed.clear()
+            self._threads = [
+                threading.Thread(target=self._prefetch, name=f"temp-path-prefetcher-{i}", daemon=True)
+                for i in range(self._workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    def _prefetch(self) -> None:
+        while not self._closed.is_set():
+            try:
+                data_path = self._allocate()
+            except Exception:  # pylint: disable=broad-except
+                logger.warning("一時データ保存先の事前取得に失敗しました", exc_info=True)
+                self._closed.wait(1.0)
+                continue
+
+            while not self._closed.is_set():
+                try:
+                    self._queue.put(data_path, timeout=0.5)
+                    break
+                except queue.Full:
+                    continue
+
+    def get_nowait(self) -> Optional[DataPath]:
+        """
+        プールから一時データ保存先を取り出します。 プールが空の場合はNoneを返します。
+        """
+        self._start_if_necessary()
+        try:
+            return self._queue.get_nowait()
+        except queue.Empty:
+            return None
+
+    def get(self) -> DataPath:
+        """
+        プールから一時データ保存先を取り出します。 プールが空の場合は、その場で取得します。
+        """
+        data_path = self.get_nowait()
+        return data_path if data_path is not None else self._allocate()
+
+    def close(self) -> None:
+        """
+        プールの補充を停止します。 停止後に再度利用した場合は、補充を再開します。
+        """
+        with self._lock:
+            self._closed.set()
+            for thread in self._threads:
+                thread.join()
+            self._threads = []
+
+
 class Uploader(abc.ABC):
     """
 
@@ -40,110 +166,458 @@ class Uploader(abc.ABC):
         client:
         project: プロジェクトID
         force: 入力データと補助データを上書きしてアップロードするかどうか。
+        journal: 登録済みの入力データと補助情報を記録するジャーナル。 記録済みのものはアップロードをスキップします。
+        cache: ファイルの内容を記録するキャッシュ。 内容が変更されていないファイルはスキップします。
     """
 
     _client: AnnofabApi
     _project: str
 
-    def __init__(self, client: AnnofabApi, project: str, force: bool = False):
+    def __init__(
+        self,
+        client: AnnofabApi,
+        project: str,
+        force: bool = False,
+        journal: Optional[UploadJournal] = None,
+        cache: Optional[UploadCache] = None,
+    ):
         self._client = client
         self._client_wrapper = AnnofabApiWrapper(client)
         self._project = project
         self._force = force
+        self._index = ProjectDataIndex(client, project)
+        self._journal = journal if journal is not None else UploadJournal()
+        self._cache = cache if cache is not None else UploadCache()
 
     def get_input_data(self, input_data_id: str) -> Optional[Any]:
         return self._client_wrapper.get_input_data_or_none(self._project, input_data_id)
 
-    @abc.abstractmethod
-    def upload_tempdata(self, upload_file: Path, *, content_type: Optional[str] = None) -> str:
-        pass
+    def prepare(self, input_data_ids: Iterable[str]) -> None:
+        """
+        アップロードを開始する前に呼び出します。
 
-    def upload_input_data(self, input_data_id: str, file: Path, *, content_type: Optional[str] = None) -> str:
-        path = self.upload_tempdata(file, content_type=content_type)
+        forceモードの場合、上書き対象となりうる登録済みの入力データと補助情報を一括で取得して索引を作成します。
+        これにより、上書き時にファイルごとに登録済みデータを取得する必要がなくなります。
 
-        data_id = input_data_id
-        body = {"input_data_name": file.name, "input_data_path": path}
+        Args:
+            input_data_ids: これからアップロードする入力データのid。 forceモードの場合のみ、1度だけ走査する
+        """
         if self._force:
-            old_input_data = self.get_input_data(input_data_id)
-            if old_input_data is not None:
-                body["last_updated_datetime"] = old_input_data["updated_datetime"]
+            self._index.load(input_data_ids)
+
+    @abc.abstractmethod
+    def upload_tempdata(
+        self, source: UploadSource, *, content_type: Optional[str] = None, name: Optional[str] = None
+    ) -> str:
+        """
+        データをアップロードします。
+
+        Args:
+            source: アップロードするファイルのパス、またはメモリ上のデータ
+            content_type: アップロードするデータのContent-Type。Noneの場合はファイル名から推測します。
+            name: アップロードするデータの名前。 アップロード先のパスの決定に利用する場合があります。
 
-        input_data, _ = self._client.put_input_data(self._project, data_id, query_params=None, request_body=body)
+        Returns:
+            アップロード先のパス
+        """
+
+    async def upload_tempdata_async(
+        self, source: UploadSource, *, content_type: Optional[str] = None, name: Optional[str] = None
+    ) -> str:
+        """
+        `upload_tempdata` の非同期版です。
+        デフォルトでは、`upload_tempdata` をデフォルトのThreadPoolExecutorで実行します。
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None, functools.partial(self.upload_tempdata, source, content_type=content_type, name=name)
+        )
+
+    async def close_async(self) -> None:
+        """
+        非同期アップロードのために確保したリソースを解放します。
+        解放後に再度利用した場合は、リソースを確保し直します。
+        """
+        self._cache.shutdown_executor()
+
+    def _put_input_data(self, input_data_id: str, input_data_name: str, path: str) -> str:
+        def put() -> Any:
+            body = {"input_data_name": input_data_name, "input_data_path": path}
+            if self._force:
+                last_updated_datetime = self._index.input_data_updated_datetime(input_data_id)
+                if last_updated_datetime is not None:
+                    body["last_updated_datetime"] = last_updated_datetime
+
+            input_data, _ = self._client.put_input_data(
+                self._project, input_data_id, query_params=None, request_body=body
+            )
+            return input_data
+
+        input_data = self._put_with_refresh(input_data_id, put)
+        if self._force:
+            self._index.update_input_data(input_data_id, input_data["updated_datetime"])
 
         logger.debug("uploaded input data: %s", input_data)
-        return data_id
+        return input_data_id
 
-    def upload_supplementary(
+    def _put_supplementary(
         self,
         input_data_id: str,
         supplementary_id: str,
-        file: Path,
+        path: str,
         supplementary_data_type: Literal["custom", "image", "text"],
-        *,
-        content_type: Optional[str] = None,
     ) -> str:
-        path = self.upload_tempdata(file, content_type=content_type)
-        body = {
-            "supplementary_data_name": supplementary_id,
-            "supplementary_data_path": path,
-            "supplementary_data_type": supplementary_data_type,
-            "supplementary_data_number": 0,
-        }
+        def put() -> Any:
+            body: Dict[str, Any] = {
+                "supplementary_data_name": supplementary_id,
+                "supplementary_data_path": path,
+                "supplementary_data_type": supplementary_data_type,
+                "supplementary_data_number": 0,
+            }
+            if self._force:
+                last_updated_datetime = self._index.supplementary_updated_datetime(input_data_id, supplementary_id)
+                if last_updated_datetime is not None:
+                    body["last_updated_datetime"] = last_updated_datetime
+
+            supplementary, _ = self._client.put_supplementary_data(self._project, input_data_id, supplementary_id, body)
+            return supplementary
+
+        supplementary = self._put_with_refresh(input_data_id, put)
         if self._force:
-            supplementary_list, _ = self._client.get_supplementary_data_list(self._project, input_data_id)
-            old_supplementary = more_itertools.first_true(
-                supplementary_list, pred=lambda e: e["supplementary_data_id"] == supplementary_id
-            )
-            if old_supplementary is not None:
-                body["last_updated_datetime"] = old_supplementary["updated_datetime"]
+            self._index.update_supplementary(input_data_id, supplementary_id, supplementary["updated_datetime"])
 
-        supplementary, _ = self._client.put_supplementary_data(self._project, input_data_id, supplementary_id, body)
         logger.debug("uploaded supplementary data: %s", supplementary)
         return supplementary_id
 
+    def _put_with_refresh(self, input_data_id: str, put: Callable[[], Any]) -> Any:
+        """
+        forceモードで更新が競合した場合（HTTP 409）は、索引の対象入力データを取得し直して、1度だけ再実行します。
+        """
+        try:
+            return put()
+        except requests.HTTPError as e:
+            if not self._force or e.response is None or e.response.status_code != requests.codes.conflict:
+                raise
+
+        logger.info("入力データ(=%s)の更新が競合したため、登録済みのデータを取得し直して再実行します", input_data_id)
+        self._index.refresh_input_data(input_data_id)
+        return put()
+
+    def _is_uploaded(self, kind: JournalKind, key: str, digest: Optional[str]) -> bool:
+        if self._journal.is_done(kind, key):
+            logger.debug("登録済みのためスキップします: %s", key)
+            return True
+        if self._cache.contains(kind, key, digest):
+            logger.debug("内容が変更されていないためスキップします: %s", key)
+            return True
+        return False
+
+    def _record_uploaded(self, kind: JournalKind, key: str, digest: Optional[str]) -> None:
+        self._journal.record(kind, key)
+        self._cache.put(kind, key, digest)
+
+    def upload_input_data(self, input_data_id: str, file: Path, *, content_type: Optional[str] = None) -> str:
+        digest = self._cache.digest(file)
+        if self._is_uploaded("input_data", input_data_id, digest):
+            return input_data_id
+
+        path = self.upload_tempdata(file, content_type=content_type)
+        result = self._put_input_data(input_data_id, file.name, path)
+        self._record_uploaded("input_data", input_data_id, digest)
+        return result
+
+    async def upload_input_data_async(
+        self,
+        input_data_id: str,
+        file: Path,
+        *,
+        content_type: Optional[str] = None,
+        limiter: Optional[AdaptiveLimiter] = None,
+    ) -> str:
+        """
+        `upload_input_data` の非同期版です。
+        ファイルのアップロードは `upload_tempdata_async` で行い、AnnofabのAPI呼び出しはデフォルトのThreadPoolExecutorで実行します。
+        `limiter`を指定した場合は、ファイルのアップロードとAPI呼び出しを、それぞれ1件のリクエストとして並行数を制限します。
+        """  # noqa: E501
+        digest = await self._cache.digest_async(file)
+        if self._is_uploaded("input_data", input_data_id, digest):
+            return input_data_id
+
+        path = await _run_limited(
+            limiter, lambda: self.upload_tempdata_async(file, content_type=content_type), "tempdata"
+        )
+        loop = asyncio.get_running_loop()
+        result = await _run_limited(
+            limiter,
+            lambda: loop.run_in_executor(None, self._put_input_data, input_data_id, file.name, path),
+            "input_data",
+        )
+        self._record_uploaded("input_data", input_data_id, digest)
+        return result
+
+    def upload_supplementary(
+        self,
+        input_data_id: str,
+        supplementary_id: str,
+        source: UploadSource,
+        supplementary_data_type: Literal["custom", "image", "text"],
+        *,
+        content_type: Optional[str] = None,
+    ) -> str:
+        key = f"{input_data_id}/{supplementary_id}"
+        digest = self._cache.digest(source)
+        if self._is_uploaded("supplementary", key, digest):
+            return supplementary_id
+
+        path = self.upload_tempdata(source, content_type=content_type, name=supplementary_id)
+        result = self._put_supplementary(input_data_id, supplementary_id, path, supplementary_data_type)
+        self._record_uploaded("supplementary", key, digest)
+        return result
+
+    async def upload_supplementary_async(
+        self,
+        input_data_id: str,
+        supplementary_id: str,
+        source: UploadSource,
+        supplementary_data_type: Literal["custom", "image", "text"],
+        *,
+        content_type: Optional[str] = None,
+        limiter: Optional[AdaptiveLimiter] = None,
+    ) -> str:
+        """
+        `upload_supplementary` の非同期版です。
+        ファイルのアップロードは `upload_tempdata_async` で行い、AnnofabのAPI呼び出しはデフォルトのThreadPoolExecutorで実行します。
+        `limiter`を指定した場合は、ファイルのアップロードとAPI呼び出しを、それぞれ1件のリクエストとして並行数を制限します。
+        """  # noqa: E501
+        key = f"{input_data_id}/{supplementary_id}"
+        digest = await self._cache.digest_async(source)
+        if self._is_uploaded("supplementary", key, digest):
+            return supplementary_id
+
+        path = await _run_limited(
+            limiter,
+            lambda: self.upload_tempdata_async(source, content_type=content_type, name=supplementary_id),
+            "tempdata",
+        )
+        loop = asyncio.get_running_loop()
+        result = await _run_limited(
+            limiter,
+            lambda: loop.run_in_executor(
+                None, self._put_supplementary, input_data_id, supplementary_id, path, supplementary_data_type
+            ),
+            "supplementary",
+        )
+        self._record_uploaded("supplementary", key, digest)
+        return result
+
 
 class AnnofabStorageUploader(Uploader):
-    def upload_tempdata(self, upload_file: Path, *, content_type: Optional[str] = None) -> str:
+    """
+    Annofabストレージ（AWS S3）にファイルをアップロードした上で、Annofabに入力データや補助情報を登録するクラス。
+
+    非同期版のメソッドでは、ファイルのアップロードをaiohttpで行います。
+    keep-aliveされたコネクションをプールして使い回すため、スレッド数に縛られずに多数のアップロードを同時に実行できます。
+
+    Args:
+        client:
+        project: プロジェクトID
+        force: 入力データと補助データを上書きしてアップロードするかどうか。
+        max_connections: 非同期アップロードで同時に利用するコネクションの最大数
+        temp_path_pool_size: 非同期アップロードのために、事前に取得してプールしておく一時データ保存先の最大数
+        journal: 登録済みの入力データと補助情報を記録するジャーナル
+        cache: 登録済みのファイルの内容を記録するキャッシュ
+    """
+
+    _session: Optional[aiohttp.ClientSession]
+
+    def __init__(
+        self,
+        client: AnnofabApi,
+        project: str,
+        force: bool = False,
+        max_connections: int = 100,
+        temp_path_pool_size: int = 32,
+        journal: Optional[UploadJournal] = None,
+        cache: Optional[UploadCache] = None,
+    ):
+        super().__init__(client=client, project=project, force=force, journal=journal, cache=cache)
+        self._max_connections = max_connections
+        self._session = None
+        self._temp_path_pool = TempPathPool(self._create_temp_path, size=temp_path_pool_size)
+
+    def _create_temp_path(self) -> DataPath:
+        data_path_dict, _ = self._client.create_temp_path(self._project)
+        return DataPath(data_path_dict["url"], data_path_dict["path"])
+
+    def allocate_temp_path(self) -> DataPath:
+        """
+        一時データ保存先を取得します。
+        同期版のアップロードでは`close_async`が呼ばれるとは限らないため、プールは利用しません（補充のスレッドを起動しません）。
+        """
+        return self._create_temp_path()
+
+    async def allocate_temp_path_async(self) -> DataPath:
+        """
+        `allocate_temp_path` の非同期版です。
+        一時データ保存先は、事前に取得しておいたプールから取り出します。 プールの補充は`close_async`で停止します。
+        プールが空の場合のみ、デフォルトのThreadPoolExecutorで一時データ保存先を取得します。
         """
-        ファイルをAnnofabストレージ（AWS S3）にアップロードします。
+        data_path = self._temp_path_pool.get_nowait()
+        if data_path is not None:
+            return data_path
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._create_temp_path)
+
+    def upload_tempdata(
+        self, source: UploadSource, *, content_type: Optional[str] = None, name: Optional[str] = None
+    ) -> str:
+        """
+        データをAnnofabストレージ（AWS S3）にアップロードします。
 
         Args:
-            upload_file: アップロードするファイル
-            content_type: アップロードするファイルのContent-Type。Noneの場合はファイル名から推測します。
+            source: アップロードするファイルのパス、またはメモリ上のデータ
+            content_type: アップロードするデータのContent-Type。Noneの場合はファイル名から推測します。
+            name: 利用しません
 
         Returns:
             アップロードしたファイルのS3 URI
         """
-        client = self._client
-
-        data_path_dict, _ = client.create_temp_path(self._project)
-
-        data_path = DataPath(data_path_dict["url"], data_path_dict["path"])
+        data_path = self.allocate_temp_path()
         # XXX エラー処理とか例外処理とか何もないので注意
-        with upload_file.open(mode="rb") as data:
+        with _open_source(source) as data:
             if content_type is None:
-                content_type = _get_content_type(upload_file)
+                content_type = _get_content_type(source)
             requests.put(data_path.url, data, headers={"Content-Type": content_type}, timeout=30)
 
         return data_path.path
 
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self._max_connections)
+            timeout = aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=30)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        return self._session
+
+    async def upload_tempdata_async(
+        self, source: UploadSource, *, content_type: Optional[str] = None, name: Optional[str] = None
+    ) -> str:
+        """
+        データをAnnofabストレージ（AWS S3）に非同期でアップロードします。
+
+        Args:
+            source: アップロードするファイルのパス、またはメモリ上のデータ
+            content_type: アップロードするデータのContent-Type。Noneの場合はファイル名から推測します。
+            name: 利用しません
+
+        Returns:
+            アップロードしたファイルのS3 URI
+        """
+        data_path = await self.allocate_temp_path_async()
+        if content_type is None:
+            content_type = _get_content_type(source)
+
+        session = self._get_session()
+        with _open_source(source) as data:
+            async with session.put(data_path.url, data=data, headers={"Content-Type": content_type}) as response:
+                response.raise_for_status()
+
+        return data_path.path
+
+    async def close_async(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._temp_path_pool.close)
+        await super().close_async()
+
 
 class S3Uploader(Uploader):
     """
     AWS S3にファイルをアップロードした上で、Annofabに入力データや補助情報を登録するクラス。
-    """
 
-    def __init__(self, client: AnnofabApi, project: str, s3_path: str, force: bool = False):
+    S3クライアントとそのコネクションプールは、すべてのワーカースレッドで共有します。
+    大きなファイルは、マルチパートアップロードで分割して並列にアップロードします。
+
+    Args:
+        client:
+        project: プロジェクトID
+        s3_path: アップロード先のS3パス（ex: "{bucket}/{key}"）
+        force: 入力データと補助データを上書きしてアップロードするかどうか。
+        journal: 登録済みの入力データと補助情報を記録するジャーナル
+        cache: 登録済みのファイルの内容を記録するキャッシュ
+        multipart_chunksize: マルチパートアップロードの1パートのサイズ[byte]。 これより大きいファイルはマルチパートアップロードを行う
+        max_concurrency: 1ファイルのマルチパートアップロードで、同時にアップロードするパートの最大数
+        max_pool_connections: S3クライアントのコネクションプールの大きさ
+    """  # noqa: E501
+
+    _existing_keys: Optional[Set[str]]
+    _uploaded_contents: Dict[str, str]
+
+    def __init__(
+        self,
+        client: AnnofabApi,
+        project: str,
+        s3_path: str,
+        force: bool = False,
+        journal: Optional[UploadJournal] = None,
+        cache: Optional[UploadCache] = None,
+        multipart_chunksize: int = 16 * 1024 * 1024,
+        max_concurrency: int = 10,
+        max_pool_connections: int = 50,
+    ):
         tmp = s3_path.split("/")
         self._s3_bucket = tmp[0]
         s3_prefix_key = s3_path[len(self._s3_bucket + "/") :]
         if not s3_prefix_key.endswith("/"):
             s3_prefix_key += "/"
         self._s3_prefix_key = s3_prefix_key
-        self._s3_client = boto3.client("s3")
-        super().__init__(client=client, project=project, force=force)
+        # boto3のclientはスレッドセーフなので、1つのclient（とそのコネクションプール）をすべてのスレッドで共有する
+        self._s3_client = boto3.client("s3", config=BotoConfig(max_pool_connections=max_pool_connections))
+        self._transfer_config = TransferConfig(
+            multipart_threshold=multipart_chunksize,
+            multipart_chunksize=multipart_chunksize,
+            max_concurrency=max_concurrency,
+        )
+        self._existing_keys = None
+        self._existing_keys_lock = threading.Lock()
+        # メモリ上のデータの内容のハッシュ値 -> アップロード済みのS3 URI
+        self._uploaded_contents = {}
+        super().__init__(client=client, project=project, force=force, journal=journal, cache=cache)
+
+    def prepare(self, input_data_ids: Iterable[str]) -> None:
+        super().prepare(input_data_ids)
+        if not self._force:
+            self._load_existing_keys()
+
+    def _load_existing_keys(self) -> Set[str]:
+        """
+        アップロード先のプレフィックス配下に存在するオブジェクトのキーを、`list_objects_v2`でまとめて取得します。
+        """
+        with self._existing_keys_lock:
+            if self._existing_keys is None:
+                paginator = self._s3_client.get_paginator("list_objects_v2")
+                self._existing_keys = {
+                    content["Key"]
+                    for page in paginator.paginate(Bucket=self._s3_bucket, Prefix=self._s3_prefix_key)
+                    for content in page.get("Contents", [])
+                }
+                logger.info(
+                    "AWS S3に存在するオブジェクトを%d件取得しました: s3://%s/%s",
+                    len(self._existing_keys),
+                    self._s3_bucket,
+                    self._s3_prefix_key,
+                )
+            return self._existing_keys
 
     def s3_key_exists(self, key: str) -> bool:
+        if key.startswith(self._s3_prefix_key):
+            existing_keys = self._load_existing_keys()
+            with self._existing_keys_lock:
+                return key in existing_keys
+
         try:
             self._s3_client.head_object(Bucket=self._s3_bucket, Key=key)
             return True
@@ -153,26 +627,62 @@ class S3Uploader(Uploader):
     def get_s3_uri(self, key: str) -> str:
         return f"s3://{self._s3_bucket}/{key}"
 
-    def upload_tempdata(self, upload_file: Path, *, content_type: Optional[str] = None) -> str:
+    def upload_tempdata(
+        self, source: UploadSource, *, content_type: Optional[str] = None, name: Optional[str] = None
+    ) -> str:
         """
-        ファイルをAWS S3にアップロードします。
+        データをAWS S3にアップロードします。
+
+        ファイルの場合は`{親ディレクトリ名}/{ファイル名}`、メモリ上のデータの場合は`{ランダムな文字列}/{name}`を、
+        アップロード先のキー（プレフィックス以降）とします。
+        メモリ上のデータは、同じ内容のデータをアップロード済みであれば、アップロードせずにそのS3 URIを返します。
 
         Args:
-            upload_file: アップロードするファイル
-            content_type: アップロードするファイルのContent-Type。Noneの場合はファイル名から推測します。
+            source: アップロードするファイルのパス、またはメモリ上のデータ
+            content_type: アップロードするデータのContent-Type。Noneの場合はファイル名から推測します。
+            name: メモリ上のデータの名前。 ファイルの場合は利用しません。
 
         Returns:
             アップロードしたファイルのS3 URI
         """
         client = self._s3_client
-        key = self._s3_prefix_key + f"{upload_file.parent.name}/{upload_file.name}"
+        content_digest: Optional[str] = None
+        if isinstance(source, Path):
+            key = self._s3_prefix_key + f"{source.parent.name}/{source.name}"
+        else:
+            content_digest = hashlib.blake2b(source, digest_size=16).hexdigest()
+            with self._existing_keys_lock:
+                uploaded_uri = self._uploaded_contents.get(content_digest)
+            if uploaded_uri is not None:
+                return uploaded_uri
+            key = self._s3_prefix_key + f"{uuid.uuid4().hex}/{name if name is not None else 'data'}"
 
         if self._force or not self.s3_key_exists(key):
             if content_type is None:
-                content_type = _get_content_type(upload_file)
-            client.upload_file(
-                Filename=str(upload_file), Bucket=self._s3_bucket, Key=key, ExtraArgs={"ContentType": content_type}
-            )
-            return self.get_s3_uri(key)
+                content_type = _get_content_type(source)
+            extra_args = {"ContentType": content_type}
+            if isinstance(source, Path):
+                client.upload_file(
+                    Filename=str(source),
+                    Bucket=self._s3_bucket,
+                    Key=key,
+                    ExtraArgs=extra_args,
+                    Config=self._transfer_config,
+                )
+            else:
+                client.upload_fileobj(
+                    io.BytesIO(source),
+                    Bucket=self._s3_bucket,
+                    Key=key,
+                    ExtraArgs=extra_args,
+                    Config=self._transfer_config,
+                )
+            uri = self.get_s3_uri(key)
+            with self._existing_keys_lock:
+                if self._existing_keys is not None:
+                    self._existing_keys.add(key)
+                if content_digest is not None:
+                    self._uploaded_contents[content_digest] = uri
+            return uri
         else:
             raise RuntimeError(f"AWS S3にオブジェクトがすでに存在します。Bucket='{self._s3_bucket}', Key='{key}'")
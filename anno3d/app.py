@@ -2,29 +2,49 @@ import asyncio
 import logging
 import os
 import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
 from pathlib import Path
 from typing import Any, List, Literal, Optional, Tuple, Type, TypeVar, cast
 
 import boto3
 import fire
+from annofabapi import AnnofabApi
 
 from anno3d import __version__
+from anno3d.all_data_writer import OutputLayout, ShardedAllDataWriter, ShardingKind
 from anno3d.annofab.client import ClientLoader, IdPass, Pat
 from anno3d.annofab.client import Credential as AnnofabCredential
+from anno3d.annofab.concurrency import AdaptiveLimiter
 from anno3d.annofab.constant import segment_type_instance, segment_type_semantic
 from anno3d.annofab.model import DirectionAppearance, ImageSelection
 from anno3d.annofab.project import Label, ProjectApi
+from anno3d.annofab.retry import RetrySettings, retry_async
 from anno3d.annofab.uploader import AnnofabStorageUploader, S3Uploader
+from anno3d.calib_cache import CalibCacheStatsCollector, calib_cache
 from anno3d.file_paths_loader import FilePathsLoader, ScenePathsLoader
+from anno3d.kitti.accumulate import accumulate_scene, read_poses
 from anno3d.kitti.camera_horizontal_fov_provider import CameraHorizontalFovKind
+from anno3d.kitti.crop import AreaCropSettings
+from anno3d.kitti.downsample import VoxelDownsampleSettings
 from anno3d.kitti.scene_uploader import SceneUploader, SceneUploaderInput, UploadKind
 from anno3d.model.annotation_area import RectAnnotationArea, SphereAnnotationArea, WholeAnnotationArea
 from anno3d.model.file_paths import FilePaths
 from anno3d.model.frame import PcdFormat
-from anno3d.model.input_files import InputData
 from anno3d.model.scene import Defaults, Scene
-from anno3d.simple_data_uploader import SupplementaryData, create_kitti_files, upload_async
+from anno3d.scene_validator import validate_scene
+from anno3d.simple_data_uploader import (
+    SupplementaryData,
+    create_input_data_id,
+    create_kitti_files,
+    create_prepare_executor,
+    downsample_all,
+    upload_async,
+)
+from anno3d.upload_cache import UploadCache
+from anno3d.upload_journal import UploadJournal
+from anno3d.util.file_link import LinkMode
 
 E = TypeVar("E", bound=Enum)
 
@@ -132,6 +152,63 @@ def validate_aws_credential() -> bool:
     return result
 
 
+def _pcd_cache_dir(pcd_cache_dir: Optional[str]) -> Path:
+    if pcd_cache_dir is not None:
+        return Path(str(pcd_cache_dir))
+    return Path(tempfile.gettempdir()) / "anno3d_pcd_cache"
+
+
+def _create_downsample_settings(
+    voxel_size: Optional[float], pcd_cache_dir: Optional[str]
+) -> Optional[VoxelDownsampleSettings]:
+    if voxel_size is None:
+        return None
+    if voxel_size <= 0:
+        raise ValueError(f"voxel_sizeは正の値である必要がありますが、{voxel_size}が指定されています")
+
+    cache_dir = _pcd_cache_dir(pcd_cache_dir)
+    logger.info("点群をボクセルサイズ %s でダウンサンプリングします。 出力先: %s", voxel_size, cache_dir)
+    return VoxelDownsampleSettings(float(voxel_size), cache_dir)
+
+
+def _create_output_layout(sharding: str, shard_hash_length: int, shard_bucket_size: int) -> OutputLayout:
+    return OutputLayout(_decode_enum(ShardingKind, sharding), shard_hash_length, shard_bucket_size)
+
+
+def _load_crop_settings(
+    api: AnnofabApi, project_id: str, crop_margin: Optional[float], pcd_cache_dir: Optional[str]
+) -> Optional[AreaCropSettings]:
+    """
+    プロジェクトのアノテーション範囲を取得して、点群の切り抜きの設定を作成します。
+    """
+    if crop_margin is None:
+        return None
+    if crop_margin < 0:
+        raise ValueError(f"crop_marginは0以上である必要がありますが、{crop_margin}が指定されています")
+
+    area = ProjectApi(api).get_annotation_area(project_id)
+    if isinstance(area, WholeAnnotationArea):
+        logger.info("プロジェクトのアノテーション範囲が全体のため、点群の切り抜きは行いません。")
+        return None
+
+    cache_dir = _pcd_cache_dir(pcd_cache_dir)
+    logger.info(
+        "点群をアノテーション範囲(%s)から %s 以内の点に切り抜きます。 出力先: %s",
+        area.to_json(ensure_ascii=False),
+        crop_margin,
+        cache_dir,
+    )
+    return AreaCropSettings(area, float(crop_margin), cache_dir)
+
+
+def _load_scene(scene_path: Path) -> Scene:
+    file = scene_path
+    if scene_path.is_dir():
+        file = scene_path / Defaults.scene_meta_file
+
+    return Scene.decode_path(file) if file.is_file() else Scene.default_scene(scene_path)
+
+
 def validate_task_id_prefix(task_id_prefix: str, upload_kind: UploadKind) -> bool:
     if upload_kind in [UploadKind.CREATE_TASK, UploadKind.CREATE_ANNOTATION]:
         if task_id_prefix == "":
@@ -618,7 +695,13 @@ class ProjectCommand:
         input_data_id_prefix: str = "",
         sensor_height: Optional[float] = None,
         parallelism: Optional[int] = None,
+        prepare_workers: Optional[int] = None,
         force: bool = False,
+        journal_dir: Optional[str] = None,
+        cache_dir: Optional[str] = None,
+        voxel_size: Optional[float] = None,
+        pcd_cache_dir: Optional[str] = None,
+        crop_margin: Optional[float] = None,
         annofab_id: Optional[str] = None,
         annofab_pass: Optional[str] = None,
         annofab_pat: Optional[str] = None,
@@ -639,8 +722,14 @@ class ProjectCommand:
             input_data_id_prefix: input_data_idの先頭に付与する文字列
             sensor_height: 点群のセンサ(velodyne)の設置高。単位は点群の単位系（=kittiであれば[m]）
                            3dpc-editorは、この値を元に地面の高さを仮定する。 指定が無い場合はkittiのvelodyneの設置高を採用する
-            parallelism: 非同期実行の最大数。 指定しない場合上限を設定しない。実行環境におけるデフォルトのThreadPoolExecutorの最大スレッド数を超える値を与えても意味がない。
+            parallelism: 非同期実行の最大数。 APIの応答（エラーやレイテンシ）に応じて、この値を上限に並行数を調整する。 指定しない場合上限を設定しない。ファイルのアップロードは非同期に行うが、AnnofabのAPI呼び出しはデフォルトのThreadPoolExecutorで実行するため、その最大スレッド数を大きく超える値を与えても効果は薄い。
+            prepare_workers: 補助情報の作成（キャリブレーションデータの読み込みやJSONへの変換）を行うプロセス数。 省略した場合はCPU数。
             force: 入力データと補助データを上書きしてアップロードするかどうか。
+            journal_dir: 完了した処理を記録するジャーナルファイルの配置ディレクトリ。 指定した場合、中断後に同じ引数で再実行すると完了済みの処理をスキップする。
+            cache_dir: 登録済みのファイルの内容のハッシュ値を記録するキャッシュの配置ディレクトリ。 指定した場合、前回の登録時から内容が変更されていないファイルはアップロードしない。
+            voxel_size: 点群をボクセルグリッドでダウンサンプリングする場合の、ボクセルの1辺の長さ。 単位は点群の単位系（=kittiであれば[m]）。 省略した場合はダウンサンプリングしない。
+            pcd_cache_dir: ダウンサンプリングや切り抜きを行った点群ファイルの出力先ディレクトリ。 同じ点群を同じ設定で処理する場合は、出力済みのファイルを再利用する。 省略した場合は一時ディレクトリ配下の"anno3d_pcd_cache"。
+            crop_margin: 指定した場合、プロジェクトのアノテーション範囲からこの幅より外側にある点を取り除いてアップロードする。 単位は点群の単位系（=kittiであれば[m]）。 アノテーション範囲が全体の場合は何もしない。
         Returns:
 
         """  # noqa: E501
@@ -659,7 +748,13 @@ class ProjectCommand:
                 input_data_id_prefix,
                 sensor_height,
                 parallelism,
+                prepare_workers,
                 force,
+                Path(str(journal_dir)) if journal_dir is not None else None,
+                Path(str(cache_dir)) if cache_dir is not None else None,
+                _create_downsample_settings(voxel_size, pcd_cache_dir),
+                crop_margin,
+                pcd_cache_dir,
                 annofab_credential,
             )
         )
@@ -674,16 +769,27 @@ class ProjectCommand:
         input_data_id_prefix: str,
         sensor_height: Optional[float],
         parallelism: Optional[int],
+        prepare_workers: Optional[int],
         force: bool,
+        journal_dir: Optional[Path],
+        cache_dir: Optional[Path],
+        downsample: Optional[VoxelDownsampleSettings],
+        crop_margin: Optional[float],
+        pcd_cache_dir: Optional[str],
         annofab_credential: AnnofabCredential,
     ) -> None:
         project = project_id
 
         kitti_dir_path = Path(str(kitti_dir))
         loader = FilePathsLoader(kitti_dir_path, kitti_dir_path, kitti_dir_path)
-        pathss = loader.load(None)[skip : (skip + size)]
+        pathss = list(loader.iter_paths(None, skip, size))
         client_loader = ClientLoader(annofab_credential, annofab_endpoint)
+        # API呼び出しの応答に応じて、parallelismを上限として並行数を調整する
+        limiter_opt = AdaptiveLimiter(parallelism) if parallelism is not None else None
+        # 並行数の制限はリクエスト1件ごとに行うため、同時にアップロードするフレームの数はセマフォで制限する
         sem_opt = asyncio.Semaphore(parallelism) if parallelism is not None else None
+        prepare_executor = create_prepare_executor(prepare_workers)
+        calib_stats = CalibCacheStatsCollector()
 
         async def run_without_sem(
             paths: FilePaths,
@@ -697,33 +803,55 @@ class ProjectCommand:
                 fallback_horizontal_fov=None,
                 sensor_height=sensor_height,
                 pcd_format=PcdFormat("xyzi"),
+                prepare_executor=prepare_executor,
+                downsample=downsample,
+                crop=crop,
+                limiter=limiter_opt,
+                calib_stats=calib_stats,
             )
 
-        async def run_with_sem(paths: FilePaths, sem: asyncio.Semaphore) -> Tuple[str, List[SupplementaryData]]:
-            async with sem:
-                return await run_without_sem(paths)
+        async def run_with_retry(paths: FilePaths) -> Tuple[str, List[SupplementaryData]]:
+            return await retry_async(
+                lambda: run_without_sem(paths), RetrySettings(), f"入力データのアップロード({paths.key.id})"
+            )
 
         async def run(paths: FilePaths) -> Tuple[str, List[SupplementaryData]]:
             if sem_opt is None:
-                return await run_without_sem(paths)
-            else:
-                return await run_with_sem(paths, sem_opt)
+                return await run_with_retry(paths)
+            async with sem_opt:
+                return await run_with_retry(paths)
 
         with client_loader.open_api() as api:
-            uploader = AnnofabStorageUploader(api, project, force=force)
-
-            # fmt: off
-            tasks = [
-                run(paths)
-                for paths in pathss
-            ]
-            uploaded: List[Tuple[str, int]] = [
-                (input_id, len(supps))
-                for input_id, supps in await asyncio.gather(*tasks)
-            ]
-            # fmt: on
+            crop = _load_crop_settings(api, project, crop_margin, pcd_cache_dir)
+            journal = UploadJournal.open(journal_dir, kitti_dir_path, project)
+            cache = UploadCache.open(cache_dir, project)
+            uploader = AnnofabStorageUploader(api, project, force=force, journal=journal, cache=cache)
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(
+                None, uploader.prepare, [create_input_data_id(input_data_id_prefix, paths) for paths in pathss]
+            )
+
+            try:
+                # fmt: off
+                tasks = [
+                    run(paths)
+                    for paths in pathss
+                ]
+                uploaded: List[Tuple[str, int]] = [
+                    (input_id, len(supps))
+                    for input_id, supps in await asyncio.gather(*tasks)
+                ]
+                # fmt: on
+            finally:
+                await uploader.close_async()
+                prepare_executor.shutdown(cancel_futures=True)
+                journal.close()
+                cache.close()
 
             logger.info("%d 件のinput dataをuploadしました", len(uploaded))
+            if limiter_opt is not None:
+                logger.info("API呼び出しの状況: %s", limiter_opt.stats().describe())
+            logger.info("%s", calib_stats.total().describe())
             for input_id, supp_count in uploaded:
                 logger.info("id: %s, 補助データ件数: %d", input_id, supp_count)
 
@@ -738,7 +866,15 @@ class ProjectCommand:
         frame_per_task: Optional[int] = None,
         upload_kind: str = UploadKind.CREATE_ANNOTATION.value,
         parallelism: Optional[int] = None,
+        prepare_workers: Optional[int] = None,
+        annotation_parallelism: Optional[int] = None,
         force: bool = False,
+        journal_dir: Optional[str] = None,
+        cache_dir: Optional[str] = None,
+        voxel_size: Optional[float] = None,
+        pcd_cache_dir: Optional[str] = None,
+        crop_margin: Optional[float] = None,
+        validate: bool = False,
         annofab_id: Optional[str] = None,
         annofab_pass: Optional[str] = None,
         annofab_pat: Optional[str] = None,
@@ -767,8 +903,16 @@ class ProjectCommand:
                          data => 入力データと補助データの登録のみを行う //
                          task => 上記に加えて、タスクの生成を行う //
                          annotation => 上記に加えて、アノテーションの登録を行う
-            parallelism: 非同期実行の最大数。 指定しない場合上限を設定しない。実行環境におけるデフォルトのThreadPoolExecutorの最大スレッド数を超える値を与えても意味がない。
+            parallelism: アップロード・アノテーション登録の各処理のワーカー数。 省略した場合は32。 同時に実行するAPI呼び出しの数は、APIの応答（エラーやレイテンシ）に応じてこの値を上限に調整する。ファイルのアップロードは非同期に行うが、AnnofabのAPI呼び出しはデフォルトのThreadPoolExecutorで実行するため、その最大スレッド数を大きく超える値を与えても効果は薄い。
+            prepare_workers: 補助情報の作成（キャリブレーションデータの読み込みやJSONへの変換）を行うプロセス数。 省略した場合はCPU数。
+            annotation_parallelism: アノテーションを並行に登録するフレーム数の上限。 タスクを跨いでフレーム単位で並行に登録する。 省略した場合はparallelismと同じ。
             force: 入力データと補助データを上書きしてアップロードするかどうか。
+            journal_dir: 完了した処理を記録するジャーナルファイルの配置ディレクトリ。 指定した場合、中断後に同じ引数で再実行すると完了済みの処理をスキップする。
+            cache_dir: 登録済みのファイルの内容のハッシュ値を記録するキャッシュの配置ディレクトリ。 指定した場合、前回の登録時から内容が変更されていないファイルはアップロードしない。
+            voxel_size: 点群をボクセルグリッドでダウンサンプリングする場合の、ボクセルの1辺の長さ。 単位は点群の単位系（=kittiであれば[m]）。 省略した場合はダウンサンプリングしない。
+            pcd_cache_dir: ダウンサンプリングや切り抜きを行った点群ファイルの出力先ディレクトリ。 同じ点群を同じ設定で処理する場合は、出力済みのファイルを再利用する。 省略した場合は一時ディレクトリ配下の"anno3d_pcd_cache"。
+            crop_margin: 指定した場合、プロジェクトのアノテーション範囲からこの幅より外側にある点を取り除いてアップロードする。 単位は点群の単位系（=kittiであれば[m]）。 アノテーション範囲が全体の場合は何もしない。
+            validate: アップロードを始める前に、シーンが参照する全ファイル（点群・画像・ラベル・キャリブレーション）の存在と点群ファイルのサイズを検証する。 問題があればアップロードせずにエラーとする。
 
         Returns:
 
@@ -783,11 +927,18 @@ class ProjectCommand:
             return
 
         client_loader = ClientLoader(annofab_credential, annofab_endpoint)
+        journal = UploadJournal.open(
+            Path(str(journal_dir)) if journal_dir is not None else None, Path(str(scene_path)), project_id
+        )
+        cache = UploadCache.open(Path(str(cache_dir)) if cache_dir is not None else None, project_id)
         with client_loader.open_api() as api:
             scene_uploader = SceneUploader(
                 api,
-                AnnofabStorageUploader(api, project=project_id, force=force),
+                AnnofabStorageUploader(api, project=project_id, force=force, journal=journal, cache=cache),
                 parallelism,
+                journal=journal,
+                prepare_workers=prepare_workers,
+                annotation_parallelism=annotation_parallelism,
             )
             uploader_input = SceneUploaderInput(
                 project_id=project_id,
@@ -797,8 +948,15 @@ class ProjectCommand:
                 sensor_height=sensor_height,
                 task_id_prefix=task_id_prefix,
                 kind=enum_upload_kind,
+                downsample=_create_downsample_settings(voxel_size, pcd_cache_dir),
+                crop=_load_crop_settings(api, project_id, crop_margin, pcd_cache_dir),
+                validate=validate,
             )
-            scene_uploader.upload_from_path(Path(str(scene_path)), uploader_input)
+            try:
+                scene_uploader.upload_from_path(Path(str(scene_path)), uploader_input)
+            finally:
+                journal.close()
+                cache.close()
 
     @staticmethod
     def upload_scene_to_s3(
@@ -812,7 +970,17 @@ class ProjectCommand:
         frame_per_task: Optional[int] = None,
         upload_kind: str = UploadKind.CREATE_ANNOTATION.value,
         parallelism: Optional[int] = None,
+        prepare_workers: Optional[int] = None,
+        annotation_parallelism: Optional[int] = None,
         force: bool = False,
+        journal_dir: Optional[str] = None,
+        cache_dir: Optional[str] = None,
+        voxel_size: Optional[float] = None,
+        pcd_cache_dir: Optional[str] = None,
+        crop_margin: Optional[float] = None,
+        validate: bool = False,
+        s3_multipart_chunksize: int = 16,
+        s3_max_concurrency: int = 10,
         annofab_id: Optional[str] = None,
         annofab_pass: Optional[str] = None,
         annofab_pat: Optional[str] = None,
@@ -837,8 +1005,18 @@ class ProjectCommand:
                          data => 入力データと補助データの登録のみを行う //
                          task => 上記に加えて、タスクの生成を行う //
                          annotation => 上記に加えて、アノテーションの登録を行う
-            parallelism: 非同期実行の最大数。 指定しない場合上限を設定しない。実行環境におけるデフォルトのThreadPoolExecutorの最大スレッド数を超える値を与えても意味がない。
+            parallelism: アップロード・アノテーション登録の各処理のワーカー数。 省略した場合は32。 同時に実行するAPI呼び出しの数は、APIの応答（エラーやレイテンシ）に応じてこの値を上限に調整する。実行環境におけるデフォルトのThreadPoolExecutorの最大スレッド数を超える値を与えても意味がない。
+            prepare_workers: 補助情報の作成（キャリブレーションデータの読み込みやJSONへの変換）を行うプロセス数。 省略した場合はCPU数。
+            annotation_parallelism: アノテーションを並行に登録するフレーム数の上限。 タスクを跨いでフレーム単位で並行に登録する。 省略した場合はparallelismと同じ。
             force: 入力データと補助データを上書きしてアップロードするかどうか。
+            journal_dir: 完了した処理を記録するジャーナルファイルの配置ディレクトリ。 指定した場合、中断後に同じ引数で再実行すると完了済みの処理をスキップする。
+            cache_dir: 登録済みのファイルの内容のハッシュ値を記録するキャッシュの配置ディレクトリ。 指定した場合、前回の登録時から内容が変更されていないファイルはアップロードしない。
+            voxel_size: 点群をボクセルグリッドでダウンサンプリングする場合の、ボクセルの1辺の長さ。 単位は点群の単位系（=kittiであれば[m]）。 省略した場合はダウンサンプリングしない。
+            pcd_cache_dir: ダウンサンプリングや切り抜きを行った点群ファイルの出力先ディレクトリ。 同じ点群を同じ設定で処理する場合は、出力済みのファイルを再利用する。 省略した場合は一時ディレクトリ配下の"anno3d_pcd_cache"。
+            crop_margin: 指定した場合、プロジェクトのアノテーション範囲からこの幅より外側にある点を取り除いてアップロードする。 単位は点群の単位系（=kittiであれば[m]）。 アノテーション範囲が全体の場合は何もしない。
+            validate: アップロードを始める前に、シーンが参照する全ファイル（点群・画像・ラベル・キャリブレーション）の存在と点群ファイルのサイズを検証する。 問題があればアップロードせずにエラーとする。
+            s3_multipart_chunksize: マルチパートアップロードの1パートのサイズ[MiB]。 これより大きいファイルは分割して並列にアップロードする。 省略した場合は16
+            s3_max_concurrency: 1ファイルのマルチパートアップロードで同時にアップロードするパートの最大数。 省略した場合は10
             annofab_id: AnnofabのユーザID。指定が無い場合は環境変数`ANNOFAB_USER_ID`の値を採用する
             annofab_pass: Annofabのパスワード。指定が無い場合は環境変数`ANNOFAB_PASSWORD`の値を採用する
             annofab_pat: Annofabのパーソナルアクセストークン。指定が無い場合は環境変数`ANNOFAB_PAT`の値を採用する
@@ -858,11 +1036,29 @@ class ProjectCommand:
             return
 
         client_loader = ClientLoader(annofab_credential, annofab_endpoint)
+        journal = UploadJournal.open(
+            Path(str(journal_dir)) if journal_dir is not None else None, Path(str(scene_path)), project_id
+        )
+        cache = UploadCache.open(Path(str(cache_dir)) if cache_dir is not None else None, project_id)
         with client_loader.open_api() as api:
             uploader = SceneUploader(
                 api,
-                S3Uploader(api, project=project_id, force=force, s3_path=s3_path),
+                S3Uploader(
+                    api,
+                    project=project_id,
+                    force=force,
+                    s3_path=s3_path,
+                    journal=journal,
+                    cache=cache,
+                    multipart_chunksize=s3_multipart_chunksize * 1024 * 1024,
+                    max_concurrency=s3_max_concurrency,
+                    # 並列に実行するアップロードそれぞれが、マルチパートアップロードで複数のコネクションを利用する
+                    max_pool_connections=max(50, s3_max_concurrency * (parallelism if parallelism is not None else 32)),
+                ),
                 parallelism,
+                journal=journal,
+                prepare_workers=prepare_workers,
+                annotation_parallelism=annotation_parallelism,
             )
             uploader_input = SceneUploaderInput(
                 project_id=project_id,
@@ -872,23 +1068,26 @@ class ProjectCommand:
                 sensor_height=sensor_height,
                 task_id_prefix=task_id_prefix,
                 kind=enum_upload_kind,
+                downsample=_create_downsample_settings(voxel_size, pcd_cache_dir),
+                crop=_load_crop_settings(api, project_id, crop_margin, pcd_cache_dir),
+                validate=validate,
             )
-            uploader.upload_from_path(Path(str(scene_path)), uploader_input)
+            try:
+                uploader.upload_from_path(Path(str(scene_path)), uploader_input)
+            finally:
+                journal.close()
+                cache.close()
 
 
 class LocalCommand:
     """ローカルファイルシステムに対する処理を行います"""
 
     @staticmethod
-    def _write_all_files_json(inputs: List[InputData], output_dir_path: Path):
-        all_files_json = output_dir_path / "_all_data.jsonl"
-        with all_files_json.open(mode="w", encoding="UTF-8") as writer:
-            for input_data in inputs:
-                writer.write(input_data.to_json(ensure_ascii=False, sort_keys=True))
-                writer.write("\n")
-
-        logger.info("%d 件のinput dataを、%sに出力しました", len(inputs), output_dir_path)
-        logger.info("メタデータ: %s", all_files_json.absolute())
+    def _log_all_data(writer: ShardedAllDataWriter, count: int, output_dir_path: Path) -> None:
+        logger.info("%d 件のinput dataを、%sに出力しました（合計 %d 件）", count, output_dir_path, len(writer))
+        logger.info("メタデータ: %s", writer.file.absolute())
+        # ローカルへの出力では、キャリブレーションはこのプロセスのスレッドで読み込む
+        logger.info("%s", calib_cache.stats().describe())
 
     @staticmethod
     def make_kitti_data(
@@ -898,39 +1097,87 @@ class LocalCommand:
         size: int = 10,
         input_data_id_prefix: str = "",
         sensor_height: Optional[float] = None,
+        voxel_size: Optional[float] = None,
+        pcd_cache_dir: Optional[str] = None,
+        parallelism: Optional[int] = None,
+        link: str = LinkMode.COPY.value,
+        sharding: str = ShardingKind.NONE.value,
+        shard_hash_length: int = 2,
+        shard_bucket_size: int = 1000,
     ) -> None:
         """
         kitti 3d detection形式のファイル群を3dpc-editorに登録可能なファイル群に変換します。
         annofabのプライベートストレージを利用する場合にこのコマンドを利用します。
         Args:
             kitti_dir: 登録データの配置ディレクトリへのパス。 このディレクトリに "velodyne" / "image_2" / "calib" の3ディレクトリが存在することを期待している
-            output_dir: 出力先ディレクトリ。
+            output_dir: 出力先ディレクトリ。 入力データの一覧は、フレームの出力が完了するごとに"_all_data.jsonl"に追記する。 中断後に再実行すると、"_all_data.jsonl"に記録済みの入力データはスキップし、出力途中のフレームは出力し直す。 それ以外のフレームのディレクトリが既に存在する場合はエラーとする。
             skip: 見つけたデータの先頭何件をスキップするか
             size: 最大何件のinput_dataを登録するか
             input_data_id_prefix: input_data_idの先頭に付与する文字列
             sensor_height: 点群のセンサ(velodyne)の設置高。単位は点群の単位系（=kittiであれば[m]）
                            3dpc-editorは、この値を元に地面の高さを仮定する。 指定が無い場合はkittiのvelodyneの設置高を採用する
+            voxel_size: 点群をボクセルグリッドでダウンサンプリングする場合の、ボクセルの1辺の長さ。 単位は点群の単位系（=kittiであれば[m]）。 省略した場合はダウンサンプリングしない。
+            pcd_cache_dir: ダウンサンプリングや切り抜きを行った点群ファイルの出力先ディレクトリ。 同じ点群を同じ設定で処理する場合は、出力済みのファイルを再利用する。 省略した場合は一時ディレクトリ配下の"anno3d_pcd_cache"。
+            parallelism: 並行に変換するフレーム数。 省略した場合はCPU数に応じて決める。
+            link: 点群と画像を出力先に配置する方法。 省略した場合"copy" //
+                  auto => hardlink, reflink, copy の順に試す //
+                  hardlink => ハードリンクを作成する。 出力先のファイルを変更すると元ファイルも変わる //
+                  symlink => 元ファイルへのシンボリックリンクを作成する //
+                  reflink => コピーオンライトでファイルの内容を共有する（btrfs, XFSなど） //
+                  copy => ファイルをコピーする //
+                  copy以外で配置できなかった場合（別のファイルシステムであるなど）は、コピーする
+            sharding: フレームのディレクトリの分け方。 フレーム数が多い場合に、1つのディレクトリに大量のディレクトリが作成されることを避けるために利用する。 省略した場合"none" //
+                      none => 出力先ディレクトリの直下にフレームのディレクトリを作成する //
+                      hash => フレームIDのハッシュ値の先頭shard_hash_length文字のディレクトリに分ける //
+                      bucket => フレームの順番でshard_bucket_size件ごとのディレクトリに分ける //
+                      none以外の場合、各シャードのディレクトリにも、そのシャードの入力データのみの"_all_data.jsonl"を出力する
+            shard_hash_length: shardingがhashの場合の、ディレクトリ名の文字数。 省略した場合は2（256ディレクトリ）
+            shard_bucket_size: shardingがbucketの場合の、1ディレクトリあたりのフレーム数。 省略した場合は1000
         Returns:
         """  # noqa: E501
         kitti_dir_path = Path(str(kitti_dir))
         output_dir_path = Path(str(output_dir))
         loader = FilePathsLoader(kitti_dir_path, kitti_dir_path, kitti_dir_path)
-        pathss = loader.load(None)[skip : (skip + size)]
-
-        inputs = [
-            create_kitti_files(
+        pathss = list(loader.iter_paths(None, skip, size))
+        link_mode = _decode_enum(LinkMode, link)
+        writer = ShardedAllDataWriter(
+            output_dir_path,
+            _create_output_layout(sharding, shard_hash_length, shard_bucket_size),
+        )
+        remaining = [
+            (index, paths)
+            for index, paths in enumerate(pathss, start=skip)
+            if not writer.is_written(create_input_data_id(input_data_id_prefix, paths))
+        ]
+        if len(remaining) < len(pathss):
+            logger.info("出力済みの %d 件のinput dataをスキップします", len(pathss) - len(remaining))
+        downsample = _create_downsample_settings(voxel_size, pcd_cache_dir)
+        if downsample is not None:
+            downsample_all([paths for _, paths in remaining], PcdFormat("xyzi"), downsample, None)
+
+        def make(index: int, paths: FilePaths) -> None:
+            parent_dir = writer.start_frame(paths.key.id, index)
+            input_data = create_kitti_files(
                 input_data_id_prefix,
-                output_dir_path,
+                parent_dir,
                 paths,
                 CameraHorizontalFovKind.CALIB,
                 None,
                 sensor_height,
                 PcdFormat("xyzi"),
+                downsample,
+                link_mode,
             )
-            for paths in pathss
-        ]
+            writer.write(input_data, paths.key.id, index)
 
-        LocalCommand._write_all_files_json(inputs, output_dir_path)
+        try:
+            with ThreadPoolExecutor(max_workers=parallelism) as executor:
+                for _ in executor.map(lambda item: make(*item), remaining):
+                    pass
+        finally:
+            writer.close()
+
+        LocalCommand._log_all_data(writer, len(remaining), output_dir_path)
 
     @staticmethod
     def make_scene(
@@ -939,44 +1186,151 @@ class LocalCommand:
         input_data_id_prefix: str = "",
         camera_horizontal_fov: Literal["calib", "settings"] = "settings",
         sensor_height: Optional[float] = None,
+        voxel_size: Optional[float] = None,
+        pcd_cache_dir: Optional[str] = None,
+        parallelism: Optional[int] = None,
+        link: str = LinkMode.COPY.value,
+        sharding: str = ShardingKind.NONE.value,
+        shard_hash_length: int = 2,
+        shard_bucket_size: int = 1000,
     ) -> None:
         """
         Annofab点群形式（KITTIベース）のファイル群を3dpc-editorに登録可能なファイル群に変換します。
         annofabのプライベートストレージを利用する場合にこのコマンドを利用します。
         Args:
             scene_path: scene.metaファイルのファイルパス or scene.metaファイルの存在するディレクトリパス or kitti形式ディレクトリ
-            output_dir: 出力先ディレクトリ。
+            output_dir: 出力先ディレクトリ。 入力データの一覧は、フレームの出力が完了するごとに"_all_data.jsonl"に追記する。 中断後に再実行すると、"_all_data.jsonl"に記録済みの入力データはスキップし、出力途中のフレームは出力し直す。 それ以外のフレームのディレクトリが既に存在する場合はエラーとする。
             input_data_id_prefix: input_data_idの先頭に付与する文字列
             camera_horizontal_fov: 補助画像カメラの視野角の取得方法の指定。 省略した場合"settings" //
                                    settings => 対象の画像にcamera_view_settingが存在していればその値を利用し、無ければ"calib"と同様 //
                                    calib => 対象の画像にキャリブレーションデータが存在すればそこから計算し、なければ90[degree]ととする
             sensor_height: 点群のセンサ(velodyne)の設置高。単位は点群の単位系（=kittiであれば[m]）
                            3dpc-editorは、この値を元に地面の高さを仮定する。 指定が無い場合はkittiのvelodyneの設置高を採用する
+            voxel_size: 点群をボクセルグリッドでダウンサンプリングする場合の、ボクセルの1辺の長さ。 単位は点群の単位系（=kittiであれば[m]）。 省略した場合はダウンサンプリングしない。
+            pcd_cache_dir: ダウンサンプリングや切り抜きを行った点群ファイルの出力先ディレクトリ。 同じ点群を同じ設定で処理する場合は、出力済みのファイルを再利用する。 省略した場合は一時ディレクトリ配下の"anno3d_pcd_cache"。
+            parallelism: 並行に変換するフレーム数。 省略した場合はCPU数に応じて決める。
+            link: 点群と画像を出力先に配置する方法。 省略した場合"copy" //
+                  auto => hardlink, reflink, copy の順に試す //
+                  hardlink => ハードリンクを作成する。 出力先のファイルを変更すると元ファイルも変わる //
+                  symlink => 元ファイルへのシンボリックリンクを作成する //
+                  reflink => コピーオンライトでファイルの内容を共有する（btrfs, XFSなど） //
+                  copy => ファイルをコピーする //
+                  copy以外で配置できなかった場合（別のファイルシステムであるなど）は、コピーする
+            sharding: フレームのディレクトリの分け方。 フレーム数が多い場合に、1つのディレクトリに大量のディレクトリが作成されることを避けるために利用する。 省略した場合"none" //
+                      none => 出力先ディレクトリの直下にフレームのディレクトリを作成する //
+                      hash => フレームIDのハッシュ値の先頭shard_hash_length文字のディレクトリに分ける //
+                      bucket => フレームの順番でshard_bucket_size件ごとのディレクトリに分ける //
+                      none以外の場合、各シャードのディレクトリにも、そのシャードの入力データのみの"_all_data.jsonl"を出力する
+            shard_hash_length: shardingがhashの場合の、ディレクトリ名の文字数。 省略した場合は2（256ディレクトリ）
+            shard_bucket_size: shardingがbucketの場合の、1ディレクトリあたりのフレーム数。 省略した場合は1000
         Returns:
         """  # noqa: E501
         output_dir_path = Path(str(output_dir))
 
-        scene_path_ = Path(str(scene_path))
-        file = scene_path_
-        if scene_path_.is_dir():
-            file = scene_path_ / Defaults.scene_meta_file
-
-        scene = Scene.decode_path(file) if file.is_file() else Scene.default_scene(scene_path_)
+        scene = _load_scene(Path(str(scene_path)))
         pathss = ScenePathsLoader(scene).load()
-        inputs = [
-            create_kitti_files(
+        pcd_format = PcdFormat(scene.velodyne.format)
+        link_mode = _decode_enum(LinkMode, link)
+        horizontal_fov_kind = _decode_enum(CameraHorizontalFovKind, camera_horizontal_fov)
+        writer = ShardedAllDataWriter(
+            output_dir_path,
+            _create_output_layout(sharding, shard_hash_length, shard_bucket_size),
+        )
+        remaining = [
+            (index, paths)
+            for index, paths in enumerate(pathss)
+            if not writer.is_written(create_input_data_id(input_data_id_prefix, paths))
+        ]
+        if len(remaining) < len(pathss):
+            logger.info("出力済みの %d 件のinput dataをスキップします", len(pathss) - len(remaining))
+        downsample = _create_downsample_settings(voxel_size, pcd_cache_dir)
+        if downsample is not None:
+            downsample_all([paths for _, paths in remaining], pcd_format, downsample, None)
+
+        def make(index: int, paths: FilePaths) -> None:
+            parent_dir = writer.start_frame(paths.key.id, index)
+            input_data = create_kitti_files(
                 input_data_id_prefix,
-                output_dir_path,
+                parent_dir,
                 paths,
-                camera_horizontal_fov=_decode_enum(CameraHorizontalFovKind, camera_horizontal_fov),
+                camera_horizontal_fov=horizontal_fov_kind,
                 fallback_horizontal_fov=None,
                 sensor_height=sensor_height,
-                pcd_format=PcdFormat(scene.velodyne.format),
+                pcd_format=pcd_format,
+                downsample=downsample,
+                link_mode=link_mode,
             )
-            for paths in pathss
-        ]
+            writer.write(input_data, paths.key.id, index)
+
+        try:
+            with ThreadPoolExecutor(max_workers=parallelism) as executor:
+                for _ in executor.map(lambda item: make(*item), remaining):
+                    pass
+        finally:
+            writer.close()
+
+        LocalCommand._log_all_data(writer, len(remaining), output_dir_path)
+
+    @staticmethod
+    def accumulate_sweeps(
+        scene_path: str,
+        output_dir: str,
+        poses_path: str,
+        sweeps_before: int = 2,
+        sweeps_after: int = 0,
+    ) -> None:
+        """
+        各フレームの点群に前後のフレームの点群を重ね合わせた、新たなシーンを作成します。
+        点群の疎なセンサーで、複数フレーム分の点群を1フレームとしてアノテーションする場合にこのコマンドを利用します。
+        出力先の"scene.meta"は、upload_sceneやmake_sceneの`scene_path`に指定できます。
+        Args:
+            scene_path: scene.metaファイルのファイルパス or scene.metaファイルの存在するディレクトリパス or kitti形式ディレクトリ
+            output_dir: 出力先ディレクトリ。 重ね合わせた点群の"velodyne"ディレクトリと"scene.meta"を出力する。 画像とラベルは元のシーンのファイルを参照する。
+            poses_path: 各フレームのポーズを記述したファイル（KITTI odometry形式）のパス。 シーンのフレームと同じ順に、各フレームの点群の座標系から共通の座標系への3x4の変換行列を1行ずつ記述する。
+            sweeps_before: 重ね合わせる前のフレームの数。 省略した場合は2
+            sweeps_after: 重ね合わせる後のフレームの数。 省略した場合は0
+        Returns:
+        """  # noqa: E501
+        scene = _load_scene(Path(str(scene_path)))
+        poses = read_poses(Path(str(poses_path)))
+        accumulate_scene(scene, poses, Path(str(output_dir)), sweeps_before, sweeps_after)
+
 
-        LocalCommand._write_all_files_json(inputs, output_dir_path)
+class SceneCommand:
+    """シーンに対する処理を行います"""
+
+    @staticmethod
+    def validate(
+        scene_path: str,
+        output: Optional[str] = None,
+        parallelism: Optional[int] = None,
+        upload_kind: str = UploadKind.CREATE_ANNOTATION.value,
+    ) -> None:
+        """
+        シーンが参照する全ファイル（点群・画像・ラベル・キャリブレーション）を検証し、結果をJSONで出力します。
+        ファイルの中身は読み込まず、ファイルが存在するかどうかと、点群ファイルのサイズがformat（xyzi/xyzirgb）の1点あたりのサイズの倍数かどうかを確認します。
+        問題が見つかった場合は、終了コード1で終了します。
+        Args:
+            scene_path: scene.metaファイルのファイルパス or scene.metaファイルの存在するディレクトリパス or kitti形式ディレクトリ
+            output: 検証結果のJSONの出力先ファイル。 省略した場合は標準出力に出力する
+            parallelism: statを並行に実行するスレッド数。 省略した場合は32。 ネットワークストレージでは大きくすると速くなる。
+            upload_kind: アップロード時に指定する処理の種類（data/task/annotation）。 省略した場合 "annotation" // annotation以外ではラベルのファイルを検証しない
+        Returns:
+        """  # noqa: E501
+        scene = _load_scene(Path(str(scene_path)))
+        include_labels = _decode_enum(UploadKind, upload_kind) == UploadKind.CREATE_ANNOTATION
+        report = validate_scene(scene, max_workers=parallelism, include_labels=include_labels)
+        report_json = report.to_json(ensure_ascii=False, indent=2)
+        if output is None:
+            print(report_json)
+        else:
+            output_path = Path(str(output))
+            output_path.parent.mkdir(parents=True, exist_ok=True)
+            output_path.write_text(report_json + "\n", encoding="UTF-8")
+            logger.info("検証結果を出力しました: %s", output_path.absolute())
+
+        if not report.ok:
+            sys.exit(1)
 
 
 class Command:
@@ -985,6 +1339,7 @@ class Command:
     def __init__(self):
         self.project = ProjectCommand()
         self.local = LocalCommand()
+        self.scene = SceneCommand()
 
     @staticmethod
     def version():
@@ -0,0 +1,138 @@
+import hashlib
+import os
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple, TypeVar, cast
+
+T = TypeVar("T")
+
+
+@dataclass(frozen=True)
+class CalibCacheStats:
+    hits: int
+    """解析済みの結果を再利用した回数"""
+    misses: int
+    """ファイルの内容を解析した回数"""
+
+    def describe(self) -> str:
+        total = self.hits + self.misses
+        hit_rate = self.hits / total if total > 0 else 0.0
+        return f"キャリブレーションの解析結果の再利用={self.hits}件, 解析={self.misses}件(再利用率={hit_rate:.0%})"
+
+
+class CalibCache:
+    """
+    キャリブレーションファイルの解析結果のキャッシュです。
+
+    解析結果は、ファイルの内容のハッシュ値と解析方法の組ごとに保持するため、
+    別のパスであっても内容が同じファイルは、1つの解析結果を共有します。
+    ファイルの内容のハッシュ値は、パス・更新日時・サイズの組ごとに保持するため、変更されていないファイルは再度読み込みません。
+    解析結果は呼び出し元で共有されるため、変更してはいけません。
+    """
+
+    _digests: Dict[Tuple[str, int, int], str]
+    _parsed: Dict[Tuple[str, str], Any]
+
+    def __init__(self):
+        self._digests = {}
+        self._parsed = {}
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, path: Path, kind: str, parse: Callable[[str], T]) -> T:
+        """
+        キャリブレーションファイルの解析結果を取得します。 キャッシュに無い場合は`parse`で解析します。
+
+        Args:
+            path: キャリブレーションファイルのパス
+            kind: 解析方法の名前。 解析結果の型ごとに異なる名前を指定する
+            parse: ファイルの内容を解析する関数
+
+        Returns:
+            解析結果
+        """
+        stat = path.stat()
+        stat_key = (path.absolute().as_posix(), stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            digest = self._digests.get(stat_key)
+            parsed = self._parsed.get((kind, digest)) if digest is not None else None
+            if parsed is not None:
+                self._hits += 1
+                return cast(T, parsed)
+
+        content = path.read_bytes()
+        digest = hashlib.blake2b(content, digest_size=16).hexdigest()
+        with self._lock:
+            self._digests[stat_key] = digest
+            parsed = self._parsed.get((kind, digest))
+            if parsed is not None:
+                self._hits += 1
+                return cast(T, parsed)
+
+        result = parse(content.decode("utf-8"))
+        with self._lock:
+            self._misses += 1
+            return cast(T, self._parsed.setdefault((kind, digest), result))
+
+    def stats(self) -> CalibCacheStats:
+        with self._lock:
+            return CalibCacheStats(self._hits, self._misses)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._digests.clear()
+            self._parsed.clear()
+            self._hits = 0
+            self._misses = 0
+
+
+calib_cache = CalibCache()
+"""`read_calibration`と`read_kitti_calib`で共有するキャッシュ"""
+
+ProcessCalibCacheStats = Tuple[int, CalibCacheStats]
+"""プロセスIDと、そのプロセスの`calib_cache`の統計の組"""
+
+
+def process_stats() -> ProcessCalibCacheStats:
+    """
+    このプロセスの`calib_cache`の統計を、プロセスIDとともに取得します。
+    プロセスプールで実行する処理の結果に含めて返し、`CalibCacheStatsCollector`で集計するために利用します。
+    """
+    return os.getpid(), calib_cache.stats()
+
+
+class CalibCacheStatsCollector:
+    """
+    複数のプロセスの`calib_cache`の統計を集計します。
+
+    プロセスプールのワーカープロセスは、それぞれのプロセスに`calib_cache`を持つため、
+    ワーカーで実行した処理の結果とともに返された`process_stats`の値を`add`で追加します。
+    各プロセスの統計は累積値のため、プロセスごとに最も大きい値のみを保持します。
+    このプロセス（スレッドで実行した処理）の統計は、`total`の呼び出し時に取得します。
+    """
+
+    _latest: Dict[int, CalibCacheStats]
+
+    def __init__(self):
+        self._latest = {}
+        self._lock = threading.Lock()
+
+    def add(self, stats: Optional[ProcessCalibCacheStats]) -> None:
+        if stats is None:
+            return
+        pid, process = stats
+        with self._lock:
+            latest = self._latest.get(pid)
+            if latest is None or latest.hits + latest.misses < process.hits + process.misses:
+                self._latest[pid] = process
+
+    def total(self) -> CalibCacheStats:
+        pid, current = process_stats()
+        with self._lock:
+            latest = dict(self._latest)
+        latest[pid] = current
+        return CalibCacheStats(
+            sum(stats.hits for stats in latest.values()), sum(stats.misses for stats in latest.values())
+        )
@@ -1,6 +1,7 @@
 from pathlib import Path
 from typing import Any, Callable, Iterable, List, Optional, TypeVar, cast
 
+from anno3d.calib_cache import calib_cache
 from anno3d.model.image import kitti3DCalib
 
 T = TypeVar("T")
@@ -39,5 +40,7 @@ def _read_str(lines: List[str]) -> kitti3DCalib:
 
 
 def read_kitti_calib(path: Path) -> kitti3DCalib:
-    with path.open(mode="r", encoding="utf-8") as file:
-        return _read_str(file.readlines())
+    """
+    キャリブレーションファイルを読み込みます。 同じ内容のファイルの解析結果は`calib_cache`で共有します。
+    """
+    return calib_cache.get(path, "calib_loader.kitti3DCalib", lambda content: _read_str(content.splitlines()))
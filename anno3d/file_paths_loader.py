@@ -1,9 +1,10 @@
-import os
+import itertools
 from pathlib import Path
-from typing import List, Optional
+from typing import Iterator, List, Optional
 
-from anno3d.model.file_paths import FilePaths, FrameKey, FrameKind, ImagePaths
+from anno3d.model.file_paths import FilePaths, FrameKey, FrameKind, ImagePaths, LabelPaths
 from anno3d.model.scene import Scene
+from anno3d.util.file_scan import iter_file_names
 
 
 class FilePathsLoader:
@@ -17,6 +18,18 @@ class FilePathsLoader:
         self.calib_root = calib_root
 
     def load(self, kind: Optional[FrameKind]) -> List[FilePaths]:
+        return list(self.iter_paths(kind))
+
+    def iter_paths(self, kind: Optional[FrameKind], skip: int = 0, size: Optional[int] = None) -> Iterator[FilePaths]:
+        """
+        点群ファイル（*.bin）を1件ずつ見つけながら、対応するFilePathsを返します。
+        見つけた順に返すため、ディレクトリ内のファイル数に関わらず、最初の1件はすぐに返ります。
+
+        Args:
+            kind: 対象のデータの種類。 Noneの場合は、各ルートディレクトリ直下のディレクトリを対象とする
+            skip: 先頭から読み飛ばす件数
+            size: 最大の件数。 Noneの場合は全件
+        """
         if kind is not None:
             pcd_dir = self.pcd_root / kind.value / "velodyne"
             image_dir = self.image_root / kind.value / "image_2"
@@ -27,7 +40,7 @@ class FilePathsLoader:
             calib_dir = self.calib_root / "calib"
 
         def id_to_paths(pcd_file: str) -> FilePaths:
-            frame_id = pcd_file[0:-4]
+            frame_id = pcd_file[0 : -len(".bin")]
             return FilePaths(
                 FrameKey(kind, frame_id),
                 pcd=pcd_dir / f"{frame_id}.bin",
@@ -43,7 +56,9 @@ class FilePathsLoader:
                 labels=[],
             )
 
-        return [id_to_paths(pcd_file) for pcd_file in os.listdir(pcd_dir)]
+        pcd_files = iter_file_names(pcd_dir, ".bin")
+        stop = skip + size if size is not None else None
+        return (id_to_paths(pcd_file) for pcd_file in itertools.islice(pcd_files, skip, stop))
 
 
 class ScenePathsLoader:
@@ -62,25 +77,42 @@ class ScenePathsLoader:
         """
         Annofab点群形式（KITTIベース）のファイルを読み込む.
         """
+        return list(self.iter_paths())
+
+    def iter_paths(self) -> Iterator[FilePaths]:
+        """
+        sceneの`id_list`の順に、各フレームのFilePathsを1件ずつ生成します。
+        """
         scene = self.scene
+        # フレーム数が多い場合に、ディレクトリのパスをフレームごとに解析し直さないようにする
+        velodyne_dir = Path(scene.velodyne.velodyne_dir)
+        image_dirs = [Path(image.image_dir) for image in scene.images]
+        label_dirs = [Path(label.label_dir) for label in scene.labels]
 
         def scene_to_paths(frame_id: str) -> FilePaths:
             images = [
                 ImagePaths(
-                    Path(image.image_dir) / f"{frame_id}.{image.file_extension}",
+                    image_dir / f"{frame_id}.{image.file_extension}",
                     image.file_extension,
-                    Path(image.calib_dir) / f"{frame_id}.txt" if image.calib_dir is not None else None,
+                    image.calib_path(frame_id),
                     image.camera_view_setting,
                     image.display_name,
                 )
-                for image in scene.images
+                for image, image_dir in zip(scene.images, image_dirs)
+            ]
+            labels = [
+                LabelPaths(
+                    label_dir / f"{frame_id}.txt",
+                    label.calib_path(frame_id),
+                )
+                for label, label_dir in zip(scene.labels, label_dirs)
             ]
 
             return FilePaths(
                 FrameKey(None, frame_id),
-                Path(scene.velodyne.velodyne_dir) / f"{frame_id}.bin",
+                velodyne_dir / f"{frame_id}.bin",
                 images,
-                labels=[],
+                labels,
             )
 
-        return [scene_to_paths(frame_id) for frame_id in scene.id_list]
+        return (scene_to_paths(frame_id) for frame_id in scene.id_list)
@@ -0,0 +1,162 @@
+import os
+from collections import deque
+from dataclasses import dataclass, replace
+from logging import getLogger
+from pathlib import Path
+from typing import IO, Deque, List
+
+import numpy as np
+
+from anno3d.file_paths_loader import ScenePathsLoader
+from anno3d.kitti.point_cloud import DEFAULT_CHUNK_SIZE, as_float_array, open_point_cloud, point_dtype
+from anno3d.model.file_paths import FilePaths
+from anno3d.model.scene import Defaults, Scene
+
+logger = getLogger(__name__)
+
+
+def read_poses(path: Path) -> np.ndarray:
+    """
+    KITTI odometry形式のポーズファイルを読み込みます。
+
+    1行が1フレームに対応し、3x4の変換行列を行優先で並べた12個の数値を空白区切りで記述します。
+    変換行列は、各フレームの点群の座標系から、全フレームで共通の座標系への変換を表します。
+
+    Returns:
+        (フレーム数, 4, 4)の同次変換行列の配列
+    """
+    values = np.loadtxt(path, dtype=np.float64, ndmin=2)
+    if values.shape[1] != 12:
+        raise RuntimeError(f"ポーズファイルの1行には12個の数値が必要ですが、{values.shape[1]}個でした: {path}")
+
+    poses = np.tile(np.eye(4), (len(values), 1, 1))
+    poses[:, :3, :] = values.reshape(-1, 3, 4)
+    return poses
+
+
+@dataclass
+class _Sweep:
+    """共通の座標系に変換済みの、1フレーム分の点群"""
+
+    index: int
+    xyz: np.ndarray
+    """共通の座標系における座標。 遠方でも精度が落ちないようにfloat64で保持する"""
+    attributes: np.ndarray
+    """座標以外のフィールド（反射強度や色）"""
+
+
+class SweepAccumulator:
+    """
+    前後のフレームの点群を重ね合わせた点群を、フレームごとに出力します。
+
+    各フレームの点群は、読み込んだ時点で一度だけ共通の座標系に変換してウィンドウに保持し、
+    ウィンドウから外れるまで後続のフレームの出力に使い回します。
+    そのため、メモリ上に保持する点群はウィンドウの大きさ（sweeps_before + sweeps_after + 1 フレーム）分に限られます。
+
+    Args:
+        pathss: 各フレームのファイルパス
+        poses: 各フレームのポーズ。 `read_poses`の戻り値
+        pcd_format: 点群のフォーマット
+        sweeps_before: 重ね合わせる、前のフレームの数
+        sweeps_after: 重ね合わせる、後のフレームの数
+    """
+
+    _window: Deque[_Sweep]
+
+    def __init__(
+        self,
+        pathss: List[FilePaths],
+        poses: np.ndarray,
+        pcd_format: str,
+        sweeps_before: int,
+        sweeps_after: int,
+    ):
+        if len(pathss) != len(poses):
+            raise RuntimeError(f"フレーム数(={len(pathss)})とポーズの数(={len(poses)})が一致しません")
+        if sweeps_before < 0 or sweeps_after < 0:
+            raise ValueError("sweeps_before, sweeps_afterは0以上である必要があります")
+
+        self._pathss = pathss
+        self._poses = poses
+        self._pcd_format = pcd_format
+        self._sweeps_before = sweeps_before
+        self._sweeps_after = sweeps_after
+        self._window = deque()
+        self._next_index = 0
+
+    def _load(self, index: int) -> _Sweep:
+        points = as_float_array(open_point_cloud(self._pathss[index].pcd, self._pcd_format))
+        pose = self._poses[index]
+        xyz = points[:, :3].astype(np.float64) @ pose[:3, :3].T + pose[:3, 3]
+        return _Sweep(index, xyz, np.array(points[:, 3:]))
+
+    def _slide_to(self, index: int) -> None:
+        while self._window and self._window[0].index < index - self._sweeps_before:
+            self._window.popleft()
+        last = min(index + self._sweeps_after, len(self._pathss) - 1)
+        while self._next_index <= last:
+            self._window.append(self._load(self._next_index))
+            self._next_index += 1
+
+    def _write_frame(self, index: int, writer: IO[bytes]) -> int:
+        pose = self._poses[index]
+        rotation = pose[:3, :3]
+        translation = pose[:3, 3]
+        dtype = point_dtype(self._pcd_format)
+        # 対象フレームの点を先頭に出力する
+        sweeps = sorted(self._window, key=lambda sweep: sweep.index != index)
+        count = 0
+        for sweep in sweeps:
+            for start in range(0, len(sweep.xyz), DEFAULT_CHUNK_SIZE):
+                xyz = sweep.xyz[start : start + DEFAULT_CHUNK_SIZE]
+                chunk = np.empty((len(xyz), len(dtype.names or ())), dtype=np.float32)
+                # 共通の座標系から、対象フレームの座標系に戻す（行ベクトルなので R^T (p - t) = (p - t) R）
+                chunk[:, :3] = (xyz - translation) @ rotation
+                chunk[:, 3:] = sweep.attributes[start : start + DEFAULT_CHUNK_SIZE]
+                chunk.tofile(writer)
+                count += len(chunk)
+        return count
+
+    def write(self, output_dir: Path) -> None:
+        """
+        全フレームの重ね合わせた点群を、`output_dir`に`{frame_id}.bin`として出力します。
+        """
+        output_dir.mkdir(parents=True, exist_ok=True)
+        for index, paths in enumerate(self._pathss):
+            self._slide_to(index)
+            output = output_dir / f"{paths.key.id}.bin"
+            temp = output_dir / f".{paths.key.id}.bin.tmp"
+            with temp.open("wb") as writer:
+                count = self._write_frame(index, writer)
+            os.replace(temp, output)
+            logger.info("%d フレームを重ね合わせた点群(%d点)を出力しました: %s", len(self._window), count, output)
+
+
+def accumulate_scene(
+    scene: Scene,
+    poses: np.ndarray,
+    output_dir: Path,
+    sweeps_before: int,
+    sweeps_after: int,
+) -> Scene:
+    """
+    シーンの各フレームについて前後のフレームの点群を重ね合わせ、`output_dir`に新たなシーンとして出力します。
+
+    出力先には、重ね合わせた点群の`velodyne`ディレクトリと`scene.meta`を作成します。
+    画像とラベルは、元のシーンのファイルを参照します。
+
+    Returns:
+        出力したシーン
+    """
+    velodyne_dir = output_dir / Defaults.velo_dir
+    pathss = ScenePathsLoader(scene).load()
+    SweepAccumulator(pathss, poses, scene.velodyne.format, sweeps_before, sweeps_after).write(velodyne_dir)
+
+    # 出力先から元のシーンのファイルを参照できるように、パスは絶対パスで記録する
+    accumulated = replace(
+        scene.absolute(), velodyne=replace(scene.velodyne, velodyne_dir=velodyne_dir.absolute().as_posix())
+    )
+    scene_meta = output_dir / Defaults.scene_meta_file
+    scene_meta.write_text(accumulated.encode(), encoding="UTF-8")
+    logger.info("重ね合わせた点群のシーンを出力しました: %s", scene_meta.absolute())
+    return accumulated
@@ -0,0 +1,88 @@
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Union
+
+import numpy as np
+
+from anno3d.kitti.point_cloud import as_float_array, transform_point_cloud_file
+from anno3d.model.annotation_area import AnnotationArea, RectAnnotationArea, SphereAnnotationArea
+from anno3d.model.frame import PcdFormat
+
+
+@dataclass(frozen=True)
+class AreaCropSettings:
+    """
+    アノテーション範囲による点群の切り抜きの設定
+
+    Args:
+        area: プロジェクトのアノテーション範囲
+        margin: アノテーション範囲の外側に残す幅。 単位は点群の単位系（=kittiであれば[m]）
+        cache_dir: 切り抜いた点群ファイルの出力先ディレクトリ。 同じ点群・設定の結果は再利用する
+    """
+
+    area: AnnotationArea
+    margin: float
+    cache_dir: Path
+
+
+def area_mask(xyz: np.ndarray, area: AnnotationArea, margin: float) -> np.ndarray:
+    """
+    各点がアノテーション範囲（+ margin）の内側にあるかどうかを表すbool配列を求めます。
+
+    Args:
+        xyz: (点数, 3)の座標の配列
+        area: アノテーション範囲
+        margin: アノテーション範囲の外側に残す幅
+
+    Returns:
+        点数を長さとするbool配列
+    """
+    if isinstance(area, SphereAnnotationArea):
+        radius = float(area.area_radius) + margin
+        squared_distance: np.ndarray = np.einsum("ij,ij->i", xyz, xyz)
+        return squared_distance <= radius * radius
+    if isinstance(area, RectAnnotationArea):
+        x = xyz[:, 0]
+        y = xyz[:, 1]
+        return (
+            (x >= float(area.area_min_x) - margin)
+            & (x <= float(area.area_max_x) + margin)
+            & (y >= float(area.area_min_y) - margin)
+            & (y <= float(area.area_max_y) + margin)
+        )
+    return np.ones(len(xyz), dtype=bool)
+
+
+def crop_points(points: np.ndarray, area: AnnotationArea, margin: float) -> np.ndarray:
+    """
+    アノテーション範囲（+ margin）の外側にある点を取り除きます。
+
+    Args:
+        points: `open_point_cloud`で開いた構造化配列
+        area: アノテーション範囲
+        margin: アノテーション範囲の外側に残す幅
+
+    Returns:
+        `points`と同じdtypeの構造化配列
+    """
+    if len(points) == 0:
+        return points
+    cropped: np.ndarray = points[area_mask(as_float_array(points)[:, :3], area, margin)]
+    return cropped
+
+
+def crop_file(path: Path, pcd_format: Union[PcdFormat, str], settings: AreaCropSettings) -> Path:
+    """
+    点群ファイルをアノテーション範囲で切り抜いて、`settings.cache_dir`に書き出します。
+    元ファイルが変更されていなければ、前回の出力をそのまま再利用します。
+
+    Returns:
+        切り抜いた点群ファイルのパス
+    """
+    return transform_point_cloud_file(
+        path,
+        pcd_format,
+        settings.cache_dir,
+        f"crop:{settings.area.to_json(sort_keys=True)}:{settings.margin!r}",
+        lambda points: crop_points(points, settings.area, settings.margin),
+    )
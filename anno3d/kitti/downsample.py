@@ -0,0 +1,82 @@
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Union
+
+import numpy as np
+
+from anno3d.kitti.point_cloud import as_float_array, transform_point_cloud_file
+from anno3d.model.frame import PcdFormat
+
+
+@dataclass(frozen=True)
+class VoxelDownsampleSettings:
+    """
+    ボクセルグリッドによる点群のダウンサンプリングの設定
+
+    Args:
+        voxel_size: ボクセルの1辺の長さ。 単位は点群の単位系（=kittiであれば[m]）
+        cache_dir: ダウンサンプリングした点群ファイルの出力先ディレクトリ。 同じ点群・設定の結果は再利用する
+    """
+
+    voxel_size: float
+    cache_dir: Path
+
+
+def _voxel_keys(xyz: np.ndarray, voxel_size: float) -> np.ndarray:
+    """
+    各点が属するボクセルのインデックスを、1次元の整数キーに変換します。
+    """
+    indices = np.floor(xyz / voxel_size).astype(np.int64)
+    indices -= indices.min(axis=0)
+    dim_x, dim_y, dim_z = (int(value) + 1 for value in indices.max(axis=0))
+    if dim_x * dim_y * dim_z <= np.iinfo(np.int64).max:
+        return (indices[:, 0] * dim_y + indices[:, 1]) * dim_z + indices[:, 2]
+
+    # 範囲が広すぎて1次元に詰められない場合は、インデックスの組そのものに番号を振る
+    _, keys = np.unique(indices, axis=0, return_inverse=True)
+    return keys.reshape(-1)
+
+
+def voxel_downsample(points: np.ndarray, voxel_size: float) -> np.ndarray:
+    """
+    点群をボクセルグリッドでダウンサンプリングします。
+    同じボクセルに含まれる点は、全フィールド（座標・反射強度・色）の平均を取った1点にまとめます。
+
+    Args:
+        points: `open_point_cloud`で開いた構造化配列
+        voxel_size: ボクセルの1辺の長さ
+
+    Returns:
+        ダウンサンプリング後の点群。 `points`と同じdtypeの構造化配列で、ボクセルのインデックス順に並ぶ
+    """
+    if voxel_size <= 0:
+        raise ValueError(f"voxel_sizeは正の値である必要がありますが、{voxel_size}が指定されています")
+    if len(points) == 0:
+        return np.empty(0, dtype=points.dtype)
+
+    values = as_float_array(points)
+    _, inverse, counts = np.unique(_voxel_keys(values[:, :3], voxel_size), return_inverse=True, return_counts=True)
+    inverse = inverse.reshape(-1)
+
+    result = np.empty((len(counts), values.shape[1]), dtype=np.float32)
+    for column in range(values.shape[1]):
+        result[:, column] = np.bincount(inverse, weights=values[:, column], minlength=len(counts)) / counts
+
+    return result.view(points.dtype).reshape(-1)
+
+
+def downsample_file(path: Path, pcd_format: Union[PcdFormat, str], settings: VoxelDownsampleSettings) -> Path:
+    """
+    点群ファイルをダウンサンプリングして、`settings.cache_dir`に書き出します。
+    元ファイルが変更されていなければ、前回の出力をそのまま再利用します。
+
+    Returns:
+        ダウンサンプリングした点群ファイルのパス
+    """
+    return transform_point_cloud_file(
+        path,
+        pcd_format,
+        settings.cache_dir,
+        f"voxel:{settings.voxel_size!r}",
+        lambda points: voxel_downsample(points, settings.voxel_size),
+    )
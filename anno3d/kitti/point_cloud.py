@@ -0,0 +1,171 @@
+import hashlib
+import os
+from dataclasses import dataclass
+from logging import getLogger
+from pathlib import Path
+from typing import Callable, Dict, Iterator, Optional, Tuple, Union
+
+import numpy as np
+
+from anno3d.model.common import Vector3
+from anno3d.model.frame import PcdFormat
+
+logger = getLogger(__name__)
+
+# KITTI velodyne形式の点群ファイルは、ヘッダ無しでfloat32のフィールドを並べたもの
+# ファイルはnp.memmapで開くため、ファイル全体をメモリに読み込むことなく扱える
+_FIELDS: Dict[str, Tuple[str, ...]] = {
+    "xyzi": ("x", "y", "z", "i"),
+    "xyzirgb": ("x", "y", "z", "i", "r", "g", "b"),
+}
+
+DEFAULT_CHUNK_SIZE = 1 << 20
+"""チャンク単位で処理する場合の、1チャンクあたりの点数"""
+
+
+def _format_name(pcd_format: Union[PcdFormat, str]) -> str:
+    name = pcd_format.format if isinstance(pcd_format, PcdFormat) else pcd_format
+    if name not in _FIELDS:
+        raise RuntimeError(f"点群のformatはxyziかxyzirgbである必要がありますが、{name}が指定されています")
+    return name
+
+
+def point_fields(pcd_format: Union[PcdFormat, str]) -> Tuple[str, ...]:
+    """1点あたりのフィールド名の一覧を取得します。"""
+    return _FIELDS[_format_name(pcd_format)]
+
+
+def point_dtype(pcd_format: Union[PcdFormat, str]) -> np.dtype:
+    """1点を表す構造化dtype（リトルエンディアンのfloat32のフィールドの並び）を取得します。"""
+    return np.dtype([(field, "<f4") for field in point_fields(pcd_format)])
+
+
+def count_points(path: Path, pcd_format: Union[PcdFormat, str]) -> int:
+    """
+    ファイルサイズから点数を求めます。
+
+    Raises:
+        RuntimeError: ファイルサイズが1点あたりのバイト数の倍数でない場合
+    """
+    itemsize = point_dtype(pcd_format).itemsize
+    size = path.stat().st_size
+    if size % itemsize != 0:
+        raise RuntimeError(
+            f"点群ファイルのサイズ(={size}byte)が、format(={_format_name(pcd_format)})の1点あたりのサイズ"
+            f"(={itemsize}byte)の倍数ではありません: {path}"
+        )
+    return size // itemsize
+
+
+def open_point_cloud(path: Path, pcd_format: Union[PcdFormat, str]) -> np.ndarray:
+    """
+    点群ファイルを、読み込み専用の構造化配列として開きます。
+    ファイルはメモリマップされるため、実際に参照した部分のみが読み込まれます。
+
+    Args:
+        path: 点群ファイルのパス
+        pcd_format: 点群のフォーマット
+
+    Returns:
+        点数を長さとする構造化配列。 フィールドは`point_fields`で取得できる
+    """
+    dtype = point_dtype(pcd_format)
+    count = count_points(path, pcd_format)
+    if count == 0:
+        # 空のファイルはメモリマップできない
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=(count,))
+
+
+def as_float_array(points: np.ndarray) -> np.ndarray:
+    """
+    `open_point_cloud`で開いた構造化配列を、コピーせずに (点数, フィールド数) のfloat32配列として参照します。
+    """
+    return points.view("<f4").reshape(len(points), len(points.dtype.names or ()))
+
+
+def iter_chunks(points: np.ndarray, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[np.ndarray]:
+    """点群を先頭から`chunk_size`点ずつ参照します。"""
+    for start in range(0, len(points), chunk_size):
+        yield points[start : start + chunk_size]
+
+
+@dataclass(frozen=True)
+class PointCloudStats:
+    """点群の点数と、座標の範囲"""
+
+    count: int
+    min: Optional[Vector3]
+    """点が存在しない場合はNone"""
+    max: Optional[Vector3]
+    """点が存在しない場合はNone"""
+
+
+def point_cloud_stats(
+    path: Path, pcd_format: Union[PcdFormat, str], chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> PointCloudStats:
+    """
+    点群の点数と座標の範囲を求めます。
+    チャンク単位で処理するため、ファイルサイズに関わらずメモリ使用量はチャンクサイズ程度に収まります。
+    """
+    points = open_point_cloud(path, pcd_format)
+    if len(points) == 0:
+        return PointCloudStats(0, None, None)
+
+    lower = np.full(3, np.inf, dtype=np.float32)
+    upper = np.full(3, -np.inf, dtype=np.float32)
+    for chunk in iter_chunks(points, chunk_size):
+        xyz = as_float_array(chunk)[:, :3]
+        np.minimum(lower, xyz.min(axis=0), out=lower)
+        np.maximum(upper, xyz.max(axis=0), out=upper)
+
+    return PointCloudStats(
+        len(points),
+        Vector3(float(lower[0]), float(lower[1]), float(lower[2])),
+        Vector3(float(upper[0]), float(upper[1]), float(upper[2])),
+    )
+
+
+def transform_point_cloud_file(
+    path: Path,
+    pcd_format: Union[PcdFormat, str],
+    cache_dir: Path,
+    settings: str,
+    transform: Callable[[np.ndarray], np.ndarray],
+) -> Path:
+    """
+    点群ファイルを`transform`で変換して、`cache_dir`に書き出します。
+
+    出力先は、元ファイルのパス・サイズ・更新日時と`settings`から決めるため、
+    元ファイルが変更されていなければ、前回の出力をそのまま再利用します。
+    出力ファイルの名前は元ファイルと同じです。
+
+    Args:
+        path: 点群ファイルのパス
+        pcd_format: 点群のフォーマット
+        cache_dir: 出力先ディレクトリ
+        settings: 変換の種類と設定を表す文字列。 出力先の決定に利用する
+        transform: `open_point_cloud`で開いた構造化配列を受け取り、同じdtypeの構造化配列を返す関数
+
+    Returns:
+        変換した点群ファイルのパス
+    """
+    format_name = _format_name(pcd_format)
+    stat = path.stat()
+    key = f"{path.absolute().as_posix()}\n{stat.st_size}\n{stat.st_mtime_ns}\n{format_name}\n{settings}"
+    output_dir = cache_dir / hashlib.sha256(key.encode("UTF-8")).hexdigest()[:32]
+    output = output_dir / path.name
+    if output.exists():
+        logger.debug("変換済みの点群を再利用します: %s", output)
+        return output
+
+    points = open_point_cloud(path, format_name)
+    transformed = transform(points)
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    # 書き込み途中のファイルを再利用しないように、書き込み完了後にリネームする
+    temp = output_dir / f".{path.name}.{os.getpid()}.tmp"
+    transformed.tofile(temp)
+    os.replace(temp, output)
+    logger.info("点群を変換しました(%s, %d点 -> %d点): %s", settings, len(points), len(transformed), path)
+    return output
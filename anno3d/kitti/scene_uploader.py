@@ -1,17 +1,18 @@
 import asyncio
 import logging
+import os
+import time
 import uuid
 from dataclasses import dataclass
 from enum import Enum
 from pathlib import Path
-from typing import Dict, List, NewType, Optional, Tuple
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Literal, NewType, Optional, Tuple
 
-import more_itertools
 import numpy as np
 from annofabapi import AnnofabApi
 from annofabapi.dataclass.annotation_specs import LabelV3
-from scipy.spatial.transform import Rotation
 
+from anno3d.annofab.concurrency import AdaptiveLimiter
 from anno3d.annofab.model import (
     XYZ,
     AnnotationPropsForEditor,
@@ -22,15 +23,28 @@ from anno3d.annofab.model import (
     Size,
 )
 from anno3d.annofab.project import ProjectApi
+from anno3d.annofab.retry import RetrySettings, is_retryable, retry_async
 from anno3d.annofab.task import TaskApi
 from anno3d.annofab.uploader import Uploader
-from anno3d.kitti.calib import read_calibration, transform_labels_into_lidar_coordinates
+from anno3d.calib_cache import CalibCacheStatsCollector
+from anno3d.file_paths_loader import ScenePathsLoader
+from anno3d.kitti.calib import read_calibration, transform_label_arrays_into_lidar_coordinates
 from anno3d.kitti.camera_horizontal_fov_provider import CameraHorizontalFovKind
-from anno3d.model.file_paths import FilePaths, FrameKey, ImagePaths, LabelPaths
+from anno3d.kitti.crop import AreaCropSettings
+from anno3d.kitti.downsample import VoxelDownsampleSettings
+from anno3d.model.file_paths import FilePaths, LabelPaths
 from anno3d.model.frame import PcdFormat
-from anno3d.model.kitti_label import KittiLabel
+from anno3d.model.kitti_label import KittiLabelArrays
 from anno3d.model.scene import Defaults, Scene
-from anno3d.simple_data_uploader import SupplementaryData, upload_async
+from anno3d.scene_validator import validate_scene
+from anno3d.simple_data_uploader import (
+    PreparedFrame,
+    create_input_data_id,
+    create_prepare_executor,
+    prepare_upload,
+    upload_prepared_async,
+)
+from anno3d.upload_journal import UploadJournal
 
 logger: logging.Logger = logging.getLogger(__name__)
 
@@ -50,23 +64,196 @@ class SceneUploaderInput:
     sensor_height: Optional[float]
     task_id_prefix: str
     kind: UploadKind
+    downsample: Optional[VoxelDownsampleSettings] = None
+    """点群のダウンサンプリングの設定。 Noneの場合はダウンサンプリングしない"""
+    crop: Optional[AreaCropSettings] = None
+    """アノテーション範囲による点群の切り抜きの設定。 Noneの場合は切り抜かない"""
+    validate: bool = False
+    """アップロードを始める前に、シーンが参照する全ファイルを検証するかどうか。 問題があればアップロードしない"""
 
 
 TaskId = NewType("TaskId", str)
 
 DataId = NewType("DataId", str)
 
+_TaskResult = Literal["created", "skipped", "failed"]
+
+_DEFAULT_PARALLELISM = 32
+"""`parallelism`が指定されなかった場合の、各ステージのワーカー数"""
+
+_QUEUE_SIZE_PER_WORKER = 2
+"""ステージ間のキューの大きさ（後段のワーカー1つあたり）"""
+
+_PROGRESS_LOG_INTERVAL = 10.0
+"""アノテーション登録の進捗をログに出力する間隔[秒]"""
+
+_VALIDATION_LOG_LIMIT = 20
+"""事前の検証で見つかった問題のうち、ログに出力する件数"""
+
+
+@dataclass
+class _PreparedItem:
+    index: int
+    prepared: PreparedFrame
+
+
+@dataclass
+class _UploadedItem:
+    index: int
+    data_id: DataId
+    paths: FilePaths
+
+
+@dataclass
+class _TaskItem:
+    task_id: TaskId
+    data_and_pathss: List[Tuple[DataId, FilePaths]]
+
+
+@dataclass
+class _AnnotationItem:
+    task_id: TaskId
+    data_id: DataId
+    label_pathss: List[LabelPaths]
+
+
+def _load_frame_labels(pathss: List[LabelPaths]) -> List[KittiLabelArrays]:
+    """
+    1フレーム分のラベルファイルを読み込み、点群の座標系に変換します。
+    1フレームのラベルファイルは数個のため、スレッドプールを作らずに順に読み込みます。
+    """
+    return [
+        transform_label_arrays_into_lidar_coordinates(
+            KittiLabelArrays.decode_path(paths.label), read_calibration(paths.calib)
+        )
+        for paths in pathss
+    ]
+
+
+class _Progress:
+    """
+    アップロードとアノテーション登録の進捗・スループットを集計し、一定間隔でログに出力します。
+    """
+
+    def __init__(self, limiter: AdaptiveLimiter):
+        self._limiter = limiter
+        self._started = time.monotonic()
+        self._last_logged = self._started
+        self.data = 0
+        self.annotation_frames = 0
+        self.annotations = 0
+        self.skipped_annotation_frames = 0
+
+    def add_data(self) -> None:
+        self.data += 1
+        self._log_periodically()
+
+    def add_annotations(self, annotations: Optional[int]) -> None:
+        """
+        1フレーム分のアノテーションの登録結果を追加します。
+        `annotations`がNoneの場合は、登録済みでスキップしたフレームとします。
+        """
+        if annotations is None:
+            self.skipped_annotation_frames += 1
+        else:
+            self.annotation_frames += 1
+            self.annotations += annotations
+        self._log_periodically()
+
+    def _log_periodically(self) -> None:
+        now = time.monotonic()
+        if now - self._last_logged >= _PROGRESS_LOG_INTERVAL:
+            self._last_logged = now
+            self.log("アップロード中です")
+
+    def log(self, message: str) -> None:
+        elapsed = max(time.monotonic() - self._started, 1e-9)
+        logger.info(
+            "%s: 入力データ=%d件(%.1f件/秒), アノテーション=%dフレーム(%.1fフレーム/秒) %d件(%.1f件/秒), "
+            "スキップ=%dフレーム, %s, 経過時間=%.1f秒",
+            message,
+            self.data,
+            self.data / elapsed,
+            self.annotation_frames,
+            self.annotation_frames / elapsed,
+            self.annotations,
+            self.annotations / elapsed,
+            self.skipped_annotation_frames,
+            self._limiter.stats().describe(),
+            elapsed,
+        )
+
+
+async def _run_workers(
+    worker: Callable[[], Awaitable[None]], count: int, out_queue: "Optional[asyncio.Queue[Any]]", out_consumers: int
+) -> None:
+    """
+    `worker`を`count`個並行に実行し、すべて終了したら後段のワーカーの数だけ終端(None)をキューに入れます。
+    """
+    await asyncio.gather(*(worker() for _ in range(count)))
+    if out_queue is not None:
+        for _ in range(out_consumers):
+            await out_queue.put(None)
+
+
+async def _run_stages(stages: List[Awaitable[None]]) -> None:
+    """
+    パイプラインの各ステージを並行に実行します。
+    何れかのステージで例外が発生した場合は、残りのステージをキャンセルしてその例外を送出します。
+    """
+    futures = [asyncio.ensure_future(stage) for stage in stages]
+    try:
+        done, _ = await asyncio.wait(futures, return_when=asyncio.FIRST_EXCEPTION)
+        for future in done:
+            future.result()
+    finally:
+        for future in futures:
+            future.cancel()
+        await asyncio.gather(*futures, return_exceptions=True)
+
 
 class SceneUploader:
     _client: AnnofabApi
     _project: ProjectApi
-    _sem: Optional[asyncio.Semaphore]
+    _workers: int
+    _prepare_workers: int
+    _annotation_workers: int
 
-    def __init__(self, client: AnnofabApi, uploader: Uploader, parallelism: Optional[int]):
+    def __init__(
+        self,
+        client: AnnofabApi,
+        uploader: Uploader,
+        parallelism: Optional[int],
+        journal: Optional[UploadJournal] = None,
+        prepare_workers: Optional[int] = None,
+        annotation_parallelism: Optional[int] = None,
+        retry: Optional[RetrySettings] = None,
+    ):
+        """
+        Args:
+            client:
+            uploader:
+            parallelism: ネットワークI/Oを行うステージ（アップロード・アノテーションの登録）のワーカー数。
+                         Noneの場合は`_DEFAULT_PARALLELISM`となる。
+            journal: 作成済みのタスクと登録済みのアノテーションを記録するジャーナル。 記録済みのものはスキップする。
+                     入力データと補助情報については、`uploader`に渡したジャーナルで記録する。
+            prepare_workers: 補助情報の準備を行うプロセス数。 Noneの場合はCPU数となる。
+            annotation_parallelism: アノテーションを並行に登録するフレーム数の上限。 Noneの場合は`parallelism`と同じ。
+                                    タスクを跨いでフレーム単位で並行に登録する。
+            retry: タスクの作成とアノテーションの登録の再試行の設定。 Noneの場合はデフォルトの設定となる。
+        """
         self._client = client
         self._project = ProjectApi(client)
         self._uploader = uploader
-        self._sem = asyncio.Semaphore(parallelism) if parallelism is not None else None
+        self._workers = parallelism if parallelism is not None else _DEFAULT_PARALLELISM
+        self._prepare_workers = prepare_workers if prepare_workers is not None else (os.cpu_count() or 1)
+        self._journal = journal if journal is not None else UploadJournal()
+        self._annotation_workers = annotation_parallelism if annotation_parallelism is not None else self._workers
+        if self._annotation_workers <= 0:
+            raise ValueError(
+                f"annotation_parallelismは1以上である必要がありますが、{annotation_parallelism}が指定されています"
+            )
+        self._retry = retry if retry is not None else RetrySettings()
 
     def upload_from_path(self, scene_path: Path, uploader_input: SceneUploaderInput) -> None:
         """
@@ -89,107 +276,55 @@ class SceneUploader:
         return self.upload_scene(scene, uploader_input)
 
     @staticmethod
-    def _scene_to_paths(scene: Scene) -> List[FilePaths]:
-        def id_to_paths(frame_id: str) -> FilePaths:
-            images = [
-                ImagePaths(
-                    Path(image.image_dir) / f"{frame_id}.{image.file_extension}",
-                    image.file_extension,
-                    Path(image.calib_dir) / f"{frame_id}.txt" if image.calib_dir is not None else None,
-                    image.camera_view_setting,
-                    image.display_name,
-                )
-                for image in scene.images
-            ]
-            labels = [
-                LabelPaths(
-                    Path(label.label_dir) / f"{frame_id}.txt",
-                    Path(label.calib_dir) / f"{frame_id}.txt",
-                )
-                for label in scene.labels
-            ]
-
-            return FilePaths(
-                FrameKey(None, frame_id),
-                Path(scene.velodyne.velodyne_dir) / f"{frame_id}.bin",
-                images,
-                labels,
-            )
-
-        return [id_to_paths(frame_id) for frame_id in scene.id_list]
+    def _scene_to_paths(scene: Scene) -> Iterator[FilePaths]:
+        return ScenePathsLoader(scene).iter_paths()
 
     @staticmethod
-    def _get_task_to_data_dict(
-        id_prefix: str,
-        data_and_pathss: List[Tuple[DataId, FilePaths]],
-        chunk_size: Optional[int] = None,
-    ) -> Dict[TaskId, List[Tuple[DataId, FilePaths]]]:
+    def _get_task_id(id_prefix: str, task_count: int, chunk_size: Optional[int]) -> TaskId:
         """
-        タスクと入力データの関係を示すdictを取得します。
+        タスクIDを取得します。
 
         Args:
             id_prefix: タスクIDのプレフィックス
-            data_and_pathss: 入力データとファイルパス情報をペアにしたlist
+            task_count: 何番目のタスクか
             chunk_size: タスクに含める入力データの個数。Noneの場合は、タスクにすべての入力データを含めます。
 
         Returns:
-            タスクと入力データの関係を示すdict
+            タスクID
         """
-
         if chunk_size is None:
-            chunked_by_tasks = iter([data_and_pathss])
-            task_id_template = "{id_prefix}"
-
-        else:
-            chunked_by_tasks = more_itertools.chunked(data_and_pathss, chunk_size)
-            task_id_template = "{id_prefix}_{task_count}"
-
-        result_dict: Dict[TaskId, List[Tuple[DataId, FilePaths]]] = {}
-        for task_count, data_list in enumerate(chunked_by_tasks):
-            task_id = task_id_template.format(id_prefix=id_prefix, task_count=task_count)
-            result_dict[TaskId(task_id)] = data_list
-
-        return result_dict
-
-    def _create_tasks(
-        self,
-        project_id: str,
-        task_to_data_dict: Dict[TaskId, List[Tuple[DataId, FilePaths]]],
-    ) -> None:
-        """タスクを作成します。
-
-        Notes:
-            タスクは数件しか作成しないことを想定しているので、同期的に`putTask`APIを実行しています。
-        """
-        task = TaskApi(self._client, project_id)
-
-        for task_id, data_id_and_pathss in task_to_data_dict.items():
-            input_data_id_list = [input_data_id for input_data_id, _ in data_id_and_pathss]
-            task.put_task(task_id, input_data_id_list)
+            return TaskId(id_prefix)
+        return TaskId(f"{id_prefix}_{task_count}")
 
+    @staticmethod
     def _label_to_cuboids(
-        self, id_to_label: Dict[str, LabelV3], labels: List[KittiLabel]
+        id_to_label: Dict[str, LabelV3], labels: KittiLabelArrays
     ) -> List[CuboidAnnotationDetailCreate]:
-        def detail_data(kitti_label: KittiLabel) -> CuboidAnnotationDetailBody:
-            # directionはrotationから計算可能で、且つ3dpc-editorでの読み込みには利用していないが、エディタで編集されない場合があるので、計算しておく  # noqa: E501
-            rotation = Rotation.from_euler("xyz", np.array([0.0, 0.0, kitti_label.yaw]))
-            direction = rotation.apply(np.array([1.0, 0.0, 0.0]))
-
+        """
+        LiDAR座標系に変換済みのラベルを、直方体アノテーションに変換します。
+        向きや中心座標は全ラベル分をまとめて計算します。
+        """
+        labels = labels.select(labels.type_mask(id_to_label.keys()))
+        annotation_ids = labels.annotation_ids if labels.annotation_ids is not None else [None] * len(labels)
+        # directionはrotationから計算可能で、且つ3dpc-editorでの読み込みには利用していないが、エディタで編集されない場合があるので、計算しておく  # noqa: E501
+        # z軸周りにyaw回転させた (1, 0, 0) = (cos(yaw), sin(yaw), 0)
+        yaws = labels.yaws.tolist()
+        front_xs = np.cos(labels.yaws).tolist()
+        front_ys = np.sin(labels.yaws).tolist()
+        sizes = labels.sizes.tolist()
+        # ラベルの座標は底面の中心、アノテーションの座標は直方体の中心
+        centers = (labels.locations + np.outer(labels.sizes[:, 0] / 2, [0.0, 0.0, 1.0])).tolist()
+
+        def detail_data(i: int) -> CuboidAnnotationDetailBody:
+            height, width, depth = sizes[i]
+            x, y, z = centers[i]
             return CuboidAnnotationDetailBody.from_shape(
                 CuboidShape(
-                    dimensions=Size(
-                        width=kitti_label.width,
-                        height=kitti_label.height,
-                        depth=kitti_label.depth,
-                    ),
-                    location=XYZ(
-                        x=kitti_label.x,
-                        y=kitti_label.y,
-                        z=kitti_label.z + (kitti_label.height / 2),
-                    ),
-                    rotation=XYZ(x=0.0, y=0.0, z=kitti_label.yaw),  # このyawがそのままでいいのか不明
+                    dimensions=Size(width=width, height=height, depth=depth),
+                    location=XYZ(x=x, y=y, z=z),
+                    rotation=XYZ(x=0.0, y=0.0, z=yaws[i]),  # このyawがそのままでいいのか不明
                     direction=CuboidDirection(
-                        front=XYZ(direction[0], direction[1], direction[2]),
+                        front=XYZ(front_xs[i], front_ys[i], 0.0),
                         up=XYZ(0, 0, 1),
                     ),
                 )
@@ -197,141 +332,295 @@ class SceneUploader:
 
         return [
             CuboidAnnotationDetailCreate(
-                annotation_id=label.annotation_id if label.annotation_id is not None else str(uuid.uuid4()),
-                label_id=label.type,
-                body=detail_data(label),
+                annotation_id=annotation_id if annotation_id is not None else str(uuid.uuid4()),
+                label_id=label_type,
+                body=detail_data(i),
                 editor_props=AnnotationPropsForEditor(can_delete=True),
             )
-            for label in labels
-            if label.type in id_to_label
+            for i, (label_type, annotation_id) in enumerate(zip(labels.types, annotation_ids))
         ]
 
-    async def _create_annotations(
+    async def _create_task(
+        self, task: TaskApi, limiter: AdaptiveLimiter, item: _TaskItem, existing_tasks: Dict[str, List[str]]
+    ) -> _TaskResult:
+        """
+        タスクを作成します。
+        同じ入力データで作成済みのタスクはスキップし、異なる入力データで作成済みのタスクは失敗として扱います。
+        """
+        task_id = item.task_id
+        input_data_id_list: List[str] = [input_data_id for input_data_id, _ in item.data_and_pathss]
+        if self._journal.is_done("task", task_id):
+            logger.debug("タスクは作成済みのためスキップします: %s", task_id)
+            return "skipped"
+
+        existing = existing_tasks.get(task_id)
+        if existing is not None:
+            if existing != input_data_id_list:
+                logger.error("タスク(=%s)は、異なる入力データで作成済みです: %s", task_id, existing)
+                return "failed"
+            logger.debug("タスクは作成済みのためスキップします: %s", task_id)
+            self._journal.record("task", task_id)
+            return "skipped"
+
+        loop = asyncio.get_running_loop()
+        try:
+            await retry_async(
+                lambda: limiter.run(
+                    lambda: loop.run_in_executor(None, task.put_task, task_id, input_data_id_list), "task"
+                ),
+                self._retry,
+                f"タスクの作成({task_id})",
+            )
+        except Exception as e:  # pylint: disable=broad-except
+            # 応答が得られずに再試行した呼び出しが、実際には成功していた場合は作成済みとなっている
+            created = await loop.run_in_executor(None, self._find_task_input_data_ids, task, task_id)
+            if created != input_data_id_list:
+                logger.error("タスク(=%s)の作成に失敗しました: %s", task_id, e)
+                return "failed"
+
+        self._journal.record("task", task_id)
+        return "created"
+
+    @staticmethod
+    def _find_task_input_data_ids(task: TaskApi, task_id: str) -> Optional[List[str]]:
+        try:
+            found = task.get_task(task_id)
+        except Exception as e:  # pylint: disable=broad-except
+            if not is_retryable(e):
+                return None
+            raise
+        return found.input_data_id_list if found is not None else None
+
+    async def _create_frame_annotations(
         self,
         task: TaskApi,
+        limiter: AdaptiveLimiter,
         id_to_label: Dict[str, LabelV3],
         task_id: TaskId,
-        pathsss: List[Tuple[DataId, List[LabelPaths]]],
-    ) -> None:
-        async def run() -> None:
-            loop = asyncio.get_event_loop()
-            for input_data_id, pathss in pathsss:
-                transformed_labels = [
-                    transformed_label
-                    for paths in pathss
-                    for calib in [read_calibration(paths.calib)]
-                    for labels in [KittiLabel.decode_path(paths.label)]
-                    for transformed_label in transform_labels_into_lidar_coordinates(labels, calib)
-                ]
-                cuboid_labels = self._label_to_cuboids(id_to_label, transformed_labels)
-
-                logger.info(
-                    "アノテーションの登録を行います: %s/%s, 登録数=%d 変換前アノテーション数=%d",
-                    task_id,
-                    input_data_id,
-                    len(cuboid_labels),
-                    len(transformed_labels),
-                )
-                await loop.run_in_executor(
-                    None,
-                    task.put_cuboid_annotations,
-                    task_id,
-                    input_data_id,
-                    cuboid_labels,
-                )
+        input_data_id: DataId,
+        pathss: List[LabelPaths],
+    ) -> Optional[int]:
+        """
+        1フレーム分のアノテーションを登録します。
 
-        if self._sem is not None:
-            async with self._sem:
-                await run()
-        else:
-            await run()
+        Returns:
+            登録したアノテーションの数。 登録済みのためスキップした場合はNone
+        """
+        journal_key = f"{task_id}/{input_data_id}"
+        if self._journal.is_done("annotation", journal_key):
+            logger.debug("アノテーションは登録済みのためスキップします: %s", journal_key)
+            return None
+
+        loop = asyncio.get_running_loop()
+        # ラベルとキャリブレーションの読み込みはイベントループを止めないように、デフォルトのThreadPoolExecutorで行う
+        transformed_labels = await loop.run_in_executor(None, _load_frame_labels, pathss)
+        cuboid_labels = [
+            cuboid for labels in transformed_labels for cuboid in self._label_to_cuboids(id_to_label, labels)
+        ]
+
+        logger.debug(
+            "アノテーションの登録を行います: %s, 登録数=%d 変換前アノテーション数=%d",
+            journal_key,
+            len(cuboid_labels),
+            sum(len(labels) for labels in transformed_labels),
+        )
+        await retry_async(
+            lambda: limiter.run(
+                lambda: loop.run_in_executor(None, task.put_cuboid_annotations, task_id, input_data_id, cuboid_labels),
+                "annotation",
+            ),
+            self._retry,
+            f"アノテーションの登録({journal_key})",
+        )
+        self._journal.record("annotation", journal_key)
+        return len(cuboid_labels)
 
     def upload_scene(self, scene: Scene, uploader_input: SceneUploaderInput) -> None:
         loop = asyncio.get_event_loop()
         loop.run_until_complete(self.upload_scene_async(scene, uploader_input))
 
-    async def _upload_data_async(
-        self,
-        input_data_id_prefix: str,
-        uploader: Uploader,
-        paths: FilePaths,
-        camera_horizontal_fov: CameraHorizontalFovKind,
-        sensor_height: Optional[float],
-        pcd_format: PcdFormat,
-    ) -> Tuple[str, List[SupplementaryData]]:
-        async def run() -> Tuple[str, List[SupplementaryData]]:
-            return await upload_async(
-                input_data_id_prefix,
-                uploader,
-                paths,
-                [],
-                camera_horizontal_fov,
-                fallback_horizontal_fov=None,
-                sensor_height=sensor_height,
-                pcd_format=pcd_format,
-            )
+    async def upload_scene_async(self, scene: Scene, uploader_input: SceneUploaderInput) -> None:
+        try:
+            await self._upload_scene_async(scene, uploader_input)
+        finally:
+            await self._uploader.close_async()
 
-        if self._sem is not None:
-            async with self._sem:
-                return await run()
-        else:
-            return await run()
+    async def _upload_scene_async(  # pylint: disable=too-many-statements
+        self, scene: Scene, uploader_input: SceneUploaderInput
+    ) -> None:
+        """
+        シーンをアップロードします。
 
-    async def upload_scene_async(self, scene: Scene, uploader_input: SceneUploaderInput) -> None:
+        以下のステージをキューでつないだパイプラインとして実行します。
+        キューの大きさには上限があるため、メモリ使用量はシーンのフレーム数ではなくキューの大きさに比例します。
+
+        1. フレームの列挙
+        2. 補助情報の準備（別プロセスで実行）
+        3. 入力データ・補助情報のアップロード
+        4. タスクの組み立て: `frame_per_task`件の入力データのアップロードが完了した時点でタスクを確定する
+        5. タスクの作成
+        6. アノテーションの登録: タスクを跨いで、フレーム単位で並行に登録する
+        """
         logger.info("upload scene: %s", scene.to_json(indent=2, ensure_ascii=False))
 
+        loop = asyncio.get_running_loop()
+        if uploader_input.validate:
+            # ラベルはアノテーションを登録する場合のみ読み込むため、それ以外ではラベルのファイルを検証しない
+            include_labels = uploader_input.kind == UploadKind.CREATE_ANNOTATION
+            report = await loop.run_in_executor(None, validate_scene, scene, self._workers, include_labels)
+            if not report.ok:
+                for issue in report.issues[:_VALIDATION_LOG_LIMIT]:
+                    logger.error("%s(%s): %s %s", issue.role.value, issue.problem.value, issue.path, issue.detail)
+                raise RuntimeError(
+                    f"シーンの参照するファイルに問題があるため、アップロードしません: {report.describe()}"
+                )
+
         uploader = self._uploader
-        pathss = self._scene_to_paths(scene)
         specs = self._project.get_annotation_specs(uploader_input.project_id)
         annofab_labels = specs.labels
         if annofab_labels is None:
             raise RuntimeError(f"対象プロジェクト(={uploader_input.project_id})のラベル設定が存在しません")
 
-        logger.info("input-dataのアップロードを開始します")
-        data_tasks = [
-            self._upload_data_async(
-                uploader_input.input_data_id_prefix,
-                uploader,
-                paths,
-                uploader_input.camera_horizontal_fov,
-                uploader_input.sensor_height,
-                PcdFormat(scene.velodyne.format),
-            )
-            for paths in pathss
-        ]
-        input_ids = [DataId(input_data_id) for input_data_id, _ in await asyncio.gather(*data_tasks)]
-        data_and_pathss = list(zip(input_ids, pathss))
-        logger.info("%d件のデータをアップロードしました", len(data_and_pathss))
-        if uploader_input.kind == UploadKind.DATA_ONLY:
-            return
-
-        task_to_data_dict = self._get_task_to_data_dict(
-            uploader_input.task_id_prefix,
-            data_and_pathss,
-            uploader_input.frame_per_task,
-        )
-
-        logger.info("タスクを%d件作成します。", len(task_to_data_dict))
-        self._create_tasks(uploader_input.project_id, task_to_data_dict)
-        logger.info("%d件のタスクを作成しました", len(task_to_data_dict))
-        if uploader_input.kind == UploadKind.CREATE_TASK:
-            return
-
         id_to_label: Dict[str, LabelV3] = {
             anno_label.label_id: anno_label for anno_label in annofab_labels if anno_label.label_id is not None
         }
 
-        annotation_tasks = [
-            self._create_annotations(
-                TaskApi(self._client, uploader_input.project_id),
-                id_to_label,
-                task_id,
-                data_and_label_pathss,
+        # forceモード以外では入力データのidを利用しないため、全フレームを走査しないように遅延評価で渡す
+        await loop.run_in_executor(
+            None,
+            uploader.prepare,
+            (create_input_data_id(uploader_input.input_data_id_prefix, paths) for paths in self._scene_to_paths(scene)),
+        )
+
+        workers = self._workers
+        queue_size = workers * _QUEUE_SIZE_PER_WORKER
+        frame_count = len(scene.id_list)
+        chunk_size = uploader_input.frame_per_task if uploader_input.frame_per_task is not None else frame_count
+        pcd_format = PcdFormat(scene.velodyne.format)
+        create_task = uploader_input.kind != UploadKind.DATA_ONLY
+        create_annotation = uploader_input.kind == UploadKind.CREATE_ANNOTATION
+        task_api = TaskApi(self._client, uploader_input.project_id)
+        existing_tasks: Dict[str, List[str]] = {}
+        if create_task:
+            # 作成済みのタスクは、タスクごとに問い合わせずに一括で取得しておく
+            existing_tasks = await loop.run_in_executor(
+                None, task_api.get_task_input_data_ids, uploader_input.task_id_prefix
             )
-            for task_id, data_id_and_pathss in task_to_data_dict.items()
-            for data_and_label_pathss in [[(data_id, pathss.labels) for data_id, pathss in data_id_and_pathss]]
-        ]
 
-        await asyncio.gather(*annotation_tasks)
+        frame_queue: "asyncio.Queue[Optional[Tuple[int, FilePaths]]]" = asyncio.Queue(queue_size)
+        prepared_queue: "asyncio.Queue[Optional[_PreparedItem]]" = asyncio.Queue(queue_size)
+        uploaded_queue: "asyncio.Queue[Optional[_UploadedItem]]" = asyncio.Queue(queue_size)
+        task_queue: "asyncio.Queue[Optional[_TaskItem]]" = asyncio.Queue(queue_size)
+        annotation_workers = self._annotation_workers
+        annotation_queue: "asyncio.Queue[Optional[_AnnotationItem]]" = asyncio.Queue(
+            annotation_workers * _QUEUE_SIZE_PER_WORKER
+        )
+        task_results: Dict[_TaskResult, int] = {"created": 0, "skipped": 0, "failed": 0}
+        # アップロード・タスクの作成・アノテーションの登録で、APIの応答に応じて調整する並行数の上限を共有する
+        limiter = AdaptiveLimiter(max(workers, annotation_workers))
+        progress = _Progress(limiter)
+
+        prepare_workers = self._prepare_workers
+        prepare_executor = create_prepare_executor(prepare_workers)
+        # 補助情報はワーカープロセスで作成するため、キャリブレーションのキャッシュの統計はワーカーから受け取って集計する
+        calib_stats = CalibCacheStatsCollector()
+
+        async def enumerate_frames() -> None:
+            for index, paths in enumerate(self._scene_to_paths(scene)):
+                await frame_queue.put((index, paths))
+            for _ in range(prepare_workers):
+                await frame_queue.put(None)
+
+        async def prepare_worker() -> None:
+            while (item := await frame_queue.get()) is not None:
+                index, paths = item
+                prepared = await loop.run_in_executor(
+                    prepare_executor,
+                    prepare_upload,
+                    uploader_input.input_data_id_prefix,
+                    paths,
+                    [],
+                    uploader_input.camera_horizontal_fov,
+                    None,
+                    uploader_input.sensor_height,
+                    pcd_format,
+                    uploader_input.downsample,
+                    uploader_input.crop,
+                )
+                calib_stats.add(prepared.calib_cache_stats)
+                await prepared_queue.put(_PreparedItem(index, prepared))
+
+        async def upload_worker() -> None:
+            while (item := await prepared_queue.get()) is not None:
+                # フレーム全体ではなく、ストレージへのアップロードとAPI呼び出しの1件ごとに並行数を制限する
+                input_data_id, _ = await retry_async(
+                    lambda: upload_prepared_async(uploader, item.prepared, limiter),
+                    self._retry,
+                    f"入力データのアップロード({item.prepared.input_data_id})",
+                )
+                progress.add_data()
+                if create_task:
+                    await uploaded_queue.put(_UploadedItem(item.index, DataId(input_data_id), item.prepared.paths))
+
+        async def assemble_tasks() -> None:
+            chunks: Dict[int, Dict[int, _UploadedItem]] = {}
+            while (item := await uploaded_queue.get()) is not None:
+                task_count = item.index // chunk_size
+                chunk = chunks.setdefault(task_count, {})
+                chunk[item.index] = item
+                if len(chunk) == min(chunk_size, frame_count - task_count * chunk_size):
+                    del chunks[task_count]
+                    task_id = self._get_task_id(
+                        uploader_input.task_id_prefix, task_count, uploader_input.frame_per_task
+                    )
+                    data_and_pathss = [(chunk[index].data_id, chunk[index].paths) for index in sorted(chunk)]
+                    await task_queue.put(_TaskItem(task_id, data_and_pathss))
+
+        async def create_tasks() -> None:
+            while (item := await task_queue.get()) is not None:
+                result = await self._create_task(task_api, limiter, item, existing_tasks)
+                task_results[result] += 1
+                if create_annotation and result != "failed":
+                    # アノテーションはタスクを跨いでフレーム単位で並行に登録する
+                    for data_id, paths in item.data_and_pathss:
+                        await annotation_queue.put(_AnnotationItem(item.task_id, data_id, paths.labels))
+
+        async def annotation_worker() -> None:
+            while (item := await annotation_queue.get()) is not None:
+                annotations = await self._create_frame_annotations(
+                    task_api, limiter, id_to_label, item.task_id, item.data_id, item.label_pathss
+                )
+                progress.add_annotations(annotations)
+
+        stages: List[Awaitable[None]] = [
+            enumerate_frames(),
+            _run_workers(prepare_worker, prepare_workers, prepared_queue, workers),
+            _run_workers(upload_worker, workers, uploaded_queue if create_task else None, 1),
+        ]
+        if create_task:
+            stages.append(_run_workers(assemble_tasks, 1, task_queue, workers))
+            stages.append(
+                _run_workers(create_tasks, workers, annotation_queue if create_annotation else None, annotation_workers)
+            )
+        if create_annotation:
+            stages.append(_run_workers(annotation_worker, annotation_workers, None, 0))
 
-        logger.info("アノテーションの登録が完了しました")
+        logger.info("input-dataのアップロードを開始します")
+        try:
+            await _run_stages(stages)
+        finally:
+            prepare_executor.shutdown(cancel_futures=True)
+
+        logger.info("%d件のデータをアップロードしました", progress.data)
+        logger.info("%s", calib_stats.total().describe())
+        if create_task:
+            logger.info(
+                "タスクの作成が完了しました: 作成=%d件, スキップ=%d件, 失敗=%d件",
+                task_results["created"],
+                task_results["skipped"],
+                task_results["failed"],
+            )
+        if create_annotation:
+            progress.log("アノテーションの登録が完了しました")
+        if task_results["failed"] > 0:
+            raise RuntimeError(f"{task_results['failed']}件のタスクの作成に失敗しました。 ログを確認してください")
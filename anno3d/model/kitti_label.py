@@ -1,6 +1,17 @@
+import io
+import itertools
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
-from typing import ClassVar, List, Optional
+from typing import ClassVar, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+_KITTI_FIELDS = 15
+"""KITTI形式のラベルの1行あたりの列数（スコアとアノテーションIDを除く）"""
+
+_VECTORIZE_MIN_LINES = 32
+"""`KittiLabelArrays.decode_many`で、数値の列をnp.loadtxtでまとめて変換する最小の行数"""
 
 
 @dataclass(frozen=True)
@@ -50,3 +61,195 @@ class KittiLabel:
             return []
         with csv_path.open("r") as reader:
             return cls.decode_many(reader.read())
+
+
+@dataclass(frozen=True)
+class KittiLabelArrays:
+    """
+    KITTIラベルを、フィールドごとの配列として保持するクラスです。
+    座標変換などを、ラベルごとではなく配列に対してまとめて行うために利用します。
+    `KittiLabel`が必要な場合は、`iter_labels`で1件ずつ生成できます。
+    """
+
+    type_names: Tuple[str, ...]
+    """ラベルの種類の一覧。 `type_codes`はこの一覧のインデックス"""
+    type_codes: np.ndarray
+    """(ラベル数,)の整数配列"""
+    annotation_ids: Optional[List[Optional[str]]]
+    """ラベルごとのアノテーションID。 アノテーションIDを持つラベルが1つも無い場合はNone"""
+    sizes: np.ndarray
+    """(ラベル数, 3)の配列。 各行は (height, width, depth)"""
+    locations: np.ndarray
+    """(ラベル数, 3)の配列。 各行は底面の中心座標 (x, y, z)"""
+    yaws: np.ndarray
+    """(ラベル数,)の配列"""
+
+    def __len__(self) -> int:
+        return len(self.type_codes)
+
+    @property
+    def types(self) -> List[str]:
+        return [self.type_names[code] for code in self.type_codes.tolist()]
+
+    def type_mask(self, types: Iterable[str]) -> np.ndarray:
+        """
+        ラベルの種類が`types`に含まれるかどうかを表すbool配列を求めます。
+        """
+        targets = set(types)
+        mask: np.ndarray = np.array([name in targets for name in self.type_names], dtype=bool)[self.type_codes]
+        return mask
+
+    def select(self, mask: np.ndarray) -> "KittiLabelArrays":
+        """
+        `mask`がTrueのラベルのみを取り出します。
+        """
+        return KittiLabelArrays(
+            self.type_names,
+            self.type_codes[mask],
+            None if self.annotation_ids is None else [self.annotation_ids[i] for i in np.flatnonzero(mask).tolist()],
+            self.sizes[mask],
+            self.locations[mask],
+            self.yaws[mask],
+        )
+
+    @classmethod
+    def empty(cls) -> "KittiLabelArrays":
+        return KittiLabelArrays((), np.empty(0, dtype=np.int32), None, np.empty((0, 3)), np.empty((0, 3)), np.empty(0))
+
+    @classmethod
+    def from_labels(cls, labels: List[KittiLabel]) -> "KittiLabelArrays":
+        if len(labels) == 0:
+            return cls.empty()
+        type_names, type_codes = np.unique([label.type for label in labels], return_inverse=True)
+        annotation_ids = [label.annotation_id for label in labels]
+        return KittiLabelArrays(
+            tuple(type_names.tolist()),
+            type_codes.reshape(-1).astype(np.int32),
+            annotation_ids if any(annotation_id is not None for annotation_id in annotation_ids) else None,
+            np.array([[label.height, label.width, label.depth] for label in labels], dtype=np.float64),
+            np.array([[label.x, label.y, label.z] for label in labels], dtype=np.float64),
+            np.array([label.yaw for label in labels], dtype=np.float64),
+        )
+
+    @classmethod
+    def concat(cls, arrays: List["KittiLabelArrays"]) -> "KittiLabelArrays":
+        """
+        複数のラベルを1つにまとめます。 ラベルの並び順は`arrays`の順です。
+        """
+        if len(arrays) == 0:
+            return cls.empty()
+        type_names = tuple(sorted({name for array in arrays for name in array.type_names}))
+        name_to_code = {name: code for code, name in enumerate(type_names)}
+        type_codes = np.concatenate(
+            [
+                np.array([name_to_code[name] for name in array.type_names], dtype=np.int32)[array.type_codes]
+                for array in arrays
+            ]
+        )
+        has_annotation_ids = any(array.annotation_ids is not None for array in arrays)
+        return KittiLabelArrays(
+            type_names,
+            type_codes,
+            [annotation_id for array in arrays for annotation_id in (array.annotation_ids or [None] * len(array))]
+            if has_annotation_ids
+            else None,
+            np.concatenate([array.sizes for array in arrays]),
+            np.concatenate([array.locations for array in arrays]),
+            np.concatenate([array.yaws for array in arrays]),
+        )
+
+    def iter_labels(self) -> Iterator[KittiLabel]:
+        """
+        `KittiLabel`を1件ずつ生成します。
+        """
+        annotation_ids: Iterable[Optional[str]] = (
+            self.annotation_ids if self.annotation_ids is not None else itertools.repeat(None)
+        )
+        for label_type, (height, width, depth), (x, y, z), yaw, annotation_id in zip(
+            self.types, self.sizes.tolist(), self.locations.tolist(), self.yaws.tolist(), annotation_ids
+        ):
+            yield KittiLabel(label_type, height, width, depth, x, y, z, yaw, annotation_id)
+
+    def to_labels(self) -> List[KittiLabel]:
+        return list(self.iter_labels())
+
+    @classmethod
+    def decode_many(cls, csv: str) -> "KittiLabelArrays":
+        if len(csv.strip()) == 0:
+            return cls.empty()
+
+        rows: Optional[List[List[str]]] = None
+        if csv.count("\n") < _VECTORIZE_MIN_LINES:
+            # 行数が少ない場合は、np.loadtxtの固定のオーバーヘッドの方が大きいため、行ごとに変換する
+            rows = [fields for fields in (line.split() for line in csv.splitlines()) if len(fields) > 0]
+            values = np.array([fields[8:15] for fields in rows], dtype=np.float64).reshape(-1, 7)
+        else:
+            # height, width, depth, x, y, z, yaw の列は、行ごとに分割せずにまとめて数値に変換する
+            values = np.loadtxt(io.StringIO(csv), dtype=np.float64, comments=None, usecols=range(8, 15), ndmin=2)
+            tokens = csv.split()
+            if len(tokens) != len(values) * _KITTI_FIELDS:
+                # スコアやアノテーションIDの列を持つ行がある場合のみ、行ごとに分割する
+                rows = [fields for fields in (line.split() for line in csv.splitlines()) if len(fields) > 0]
+
+        annotation_ids: Optional[List[Optional[str]]] = None
+        if rows is None:
+            # np.loadtxtで全行が15列以上あることを確認済みのため、分割結果の数が一致すれば全行が15列のみ
+            types = tokens[::_KITTI_FIELDS]
+        else:
+            types = [fields[0] for fields in rows]
+            if any(len(fields) > 16 for fields in rows):
+                annotation_ids = [fields[16] if len(fields) > 16 else None for fields in rows]
+
+        ignore_types = set(KittiLabel.ignore_types)
+        if not ignore_types.isdisjoint(types):
+            keep = [name not in ignore_types for name in types]
+            types = [name for name, kept in zip(types, keep) if kept]
+            values = values[np.array(keep, dtype=bool)]
+            if annotation_ids is not None:
+                annotation_ids = [annotation_id for annotation_id, kept in zip(annotation_ids, keep) if kept]
+                if all(annotation_id is None for annotation_id in annotation_ids):
+                    annotation_ids = None
+        if len(types) == 0:
+            return cls.empty()
+
+        type_names = sorted(set(types))
+        name_to_code = {name: code for code, name in enumerate(type_names)}
+        return KittiLabelArrays(
+            tuple(type_names),
+            np.array([name_to_code[name] for name in types], dtype=np.int32),
+            annotation_ids,
+            values[:, 0:3],
+            values[:, 3:6],
+            values[:, 6],
+        )
+
+    @classmethod
+    def decode_path(cls, csv_path: Path) -> "KittiLabelArrays":
+        if not csv_path.exists():
+            return cls.empty()
+        with csv_path.open("r") as reader:
+            return cls.decode_many(reader.read())
+
+    @classmethod
+    def decode_paths(cls, csv_paths: List[Path], max_workers: Optional[int] = None) -> List["KittiLabelArrays"]:
+        """
+        複数のラベルファイルを並行して読み込みます。
+
+        Returns:
+            `csv_paths`と同じ順に並んだ読み込み結果
+        """
+        if len(csv_paths) <= 1:
+            return [cls.decode_path(csv_path) for csv_path in csv_paths]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(cls.decode_path, csv_paths))
+
+    @classmethod
+    def decode_dir(cls, label_dir: Path, max_workers: Optional[int] = None) -> Dict[str, "KittiLabelArrays"]:
+        """
+        ディレクトリ内の全ラベルファイル（*.txt）を並行して読み込みます。
+
+        Returns:
+            フレームID（拡張子を除いたファイル名）から読み込み結果へのdict
+        """
+        csv_paths = sorted(label_dir.glob("*.txt"))
+        return dict(zip((csv_path.stem for csv_path in csv_paths), cls.decode_paths(csv_paths, max_workers)))
@@ -1,11 +1,14 @@
 import json
+import os
 from dataclasses import dataclass, replace
 from pathlib import Path
-from typing import ClassVar, List, Literal, Optional, Type, cast
+from typing import Callable, ClassVar, List, Literal, Optional, Type, cast
 
 from dataclasses_json import DataClassJsonMixin
 from more_itertools import first_true
 
+from anno3d.util.file_scan import iter_file_names
+
 
 @dataclass(frozen=True)
 class Series(DataClassJsonMixin):
@@ -43,6 +46,12 @@ class CameraViewSettings(DataClassJsonMixin):
 
 @dataclass(frozen=True)
 class KittiImageSeries(Series):
+    """
+    Args:
+        calib_dir: フレームごとのキャリブレーションファイル（`{frame_id}.txt`）の配置ディレクトリ
+        calib_file: シーン全体で共通のキャリブレーションファイル。 指定した場合は`calib_dir`より優先する
+    """
+
     image_dir: str
     calib_dir: Optional[str] = None
     camera_view_setting: Optional[CameraViewSettings] = None
@@ -50,15 +59,45 @@ class KittiImageSeries(Series):
     type: str = "kitti_image"
     type_value: ClassVar[str] = "kitti_image"
     file_extension: str = "png"
+    calib_file: Optional[str] = None
+
+    def calib_path(self, frame_id: str) -> Optional[Path]:
+        """
+        フレームに対応するキャリブレーションファイルのパスを取得します。 キャリブレーションデータが無い場合はNone
+        """
+        if self.calib_file is not None:
+            return Path(self.calib_file)
+        if self.calib_dir is not None:
+            return Path(self.calib_dir) / f"{frame_id}.txt"
+        return None
 
 
 @dataclass(frozen=True)
 class KittiLabelSeries(Series):
+    """
+    Args:
+        calib_dir: フレームごとのキャリブレーションファイル（`{frame_id}.txt`）の配置ディレクトリ
+        calib_file: シーン全体で共通のキャリブレーションファイル。 指定した場合は`calib_dir`より優先する
+
+    `calib_dir`と`calib_file`の何れかは必須です。
+    """
+
     label_dir: str
     image_dir: str
-    calib_dir: str
+    calib_dir: Optional[str] = None
     type: str = "kitti_label"
     type_value: ClassVar[str] = "kitti_label"
+    calib_file: Optional[str] = None
+
+    def calib_path(self, frame_id: str) -> Path:
+        """
+        フレームに対応するキャリブレーションファイルのパスを取得します。
+        """
+        if self.calib_file is not None:
+            return Path(self.calib_file)
+        if self.calib_dir is not None:
+            return Path(self.calib_dir) / f"{frame_id}.txt"
+        raise RuntimeError(f"kitti_label(={self.label_dir})に、calib_dirとcalib_fileの何れも指定されていません")
 
 
 @dataclass(frozen=True)
@@ -114,27 +153,60 @@ class Scene(DataClassJsonMixin):
                 f"kitti_velodyneのformatはxyziかxyzirgbである必要がありますが、{velodyne.format}が指定されています"
             )
 
-        def convert_path(path: str) -> str:
-            return (scene_dir / path).as_posix()
+        images = [image for image in json_scene.serieses if isinstance(image, KittiImageSeries)]
+        labels = [label for label in json_scene.serieses if isinstance(label, KittiLabelSeries)]
+        for label in labels:
+            if label.calib_dir is None and label.calib_file is None:
+                raise RuntimeError(f"kitti_label(={label.label_dir})には、calib_dirかcalib_fileが必要です")
+
+        return Scene(json_scene.id_list, velodyne, images, labels)._convert_paths(
+            lambda path: (scene_dir / path).as_posix()
+        )
+
+    def encode(self) -> str:
+        """
+        `decode`で読み込める、scene.metaファイルの内容を作成します。
+        """
+        serieses: List[Series] = [self.velodyne, *self.images, *self.labels]
+        return json.dumps(
+            {"id_list": self.id_list, "serieses": [series.to_dict() for series in serieses]},
+            ensure_ascii=False,
+            indent=2,
+        )
 
-        velodyne = replace(velodyne, velodyne_dir=convert_path(velodyne.velodyne_dir))
+    def _convert_paths(self, convert_path: Callable[[str], str]) -> "Scene":
+        def convert_opt(path: Optional[str]) -> Optional[str]:
+            return convert_path(path) if path is not None else None
 
         def convert_image(image: KittiImageSeries) -> KittiImageSeries:
-            calib_dir = convert_path(image.calib_dir) if image.calib_dir is not None else None
-            return replace(image, image_dir=convert_path(image.image_dir), calib_dir=calib_dir)
+            return replace(
+                image,
+                image_dir=convert_path(image.image_dir),
+                calib_dir=convert_opt(image.calib_dir),
+                calib_file=convert_opt(image.calib_file),
+            )
 
         def convert_label(label: KittiLabelSeries) -> KittiLabelSeries:
             return replace(
                 label,
                 label_dir=convert_path(label.label_dir),
                 image_dir=convert_path(label.image_dir),
-                calib_dir=convert_path(label.calib_dir),
+                calib_dir=convert_opt(label.calib_dir),
+                calib_file=convert_opt(label.calib_file),
             )
 
-        images = [convert_image(image) for image in json_scene.serieses if isinstance(image, KittiImageSeries)]
-        labels = [convert_label(label) for label in json_scene.serieses if isinstance(label, KittiLabelSeries)]
+        return Scene(
+            self.id_list,
+            replace(self.velodyne, velodyne_dir=convert_path(self.velodyne.velodyne_dir)),
+            [convert_image(image) for image in self.images],
+            [convert_label(label) for label in self.labels],
+        )
 
-        return Scene(json_scene.id_list, velodyne, images, labels)
+    def absolute(self) -> "Scene":
+        """
+        各シリーズのパスを絶対パスにしたSceneを返します。
+        """
+        return self._convert_paths(lambda path: Path(path).absolute().as_posix())
 
     @classmethod
     def decode_path(cls, json_file: Path) -> "Scene":
@@ -149,8 +221,7 @@ class Scene(DataClassJsonMixin):
         label_dir = path / Defaults.label_dir
 
         # 画像名から拡張子を取り除いたものがid
-        id_list = [file.stem for file in image_dir.iterdir() if file.is_file()]
-        id_list.sort()
+        id_list = sorted(os.path.splitext(name)[0] for name in iter_file_names(image_dir))
 
         return Scene(
             id_list=id_list,
@@ -0,0 +1,213 @@
+import itertools
+import logging
+import os
+import stat
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from enum import Enum
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from dataclasses_json import DataClassJsonMixin
+
+from anno3d.file_paths_loader import ScenePathsLoader
+from anno3d.kitti.point_cloud import point_dtype
+from anno3d.model.file_paths import FilePaths
+from anno3d.model.frame import PcdFormat
+from anno3d.model.scene import Scene
+
+logger = logging.getLogger(__name__)
+
+_DEFAULT_WORKERS = 32
+"""`max_workers`が指定されなかった場合の、statを並行に実行するスレッド数"""
+
+_STAT_CHUNK_SIZE = 256
+"""1つのスレッドにまとめて渡すパスの数"""
+
+
+class FileRole(Enum):
+    """シーン内でのファイルの用途"""
+
+    VELODYNE = "velodyne"
+    IMAGE = "image"
+    IMAGE_CALIB = "image_calib"
+    LABEL = "label"
+    LABEL_CALIB = "label_calib"
+
+
+class FileProblem(Enum):
+    """
+    ファイルの問題の種類
+
+    * missing: ファイルが存在しない
+    * not_file: 通常のファイルではない（ディレクトリなど）
+    * invalid_size: 点群ファイルのサイズが、formatの1点あたりのサイズの倍数ではない
+    * inaccessible: 権限が無いなどの理由でstatに失敗した
+    """
+
+    MISSING = "missing"
+    NOT_FILE = "not_file"
+    INVALID_SIZE = "invalid_size"
+    INACCESSIBLE = "inaccessible"
+
+
+@dataclass(frozen=True)
+class FileIssue(DataClassJsonMixin):
+    path: str
+    role: FileRole
+    problem: FileProblem
+    detail: str
+    frame_ids: List[str]
+    """このファイルを参照するフレームのID。 シーン全体で共通のキャリブレーションファイルの場合は全フレーム"""
+
+
+@dataclass(frozen=True)
+class SceneValidationReport(DataClassJsonMixin):
+    frames: int
+    """検証したフレーム数"""
+    files: int
+    """statを行ったファイル数（重複を除く）"""
+    invalid_frames: int
+    """問題のあるファイルを参照しているフレーム数"""
+    elapsed_seconds: float
+    issues: List[FileIssue] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return len(self.issues) == 0
+
+    def describe(self) -> str:
+        counts: Dict[Tuple[FileRole, FileProblem], int] = {}
+        for issue in self.issues:
+            key = (issue.role, issue.problem)
+            counts[key] = counts.get(key, 0) + 1
+        details = ", ".join(f"{role.value}/{problem.value}={count}件" for (role, problem), count in counts.items())
+        return (
+            f"フレーム={self.frames}件, ファイル={self.files}件, 問題のあるフレーム={self.invalid_frames}件"
+            f"({self.elapsed_seconds:.1f}秒)" + (f": {details}" if details else "")
+        )
+
+
+@dataclass
+class _Target:
+    path: str
+    role: FileRole
+    frame_ids: List[str]
+
+
+_StatResult = Union[os.stat_result, OSError]
+
+
+def _stat_all(paths: List[str]) -> List[_StatResult]:
+    results: List[_StatResult] = []
+    for path in paths:
+        try:
+            results.append(os.stat(path))
+        except OSError as e:
+            results.append(e)
+    return results
+
+
+def _check(target: _Target, result: _StatResult, itemsize: int) -> Optional[FileIssue]:
+    def issue(problem: FileProblem, detail: str) -> FileIssue:
+        return FileIssue(target.path, target.role, problem, detail, target.frame_ids)
+
+    if isinstance(result, (FileNotFoundError, NotADirectoryError)):
+        return issue(FileProblem.MISSING, "ファイルが存在しません")
+    if isinstance(result, OSError):
+        return issue(FileProblem.INACCESSIBLE, str(result))
+    if not stat.S_ISREG(result.st_mode):
+        return issue(FileProblem.NOT_FILE, "通常のファイルではありません")
+    if target.role == FileRole.VELODYNE and result.st_size % itemsize != 0:
+        return issue(
+            FileProblem.INVALID_SIZE,
+            f"ファイルサイズ(={result.st_size}byte)が、1点あたりのサイズ(={itemsize}byte)の倍数ではありません",
+        )
+    return None
+
+
+def validate_file_paths(
+    pathss: Iterable[FilePaths],
+    pcd_format: PcdFormat,
+    max_workers: Optional[int] = None,
+    include_labels: bool = True,
+) -> SceneValidationReport:
+    """
+    各フレームが参照するファイル（点群・画像・ラベル・キャリブレーション）を検証します。
+
+    ファイルの中身は読み込まず、statのみで存在・種別・点群ファイルのサイズを確認します。
+    ネットワークストレージではstat1回ごとの待ち時間が大きいため、重複を除いたパスに対してstatを並行に実行します。
+
+    Args:
+        pathss: 検証するフレームのファイルパス
+        pcd_format: 点群ファイルのformat
+        max_workers: statを並行に実行するスレッド数。 Noneの場合は`_DEFAULT_WORKERS`
+        include_labels: ラベルとそのキャリブレーションファイルを検証するか否か。 アノテーションを登録しない場合はFalse
+
+    Returns:
+        検証結果
+    """
+    started = time.monotonic()
+    # Pathのハッシュ値の計算は遅いため、文字列のパスで集計する
+    targets: Dict[Tuple[str, FileRole], _Target] = {}
+
+    def add(path: Path, role: FileRole, frame_id: str) -> None:
+        key = (path.as_posix(), role)
+        target = targets.get(key)
+        if target is None:
+            targets[key] = _Target(key[0], role, [frame_id])
+        else:
+            target.frame_ids.append(frame_id)
+
+    frame_count = 0
+    for paths in pathss:
+        frame_id = paths.key.id
+        frame_count += 1
+        add(paths.pcd, FileRole.VELODYNE, frame_id)
+        for image in paths.images:
+            add(image.image, FileRole.IMAGE, frame_id)
+            if image.calib is not None:
+                add(image.calib, FileRole.IMAGE_CALIB, frame_id)
+        for label in paths.labels if include_labels else []:
+            add(label.label, FileRole.LABEL, frame_id)
+            add(label.calib, FileRole.LABEL_CALIB, frame_id)
+
+    # 画像とラベルで同じキャリブレーションファイルを参照する場合などに、同じパスを何度もstatしない
+    unique_paths = list(dict.fromkeys(target.path for target in targets.values()))
+    chunks = [unique_paths[i : i + _STAT_CHUNK_SIZE] for i in range(0, len(unique_paths), _STAT_CHUNK_SIZE)]
+    workers = max_workers if max_workers is not None else _DEFAULT_WORKERS
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(chunks)))) as executor:
+        results = dict(zip(unique_paths, itertools.chain.from_iterable(executor.map(_stat_all, chunks))))
+
+    itemsize = point_dtype(pcd_format).itemsize
+    issues = [
+        issue
+        for target in targets.values()
+        for issue in [_check(target, results[target.path], itemsize)]
+        if issue is not None
+    ]
+    invalid_frames = {frame_id for issue in issues for frame_id in issue.frame_ids}
+    return SceneValidationReport(
+        frames=frame_count,
+        files=len(unique_paths),
+        invalid_frames=len(invalid_frames),
+        elapsed_seconds=time.monotonic() - started,
+        issues=issues,
+    )
+
+
+def validate_scene(
+    scene: Scene, max_workers: Optional[int] = None, include_labels: bool = True
+) -> SceneValidationReport:
+    """
+    シーンのアップロード・変換で参照する全ファイルを検証します。 詳細は`validate_file_paths`を参照してください。
+    """
+    report = validate_file_paths(
+        ScenePathsLoader(scene).iter_paths(),
+        PcdFormat(scene.velodyne.format),
+        max_workers=max_workers,
+        include_labels=include_labels,
+    )
+    logger.info("シーンのファイルを検証しました: %s", report.describe())
+    return report
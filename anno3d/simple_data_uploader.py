@@ -1,22 +1,31 @@
 import asyncio
+import dataclasses
+import functools
 import logging
 import math
-import shutil
-import tempfile
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor
 from dataclasses import dataclass
+from itertools import repeat
 from pathlib import Path
 from typing import List, Literal, Optional, Tuple
 
 import numpy as np
+from dataclasses_json import DataClassJsonMixin
 from scipy.spatial.transform import Rotation
 
-from anno3d.annofab.uploader import Uploader
+from anno3d.annofab.concurrency import AdaptiveLimiter
+from anno3d.annofab.uploader import Uploader, UploadSource
+from anno3d.calib_cache import CalibCacheStatsCollector, ProcessCalibCacheStats, process_stats
 from anno3d.calib_loader import read_kitti_calib
 from anno3d.kitti.camera_horizontal_fov_provider import (
     CameraHorizontalFovKind,
     CameraHorizontalFovProvider,
     create_camera_horizontal_fov_provider,
 )
+from anno3d.kitti.crop import AreaCropSettings, crop_file
+from anno3d.kitti.downsample import VoxelDownsampleSettings, downsample_file
+from anno3d.kitti.point_cloud import count_points
 from anno3d.model.common import Vector3
 from anno3d.model.file_paths import FilePaths, filepaths_to_image_names
 from anno3d.model.frame import FrameMetaData, ImagesMetaData, PcdFormat, PointCloudMetaData
@@ -24,6 +33,7 @@ from anno3d.model.image import ImageCamera, ImageCameraFov, ImageMeta
 from anno3d.model.input_files import InputData, InputDataBody, Supplementary, SupplementaryBody
 from anno3d.model.scene import CameraViewSettings
 from anno3d.supplementary_id import camera_image_calib_id, camera_image_id, frame_meta_id
+from anno3d.util.file_link import LinkMode, place_file
 
 logger = logging.getLogger(__name__)
 
@@ -31,13 +41,29 @@ logger = logging.getLogger(__name__)
 @dataclass
 class SupplementaryData:
     data_id: str
-    path: Path
+    data: UploadSource
+    """補助情報のファイルのパス、またはシリアライズ済みの内容"""
     data_type: Literal["custom", "image", "text"]
     content_type: Optional[str] = None
 
 
+def write_supplementary(parent_dir: Path, supplementary: SupplementaryData) -> SupplementaryData:
+    """
+    メモリ上にある補助情報の内容を`parent_dir`にファイルとして書き出し、そのパスを持つ補助情報を返します。
+    """
+    if isinstance(supplementary.data, Path):
+        return supplementary
+
+    file = parent_dir / supplementary.data_id
+    file.write_bytes(supplementary.data)
+    return dataclasses.replace(supplementary, data=file)
+
+
+def _serialize_meta(meta: DataClassJsonMixin) -> bytes:
+    return meta.to_json(ensure_ascii=False, indent=3).encode("UTF-8")
+
+
 def create_frame_meta(
-    parent_dir: Path,
     input_data_id: str,
     image_names: List[str],
     sensor_height: Optional[float],
@@ -57,38 +83,25 @@ def create_frame_meta(
         ImagesMetaData(image_names=image_names),
     )
 
-    file = parent_dir / data_id
-    with file.open("w", encoding="UTF-8") as writer:
-        writer.write(meta.to_json(ensure_ascii=False, indent=3))
-
-    return SupplementaryData(data_id, file, "text", content_type="application/json")
+    return SupplementaryData(data_id, _serialize_meta(meta), "text", content_type="application/json")
 
 
-def _create_image_meta(
-    parent_dir: Path,
+@functools.lru_cache(maxsize=256)
+def _serialize_image_meta(
     calib_path: Optional[Path],
-    input_data_id: str,
-    number: int,
+    _calib_mtime_ns: Optional[int],
     settings: Optional[CameraViewSettings],
-    camera_horizontal_fov: CameraHorizontalFovProvider,
-) -> SupplementaryData:
+    horizontal_fov: float,
+) -> bytes:
     """
-
-    Args:
-        parent_dir:
-        calib_path:
-        input_data_id:
-        number:
-        camera_horizontal_fov: カメラの水平方向視野角の取得器。
-
-    Returns:
-
+    画像のメタデータをシリアライズします。
+    メタデータは入力データに依存しないため、シーン全体で共通のキャリブレーションファイルを利用する場合は、
+    全フレームで同じ結果を使い回します。 `_calib_mtime_ns`は、ファイルが更新された場合に作り直すためのキーです。
     """
-    data_id = camera_image_calib_id(input_data_id, number)
 
     # http://www.cvlibs.net/publications/Geiger2012CVPR.pdf 2.1. Sensors and Data Acquisition によると
     # カメラの画角は 90度 * 35度　らしい
-    fov = ImageCameraFov(camera_horizontal_fov.value(), 35.0 / 180.0 * math.pi)
+    fov = ImageCameraFov(horizontal_fov, 35.0 / 180.0 * math.pi)
     camera_position = Vector3(0, 0, 1.65 - 1.73)  # kittiにおける カメラ設置高(1.65) - velodyne設置高(1.73)
     yaw = 0.0
 
@@ -109,15 +122,34 @@ def _create_image_meta(
             camera_position=camera_position,
         ),
     )
+    return _serialize_meta(meta)
+
+
+def _create_image_meta(
+    calib_path: Optional[Path],
+    input_data_id: str,
+    number: int,
+    settings: Optional[CameraViewSettings],
+    camera_horizontal_fov: CameraHorizontalFovProvider,
+) -> SupplementaryData:
+    """
 
-    file = parent_dir / data_id
-    with file.open("w", encoding="UTF-8") as writer:
-        writer.write(meta.to_json(ensure_ascii=False, indent=3))
+    Args:
+        calib_path:
+        input_data_id:
+        number:
+        camera_horizontal_fov: カメラの水平方向視野角の取得器。
 
-    return SupplementaryData(data_id, file, "text", content_type="application/json")
+    Returns:
 
+    """
+    data_id = camera_image_calib_id(input_data_id, number)
+    calib_mtime_ns = calib_path.stat().st_mtime_ns if calib_path is not None else None
+    data = _serialize_image_meta(calib_path, calib_mtime_ns, settings, camera_horizontal_fov.value())
+    return SupplementaryData(data_id, data, "text", content_type="application/json")
 
-def _create_dummy_image_meta(parent_dir: Path, input_data_id: str, number: int) -> SupplementaryData:
+
+def _create_dummy_image_meta(input_data_id: str, number: int) -> SupplementaryData:
     data_id = camera_image_calib_id(input_data_id, number)
 
     num = number % 4
@@ -133,11 +165,7 @@ def _create_dummy_image_meta(parent_dir: Path, input_data_id: str, number: int)
         ),
     )
 
-    file = parent_dir / data_id
-    with file.open("w", encoding="UTF-8") as writer:
-        writer.write(meta.to_json(ensure_ascii=False, indent=3))
-
-    return SupplementaryData(data_id, file, "text", content_type="application/json")
+    return SupplementaryData(data_id, _serialize_meta(meta), "text", content_type="application/json")
 
 
 def _upload_supplementaries(
@@ -145,10 +173,193 @@ def _upload_supplementaries(
 ) -> None:
     for supp in supplementary_list:
         uploader.upload_supplementary(
-            input_data_id, supp.data_id, supp.path, supp.data_type, content_type=supp.content_type
+            input_data_id, supp.data_id, supp.data, supp.data_type, content_type=supp.content_type
         )
 
 
+async def _upload_supplementaries_async(
+    uploader: Uploader,
+    input_data_id: str,
+    supplementary_list: List[SupplementaryData],
+    limiter: Optional[AdaptiveLimiter] = None,
+) -> None:
+    await asyncio.gather(
+        *[
+            uploader.upload_supplementary_async(
+                input_data_id,
+                supp.data_id,
+                supp.data,
+                supp.data_type,
+                content_type=supp.content_type,
+                limiter=limiter,
+            )
+            for supp in supplementary_list
+        ]
+    )
+
+
+def _create_upload_supplementaries(
+    input_data_id: str,
+    paths: FilePaths,
+    dummy_images: List[Path],
+    camera_horizontal_fov: CameraHorizontalFovKind,
+    fallback_horizontal_fov: Optional[int],  # degree
+    sensor_height: Optional[float],
+    pcd_format: PcdFormat,
+) -> List[SupplementaryData]:
+    frame_meta = create_frame_meta(
+        input_data_id,
+        filepaths_to_image_names(paths, dummy_images),
+        sensor_height,
+        pcd_format,
+    )
+    image_supps: List[SupplementaryData] = [
+        meta
+        for i in range(0, len(paths.images))
+        for image_paths in [paths.images[i]]
+        for fov_provider in [
+            create_camera_horizontal_fov_provider(camera_horizontal_fov, image_paths, fallback_horizontal_fov)
+        ]
+        for meta in [
+            SupplementaryData(camera_image_id(input_data_id, i), image_paths.image, "image"),
+            _create_image_meta(
+                image_paths.calib,
+                input_data_id,
+                i,
+                image_paths.camera_settings,
+                fov_provider,
+            ),
+        ]
+    ]
+    image_count = len(paths.images)
+
+    dummy_image_supps = [
+        meta
+        for i in range(0, len(dummy_images))
+        for meta in [
+            _create_dummy_image_meta(input_data_id, i + image_count),
+            SupplementaryData(
+                camera_image_id(input_data_id, i + image_count),
+                dummy_images[i],
+                "image",
+            ),
+        ]
+    ]
+
+    return dummy_image_supps + image_supps + [frame_meta]
+
+
+def _preprocess_pcd(
+    paths: FilePaths,
+    pcd_format: PcdFormat,
+    downsample: Optional[VoxelDownsampleSettings],
+    crop: Optional[AreaCropSettings] = None,
+) -> FilePaths:
+    """
+    点群ファイルのサイズを検証し、必要であればアノテーション範囲で切り抜き・ダウンサンプリングした点群ファイルに差し替えます。
+    """
+    # アップロードする前に、点群ファイルのサイズがformatと整合しているか確認する
+    count_points(paths.pcd, pcd_format)
+    pcd = paths.pcd
+    if crop is not None:
+        pcd = crop_file(pcd, pcd_format, crop)
+    if downsample is not None:
+        pcd = downsample_file(pcd, pcd_format, downsample)
+    return dataclasses.replace(paths, pcd=pcd) if pcd != paths.pcd else paths
+
+
+def create_input_data_id(input_data_id_prefix: str, paths: FilePaths) -> str:
+    input_data_id_prefix = f"{input_data_id_prefix}_" if input_data_id_prefix else ""
+    return f"{input_data_id_prefix}{paths.key.id}"
+
+
+@dataclass
+class PreparedFrame:
+    """
+    アップロードの準備が完了したフレームです。
+    メタデータの補助情報は、シリアライズ済みの内容をメモリ上に保持しています。
+    """
+
+    input_data_id: str
+    paths: FilePaths
+    supplementaries: List[SupplementaryData]
+    calib_cache_stats: Optional[ProcessCalibCacheStats] = None
+    """準備を行ったプロセスの`calib_cache`の統計。 `CalibCacheStatsCollector`で集計する"""
+
+
+def prepare_upload(
+    input_data_id_prefix: str,
+    paths: FilePaths,
+    dummy_images: List[Path],
+    camera_horizontal_fov: CameraHorizontalFovKind,
+    fallback_horizontal_fov: Optional[int],  # degree
+    sensor_height: Optional[float],
+    pcd_format: PcdFormat,
+    downsample: Optional[VoxelDownsampleSettings] = None,
+    crop: Optional[AreaCropSettings] = None,
+) -> PreparedFrame:
+    """
+    1フレーム分のアップロードに必要な補助情報を作成します。
+    メタデータはシリアライズしたbytesとして返すため、プロセス間で受け渡してそのままアップロードできます。
+    ファイルの読み込みのみを行い、Annofabへのアクセスは行いません。
+    `crop`や`downsample`を指定した場合は、点群の切り抜きやダウンサンプリングもここで行います。
+    """
+    paths = _preprocess_pcd(paths, pcd_format, downsample, crop)
+    input_data_id = create_input_data_id(input_data_id_prefix, paths)
+    all_supps = _create_upload_supplementaries(
+        input_data_id,
+        paths,
+        dummy_images,
+        camera_horizontal_fov,
+        fallback_horizontal_fov,
+        sensor_height,
+        pcd_format,
+    )
+    return PreparedFrame(input_data_id, paths, all_supps, process_stats())
+
+
+def create_prepare_executor(max_workers: Optional[int]) -> ProcessPoolExecutor:
+    """
+    `prepare_upload` を実行するプロセスプールを作成します。
+
+    補助情報の作成（キャリブレーションデータの読み込みやJSONへの変換など）はGILを保持するため、
+    ネットワークI/Oを行うスレッドとは別のプロセスで実行します。
+    アップロード用のスレッドが動作している状態でforkしないように、spawnでプロセスを起動します。
+
+    Args:
+        max_workers: プロセス数。 Noneの場合はCPU数となる。
+    """
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+def downsample_all(
+    pathss: List[FilePaths], pcd_format: PcdFormat, settings: VoxelDownsampleSettings, max_workers: Optional[int]
+) -> None:
+    """
+    点群ファイルをプロセスプールで並列にダウンサンプリングし、`settings.cache_dir`に書き出しておきます。
+    以降の`create_kitti_files`などでは、書き出し済みのファイルを再利用します。
+    """
+    with create_prepare_executor(max_workers) as executor:
+        list(executor.map(downsample_file, [paths.pcd for paths in pathss], repeat(pcd_format), repeat(settings)))
+
+
+async def upload_prepared_async(
+    uploader: Uploader, prepared: PreparedFrame, limiter: Optional[AdaptiveLimiter] = None
+) -> Tuple[str, List[SupplementaryData]]:
+    """
+    `prepare_upload` で準備したフレームをアップロードします。
+    補助情報は、同一入力データ内で並列にアップロードします。
+    `limiter`を指定した場合は、フレーム単位ではなく、ストレージへのアップロードとAPI呼び出しの1件ごとに並行数を制限します。
+    """
+    input_data_id = await uploader.upload_input_data_async(
+        prepared.input_data_id, prepared.paths.pcd, content_type="application/octet-stream", limiter=limiter
+    )
+    await _upload_supplementaries_async(uploader, input_data_id, prepared.supplementaries, limiter)
+
+    logger.info("uploaded: %s", prepared.paths.pcd)
+    return input_data_id, prepared.supplementaries
+
+
 async def upload_async(
     input_data_id_prefix: str,
     uploader: Uploader,
@@ -158,20 +369,37 @@ async def upload_async(
     fallback_horizontal_fov: Optional[int],  # degree
     sensor_height: Optional[float],
     pcd_format: PcdFormat,
+    prepare_executor: Optional[Executor] = None,
+    downsample: Optional[VoxelDownsampleSettings] = None,
+    crop: Optional[AreaCropSettings] = None,
+    limiter: Optional[AdaptiveLimiter] = None,
+    calib_stats: Optional[CalibCacheStatsCollector] = None,
 ) -> Tuple[str, List[SupplementaryData]]:
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(
-        None,
-        upload,
+    """
+    `upload` の非同期版です。
+    ファイルのアップロードはUploaderの非同期版メソッドで行うため、ThreadPoolExecutorのスレッド数に縛られません。
+    補助情報は、同一入力データ内で並列にアップロードします。
+    補助情報の作成は`prepare_executor`で実行します。 Noneの場合はデフォルトのThreadPoolExecutorで実行します。
+    `limiter`については`upload_prepared_async`を参照してください。
+    `calib_stats`を指定した場合は、補助情報の作成で読み込んだキャリブレーションのキャッシュの統計を追加します。
+    """
+    loop = asyncio.get_running_loop()
+    prepared = await loop.run_in_executor(
+        prepare_executor,
+        prepare_upload,
         input_data_id_prefix,
-        uploader,
         paths,
         dummy_images,
         camera_horizontal_fov,
         fallback_horizontal_fov,
         sensor_height,
         pcd_format,
+        downsample,
+        crop,
     )
+    if calib_stats is not None:
+        calib_stats.add(prepared.calib_cache_stats)
+    return await upload_prepared_async(uploader, prepared, limiter)
 
 
 def upload(
@@ -183,72 +411,41 @@ def upload(
     fallback_horizontal_fov: Optional[int],  # degree
     sensor_height: Optional[float],
     pcd_format: PcdFormat,
+    downsample: Optional[VoxelDownsampleSettings] = None,
+    crop: Optional[AreaCropSettings] = None,
 ) -> Tuple[str, List[SupplementaryData]]:
-    input_data_id_prefix = f"{input_data_id_prefix}_" if input_data_id_prefix else ""
+    paths = _preprocess_pcd(paths, pcd_format, downsample, crop)
     input_data_id = uploader.upload_input_data(
-        f"{input_data_id_prefix}{paths.key.id}", paths.pcd, content_type="application/octet-stream"
+        create_input_data_id(input_data_id_prefix, paths), paths.pcd, content_type="application/octet-stream"
     )
 
-    with tempfile.TemporaryDirectory() as tempdir_str:
-        tempdir = Path(tempdir_str)
-        frame_meta = create_frame_meta(
-            tempdir,
-            input_data_id,
-            filepaths_to_image_names(paths, dummy_images),
-            sensor_height,
-            pcd_format,
-        )
-        image_supps: List[SupplementaryData] = [
-            meta
-            for i in range(0, len(paths.images))
-            for image_paths in [paths.images[i]]
-            for fov_provider in [
-                create_camera_horizontal_fov_provider(camera_horizontal_fov, image_paths, fallback_horizontal_fov)
-            ]
-            for meta in [
-                SupplementaryData(camera_image_id(input_data_id, i), image_paths.image, "image"),
-                _create_image_meta(
-                    tempdir,
-                    image_paths.calib,
-                    input_data_id,
-                    i,
-                    image_paths.camera_settings,
-                    fov_provider,
-                ),
-            ]
-        ]
-        image_count = len(paths.images)
-
-        dummy_image_supps = [
-            meta
-            for i in range(0, len(dummy_images))
-            for meta in [
-                _create_dummy_image_meta(tempdir, input_data_id, i + image_count),
-                SupplementaryData(
-                    camera_image_id(input_data_id, i + image_count),
-                    dummy_images[i],
-                    "image",
-                ),
-            ]
-        ]
-
-        all_supps = dummy_image_supps + image_supps + [frame_meta]
-        _upload_supplementaries(uploader, input_data_id, all_supps)
+    all_supps = _create_upload_supplementaries(
+        input_data_id,
+        paths,
+        dummy_images,
+        camera_horizontal_fov,
+        fallback_horizontal_fov,
+        sensor_height,
+        pcd_format,
+    )
+    _upload_supplementaries(uploader, input_data_id, all_supps)
 
-        logger.info("uploaded: %s", paths.pcd)
-        return input_data_id, all_supps
+    logger.info("uploaded: %s", paths.pcd)
+    return input_data_id, all_supps
 
 
 # 多分使ってない
 def create_meta_file(parent_dir: Path, paths: FilePaths) -> None:
-    create_frame_meta(parent_dir, "sample_input_id", ["1", "2"], None, PcdFormat("xyzi"))
+    write_supplementary(parent_dir, create_frame_meta("sample_input_id", ["1", "2"], None, PcdFormat("xyzi")))
     fov_provider = create_camera_horizontal_fov_provider(CameraHorizontalFovKind.SETTINGS, paths.images[0], None)
-    _create_image_meta(parent_dir, paths.images[0].calib, "sample_input_id", 0, None, fov_provider)
-    _create_dummy_image_meta(parent_dir, "sample_input_id", 1)
+    write_supplementary(parent_dir, _create_image_meta(paths.images[0].calib, "sample_input_id", 0, None, fov_provider))
+    write_supplementary(parent_dir, _create_dummy_image_meta("sample_input_id", 1))
 
 
 def create_supplementary(data: SupplementaryData) -> Supplementary:
-    return Supplementary(data.data_id, SupplementaryBody(data.data_id, data.path.absolute().as_posix()))
+    if not isinstance(data.data, Path):
+        raise ValueError(f"補助情報(={data.data_id})がファイルに書き出されていません")
+    return Supplementary(data.data_id, SupplementaryBody(data.data_id, data.data.absolute().as_posix()))
 
 
 def create_kitti_files(
@@ -259,7 +456,14 @@ def create_kitti_files(
     fallback_horizontal_fov: Optional[int],  # degree
     sensor_height: Optional[float],
     pcd_format: PcdFormat,
+    downsample: Optional[VoxelDownsampleSettings] = None,
+    link_mode: LinkMode = LinkMode.COPY,
 ) -> InputData:
+    """
+    1フレーム分の入力データと補助情報のファイルを、`parent_dir`配下のフレームIDのディレクトリに出力します。
+    点群と画像は`link_mode`の方法で配置します。
+    """
+    paths = _preprocess_pcd(paths, pcd_format, downsample)
     input_data_id_prefix = f"{input_data_id_prefix}_" if input_data_id_prefix else ""
     input_data_id = f"{input_data_id_prefix}{paths.key.id}".format(input_data_id_prefix, paths.key.id)
     input_data_dir = parent_dir / paths.key.id
@@ -268,14 +472,16 @@ def create_kitti_files(
 
     input_data_dir.mkdir(parents=True)
     input_data_path = input_data_dir / paths.pcd.name
-    shutil.copyfile(paths.pcd, input_data_path)
+    place_file(paths.pcd, input_data_path, link_mode)
 
-    frame_meta = create_frame_meta(
+    frame_meta = write_supplementary(
         input_data_dir,
-        input_data_id,
-        image_names=filepaths_to_image_names(paths, []),
-        sensor_height=sensor_height,
-        pcd_format=pcd_format,
+        create_frame_meta(
+            input_data_id,
+            image_names=filepaths_to_image_names(paths, []),
+            sensor_height=sensor_height,
+            pcd_format=pcd_format,
+        ),
     )
 
     images = [
@@ -287,16 +493,18 @@ def create_kitti_files(
         for fov_provider in [
             create_camera_horizontal_fov_provider(camera_horizontal_fov, image, fallback_horizontal_fov)
         ]
-        for _ in [shutil.copyfile(image.image, image_path)]
+        for _ in [place_file(image.image, image_path, link_mode)]
         for meta in [
             SupplementaryData(image_id, image_path, "image"),
-            _create_image_meta(
+            write_supplementary(
                 input_data_dir,
-                image.calib,
-                input_data_id,
-                i,
-                image.camera_settings,
-                fov_provider,
+                _create_image_meta(
+                    image.calib,
+                    input_data_id,
+                    i,
+                    image.camera_settings,
+                    fov_provider,
+                ),
             ),
         ]
     ]
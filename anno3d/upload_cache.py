@@ -0,0 +1,164 @@
+import asyncio
+import hashlib
+import json
+import mmap
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from logging import getLogger
+from pathlib import Path
+from typing import IO, Dict, Optional, Tuple, Union
+
+logger = getLogger(__name__)
+
+_CHUNK_SIZE = 8 * 1024 * 1024
+
+
+def file_digest(file: Path) -> str:
+    """
+    ファイルの内容のハッシュ値（BLAKE2b）を計算します。
+
+    ファイルはメモリマップして一定サイズごとにハッシュに与えるため、大きなファイルでもメモリ使用量は増えません。
+    """
+    digest = hashlib.blake2b(digest_size=32)
+    with file.open("rb") as reader:
+        size = reader.seek(0, 2)
+        if size == 0:
+            return digest.hexdigest()
+
+        with mmap.mmap(reader.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            with memoryview(mapped) as view:
+                for offset in range(0, size, _CHUNK_SIZE):
+                    digest.update(view[offset : offset + _CHUNK_SIZE])
+
+    return digest.hexdigest()
+
+
+class UploadCache:
+    """
+    登録済みのファイルの内容のハッシュ値を、登録先（入力データや補助情報）ごとに記録するキャッシュです。
+
+    登録先とハッシュ値の組が記録済みであれば、ファイルの内容は変更されていないため、アップロードを省略できます。
+    記録は1行1件のJSONL形式でファイルに追記し、同じ登録先の記録が複数ある場合は最後のものを採用します。
+    `file`がNoneの場合は何も記録せず、常に未登録として扱います。
+
+    Args:
+        file: キャッシュファイルのパス
+        hash_workers: ハッシュ値の計算に利用するスレッドの数。 スレッドは`digest_async`の初回の呼び出し時に起動する
+    """
+
+    _digests: Dict[Tuple[str, str], str]
+    _writer: Optional[IO[str]]
+    _executor: Optional[ThreadPoolExecutor]
+
+    def __init__(self, file: Optional[Path] = None, hash_workers: int = 4):
+        self._file = file
+        self._digests = {}
+        self._writer = None
+        self._lock = threading.Lock()
+        self._hash_workers = hash_workers
+        self._executor = None
+        if file is not None and file.exists():
+            self._load(file)
+
+    @staticmethod
+    def open(cache_dir: Optional[Path], project: str) -> "UploadCache":
+        """
+        プロジェクトに対応するキャッシュを開きます。
+
+        Args:
+            cache_dir: キャッシュファイルの配置ディレクトリ。 Noneの場合は、何も記録しないキャッシュを返します。
+            project: プロジェクトID
+
+        Returns:
+            キャッシュ
+        """
+        if cache_dir is None:
+            return UploadCache()
+
+        name = hashlib.sha256(project.encode("UTF-8")).hexdigest()[:32]
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        file = cache_dir / f"{name}.jsonl"
+        logger.info("キャッシュファイル: %s", file.absolute())
+        return UploadCache(file)
+
+    @property
+    def enabled(self) -> bool:
+        return self._file is not None
+
+    def _load(self, file: Path) -> None:
+        with file.open(encoding="UTF-8") as reader:
+            for line in reader:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # 書き込み中に中断された行は無視する
+                    continue
+                self._digests[(record["kind"], record["key"])] = record["digest"]
+
+        logger.info("キャッシュから%d件の登録済みファイルの情報を読み込みました", len(self._digests))
+
+    def digest(self, source: Union[Path, bytes, bytearray, memoryview]) -> Optional[str]:
+        """
+        ファイルまたはメモリ上のデータのハッシュ値を計算します。 キャッシュが無効な場合は計算せずにNoneを返します。
+        """
+        if not self.enabled:
+            return None
+        if isinstance(source, Path):
+            return file_digest(source)
+        return hashlib.blake2b(source, digest_size=32).hexdigest()
+
+    async def digest_async(self, source: Union[Path, bytes, bytearray, memoryview]) -> Optional[str]:
+        """
+        `digest` の非同期版です。 ファイルのハッシュ値はキャッシュ専用のスレッドプールで計算します。
+        """
+        if not self.enabled:
+            return None
+        if not isinstance(source, Path):
+            return self.digest(source)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_executor(), file_digest, source)
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self._hash_workers, thread_name_prefix="upload-cache-hash"
+                )
+            return self._executor
+
+    def shutdown_executor(self) -> None:
+        """
+        ハッシュ値の計算に利用するスレッドプールを停止します。 停止後に`digest_async`を呼び出すと、起動し直します。
+        """
+        with self._lock:
+            executor = self._executor
+            self._executor = None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def contains(self, kind: str, key: str, digest: Optional[str]) -> bool:
+        if digest is None:
+            return False
+        with self._lock:
+            return self._digests.get((kind, key)) == digest
+
+    def put(self, kind: str, key: str, digest: Optional[str]) -> None:
+        if digest is None or self._file is None:
+            return
+
+        line = json.dumps({"kind": kind, "key": key, "digest": digest}, ensure_ascii=False)
+        with self._lock:
+            self._digests[(kind, key)] = digest
+            if self._writer is None:
+                self._writer = self._file.open("a", encoding="UTF-8")  # pylint: disable=consider-using-with
+                # 前回の書き込みが行の途中で中断されていても、次の行から書き込む
+                self._writer.write("\n")
+            self._writer.write(line + "\n")
+            self._writer.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+        self.shutdown_executor()
@@ -0,0 +1,130 @@
+import hashlib
+import json
+import threading
+from logging import getLogger
+from pathlib import Path
+from typing import IO, Any, Dict, Literal, Optional, Tuple
+
+logger = getLogger(__name__)
+
+JournalKind = Literal["input_data", "supplementary", "task", "annotation"]
+"""
+ジャーナルに記録する処理の種類
+
+* input_data: 入力データの登録。 キーはinput_data_id
+* supplementary: 補助情報の登録。 キーは`{input_data_id}/{supplementary_data_id}`
+* task: タスクの作成。 キーはtask_id
+* annotation: アノテーションの登録。 キーは`{task_id}/{input_data_id}`
+"""
+
+
+class UploadJournal:
+    """
+    完了した処理を記録するジャーナルです。
+
+    記録は1行1件のJSONL形式でファイルに追記します。
+    処理が途中で中断された場合でも、同じジャーナルを指定して再実行すれば、記録済みの処理をスキップして続きから再開できます。
+    `file`がNoneの場合は、ファイルへの記録を行いません。
+
+    Args:
+        file: ジャーナルファイルのパス
+    """
+
+    _records: Dict[Tuple[str, str], Optional[Dict[str, Any]]]
+    _writer: Optional[IO[str]]
+
+    def __init__(self, file: Optional[Path] = None):
+        self._file = file
+        self._records = {}
+        self._writer = None
+        self._lock = threading.Lock()
+        if file is not None and file.exists():
+            self._load(file)
+
+    @staticmethod
+    def open(journal_dir: Optional[Path], source: Path, target: str) -> "UploadJournal":
+        """
+        処理対象と処理先の組に対応するジャーナルを開きます。
+
+        Args:
+            journal_dir: ジャーナルファイルの配置ディレクトリ。 Noneの場合は、ファイルに記録しないジャーナルを返します。
+            source: 処理対象のパス（シーンのパスなど）
+            target: 処理先（プロジェクトIDや出力先ディレクトリなど）
+
+        Returns:
+            ジャーナル
+        """
+        if journal_dir is None:
+            return UploadJournal()
+
+        key = f"{source.absolute().as_posix()}\n{target}"
+        name = hashlib.sha256(key.encode("UTF-8")).hexdigest()[:32]
+        journal_dir.mkdir(parents=True, exist_ok=True)
+        file = journal_dir / f"{name}.jsonl"
+        logger.info("ジャーナルファイル: %s", file.absolute())
+        return UploadJournal(file)
+
+    def _load(self, file: Path) -> None:
+        with file.open(encoding="UTF-8") as reader:
+            for line_number, line in enumerate(reader, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # 書き込み中に中断された行は、未完了の処理として扱う
+                    logger.warning("ジャーナルの%d行目を読み込めなかったため無視します: %s", line_number, file)
+                    continue
+                self._records[(record["kind"], record["key"])] = record.get("detail")
+
+        logger.info("ジャーナルから%d件の完了済みの処理を読み込みました", len(self._records))
+
+    @staticmethod
+    def _open_writer(file: Path) -> IO[str]:
+        needs_newline = False
+        if file.exists() and file.stat().st_size > 0:
+            with file.open("rb") as reader:
+                reader.seek(-1, 2)
+                # 前回の書き込みが行の途中で中断されている場合は、改行してから追記する
+                needs_newline = reader.read(1) != b"\n"
+
+        writer = file.open("a", encoding="UTF-8")  # pylint: disable=consider-using-with
+        if needs_newline:
+            writer.write("\n")
+        return writer
+
+    def is_done(self, kind: JournalKind, key: str) -> bool:
+        with self._lock:
+            return (kind, key) in self._records
+
+    def get_detail(self, kind: JournalKind, key: str) -> Optional[Dict[str, Any]]:
+        """
+        記録時に付与した詳細情報を取得します。 記録されていない場合はNoneを返します。
+        """
+        with self._lock:
+            return self._records.get((kind, key))
+
+    def record(self, kind: JournalKind, key: str, detail: Optional[Dict[str, Any]] = None) -> None:
+        """
+        処理の完了を記録します。
+
+        Args:
+            kind: 処理の種類
+            key: 処理対象のキー
+            detail: 再開時に利用する詳細情報
+        """
+        line = json.dumps({"kind": kind, "key": key, "detail": detail}, ensure_ascii=False)
+        with self._lock:
+            self._records[(kind, key)] = detail
+            if self._file is None:
+                return
+            if self._writer is None:
+                self._writer = self._open_writer(self._file)
+            self._writer.write(line + "\n")
+            self._writer.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
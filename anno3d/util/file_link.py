@@ -0,0 +1,93 @@
+import os
+import shutil
+import sys
+from enum import Enum
+from logging import getLogger
+from pathlib import Path
+from typing import Callable, Dict, List
+
+logger = getLogger(__name__)
+
+# Linuxのioctl(FICLONE)。 コピーオンライトでファイルの内容を共有する（btrfs, XFSなど）
+_FICLONE = 0x40049409
+
+
+class LinkMode(Enum):
+    """
+    ファイルを出力先に配置する方法
+
+    * auto: hardlink, reflink, copy の順に試す
+    * hardlink: ハードリンクを作成する。 出力先と元ファイルは同じ実体を共有するため、一方を変更すると他方も変わる
+    * symlink: 元ファイルの絶対パスへのシンボリックリンクを作成する
+    * reflink: コピーオンライトでファイルの内容を共有する。 一方を変更しても他方は変わらない
+    * copy: ファイルをコピーする
+
+    copy以外は、作成できなかった場合（別のファイルシステムである、ファイルシステムが対応していないなど）にcopyで配置します。
+    """
+
+    AUTO = "auto"
+    HARDLINK = "hardlink"
+    SYMLINK = "symlink"
+    REFLINK = "reflink"
+    COPY = "copy"
+
+
+def _hardlink(src: Path, dst: Path) -> None:
+    os.link(src, dst)
+
+
+def _symlink(src: Path, dst: Path) -> None:
+    os.symlink(src.absolute(), dst)
+
+
+def _reflink(src: Path, dst: Path) -> None:
+    if not sys.platform.startswith("linux"):
+        raise OSError(f"reflinkは{sys.platform}に対応していません")
+    import fcntl  # pylint: disable=import-outside-toplevel
+
+    with src.open("rb") as reader, dst.open("wb") as writer:
+        try:
+            fcntl.ioctl(writer.fileno(), _FICLONE, reader.fileno())
+        except OSError:
+            writer.close()
+            dst.unlink()
+            raise
+
+
+def _copy(src: Path, dst: Path) -> None:
+    shutil.copyfile(src, dst)
+
+
+_PLACERS: Dict[LinkMode, Callable[[Path, Path], None]] = {
+    LinkMode.HARDLINK: _hardlink,
+    LinkMode.SYMLINK: _symlink,
+    LinkMode.REFLINK: _reflink,
+    LinkMode.COPY: _copy,
+}
+
+_FALLBACKS: Dict[LinkMode, List[LinkMode]] = {
+    LinkMode.AUTO: [LinkMode.HARDLINK, LinkMode.REFLINK, LinkMode.COPY],
+    LinkMode.HARDLINK: [LinkMode.HARDLINK, LinkMode.COPY],
+    LinkMode.SYMLINK: [LinkMode.SYMLINK, LinkMode.COPY],
+    LinkMode.REFLINK: [LinkMode.REFLINK, LinkMode.COPY],
+    LinkMode.COPY: [LinkMode.COPY],
+}
+
+
+def place_file(src: Path, dst: Path, mode: LinkMode) -> LinkMode:
+    """
+    `src`を`mode`の方法で`dst`に配置します。
+
+    Returns:
+        実際に配置に利用した方法
+    """
+    candidates = _FALLBACKS[mode]
+    for candidate in candidates[:-1]:
+        try:
+            _PLACERS[candidate](src, dst)
+            return candidate
+        except OSError as e:
+            logger.debug("%sで配置できなかったため、次の方法を試します(%s -> %s): %s", candidate.value, src, dst, e)
+
+    _PLACERS[candidates[-1]](src, dst)
+    return candidates[-1]
@@ -0,0 +1,22 @@
+import os
+from pathlib import Path
+from typing import Iterator, Optional
+
+
+def iter_file_names(directory: Path, suffix: Optional[str] = None) -> Iterator[str]:
+    """
+    ディレクトリ直下のファイル名を、`os.scandir`で1件ずつ列挙します。
+
+    ディレクトリ全体を読み込んでから返すのではなく、見つけた順に返します。 順序はファイルシステムに依存します。
+    ファイルかどうかは`os.DirEntry`が保持している種別で判定するため、多くのファイルシステムではファイルごとのstatは発生しません。
+
+    Args:
+        directory: 対象のディレクトリ
+        suffix: 指定した場合、この文字列で終わるファイル名のみを列挙する
+    """
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if suffix is not None and not entry.name.endswith(suffix):
+                continue
+            if entry.is_file():
+                yield entry.name
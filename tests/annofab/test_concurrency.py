@@ -0,0 +1,63 @@
+import asyncio
+import time
+from typing import List
+
+import pytest
+import requests
+
+from anno3d.annofab.concurrency import AdaptiveLimiter
+
+
+def _http_error(status_code: int, retry_after: str) -> requests.HTTPError:
+    response = requests.Response()
+    response.status_code = status_code
+    response.headers["Retry-After"] = retry_after
+    return requests.HTTPError(response=response)
+
+
+def test_AdaptiveLimiterは成功したリクエストに応じて並行数の上限を増やす():
+    in_flights: List[int] = []
+
+    async def main() -> AdaptiveLimiter:
+        limiter = AdaptiveLimiter(8)
+        running = 0
+
+        async def request() -> None:
+            nonlocal running
+            running += 1
+            in_flights.append(running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+        await asyncio.gather(*(limiter.run(request, "test") for _ in range(40)))
+        return limiter
+
+    limiter = asyncio.run(main())
+
+    assert max(in_flights) <= 8
+    assert in_flights[:4] == [1, 2, 3, 4]
+    assert max(in_flights) > 4
+    stats = limiter.stats()
+    assert stats.window == 8
+    assert stats.requests == 40
+    assert stats.errors == 0
+
+
+def test_AdaptiveLimiterはエラーで並行数の上限を下げてRetryAfterの間は待つ():
+    async def main() -> float:
+        limiter = AdaptiveLimiter(8)
+
+        async def fail() -> None:
+            raise _http_error(429, "0.2")
+
+        async def succeed() -> None:
+            pass
+
+        with pytest.raises(requests.HTTPError):
+            await limiter.run(fail, "test")
+        assert limiter.window == 2
+        started = time.monotonic()
+        await limiter.run(succeed, "test")
+        return time.monotonic() - started
+
+    assert asyncio.run(main()) >= 0.15
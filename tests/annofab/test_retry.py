@@ -0,0 +1,118 @@
+import asyncio
+from typing import Dict, List, Optional
+
+import aiohttp
+import boto3.exceptions
+import botocore.exceptions
+import pytest
+import requests
+from multidict import CIMultiDict, CIMultiDictProxy
+from yarl import URL
+
+from anno3d.annofab.retry import RetrySettings, is_retryable, retry_after, retry_async
+
+_NO_WAIT = RetrySettings(max_attempts=3, initial_delay=0.0)
+
+_URL = URL("https://example.com/tempdata")
+
+
+def _http_error(status_code: int) -> requests.HTTPError:
+    response = requests.Response()
+    response.status_code = status_code
+    return requests.HTTPError(response=response)
+
+
+def test_retry_asyncは一時的なエラーの場合に再試行する():
+    errors: List[Exception] = [_http_error(503), requests.ConnectionError()]
+
+    async def func() -> str:
+        if errors:
+            raise errors.pop(0)
+        return "ok"
+
+    assert asyncio.run(retry_async(func, _NO_WAIT, "test")) == "ok"
+
+
+def test_retry_asyncは再試行できないエラーと試行回数の超過の場合に例外を送出する():
+    calls: List[int] = []
+
+    async def func(status_code: int) -> None:
+        calls.append(status_code)
+        raise _http_error(status_code)
+
+    with pytest.raises(requests.HTTPError):
+        asyncio.run(retry_async(lambda: func(400), _NO_WAIT, "test"))
+    with pytest.raises(requests.HTTPError):
+        asyncio.run(retry_async(lambda: func(429), _NO_WAIT, "test"))
+    assert calls == [400, 429, 429, 429]
+
+
+def _aiohttp_error(status: int, headers: Optional[Dict[str, str]] = None) -> aiohttp.ClientResponseError:
+    return aiohttp.ClientResponseError(
+        request_info=aiohttp.RequestInfo(_URL, "PUT", CIMultiDictProxy(CIMultiDict()), _URL),
+        history=(),
+        status=status,
+        headers=CIMultiDictProxy(CIMultiDict(headers or {})),
+    )
+
+
+def _botocore_error(
+    code: str, status: int, headers: Optional[Dict[str, str]] = None
+) -> botocore.exceptions.ClientError:
+    return botocore.exceptions.ClientError(
+        {
+            "Error": {"Code": code, "Message": ""},
+            "ResponseMetadata": {"HTTPStatusCode": status, "HTTPHeaders": headers or {}},
+        },
+        "PutObject",
+    )
+
+
+def test_is_retryableはaiohttpのエラーを判定する():
+    assert is_retryable(_aiohttp_error(503))
+    assert is_retryable(_aiohttp_error(429))
+    assert not is_retryable(_aiohttp_error(403))
+    assert is_retryable(aiohttp.ClientConnectionError())
+    assert is_retryable(aiohttp.ServerTimeoutError())
+    assert is_retryable(asyncio.TimeoutError())
+
+
+def test_is_retryableはbotocoreのエラーを判定する():
+    assert is_retryable(botocore.exceptions.EndpointConnectionError(endpoint_url="https://example.com"))
+    assert is_retryable(botocore.exceptions.ReadTimeoutError(endpoint_url="https://example.com"))
+    assert is_retryable(_botocore_error("SlowDown", 503))
+    assert is_retryable(_botocore_error("ThrottlingException", 400))
+    assert is_retryable(_botocore_error("InternalError", 500))
+    assert not is_retryable(_botocore_error("AccessDenied", 403))
+
+    def upload_failed(cause: Exception) -> boto3.exceptions.S3UploadFailedError:
+        # boto3はClientErrorの処理中にS3UploadFailedErrorを送出するため、ClientErrorが__context__に設定される
+        error = boto3.exceptions.S3UploadFailedError(str(cause))
+        error.__context__ = cause
+        return error
+
+    assert is_retryable(upload_failed(_botocore_error("SlowDown", 503)))
+    assert not is_retryable(upload_failed(_botocore_error("AccessDenied", 403)))
+
+
+def test_retry_afterはaiohttpとbotocoreのエラーのヘッダから待ち時間を取得する():
+    assert retry_after(_aiohttp_error(429, {"Retry-After": "3"})) == 3.0
+    assert retry_after(_aiohttp_error(503)) is None
+    assert retry_after(_botocore_error("SlowDown", 503, {"retry-after": "2"})) == 2.0
+    assert retry_after(_botocore_error("SlowDown", 503)) is None
+
+
+def test_retry_asyncはアップロードのエラーの場合に再試行する():
+    errors: List[Exception] = [
+        _aiohttp_error(503),
+        aiohttp.ClientConnectionError(),
+        asyncio.TimeoutError(),
+        botocore.exceptions.EndpointConnectionError(endpoint_url="https://example.com"),
+    ]
+
+    async def func() -> str:
+        if errors:
+            raise errors.pop(0)
+        return "ok"
+
+    assert asyncio.run(retry_async(func, RetrySettings(max_attempts=5, initial_delay=0.0), "test")) == "ok"
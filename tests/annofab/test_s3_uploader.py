@@ -0,0 +1,97 @@
+from pathlib import Path
+from typing import Iterator
+
+import boto3
+import pytest
+from annofabapi import AnnofabApi
+from annofabapi.credentials import Pat
+from moto import mock_aws
+
+from anno3d.annofab.uploader import S3Uploader
+
+bucket = "test-bucket"
+
+
+@pytest.fixture
+def s3(monkeypatch: pytest.MonkeyPatch) -> Iterator[None]:
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    with mock_aws():
+        boto3.client("s3").create_bucket(Bucket=bucket)
+        yield
+
+
+def create_uploader(force: bool = False) -> S3Uploader:
+    return S3Uploader(
+        AnnofabApi(Pat("dummy")),
+        project="project",
+        s3_path=f"{bucket}/prefix",
+        force=force,
+        multipart_chunksize=5 * 1024 * 1024,
+    )
+
+
+@pytest.mark.usefixtures("s3")
+def test_大きなファイルはマルチパートアップロードされる(tmp_path: Path):
+    data_dir = tmp_path / "velodyne"
+    data_dir.mkdir()
+    file = data_dir / "000000.bin"
+    content = bytes(range(256)) * (12 * 1024 * 1024 // 256)
+    file.write_bytes(content)
+
+    uri = create_uploader().upload_tempdata(file)
+
+    assert uri == f"s3://{bucket}/prefix/velodyne/000000.bin"
+    obj = boto3.client("s3").get_object(Bucket=bucket, Key="prefix/velodyne/000000.bin")
+    assert obj["Body"].read() == content
+    assert obj["ContentType"] == "application/octet-stream"
+    # マルチパートアップロードされたオブジェクトのETagは、"-{パート数}"で終わる
+    assert obj["ETag"].strip('"').endswith("-3")
+
+
+@pytest.mark.usefixtures("s3")
+def test_存在するキーはlist_objects_v2でまとめて取得する(tmp_path: Path):
+    client = boto3.client("s3")
+    client.put_object(Bucket=bucket, Key="prefix/velodyne/000000.bin", Body=b"exists")
+    client.put_object(Bucket=bucket, Key="other/velodyne/000001.bin", Body=b"other prefix")
+    data_dir = tmp_path / "velodyne"
+    data_dir.mkdir()
+    (data_dir / "000000.bin").write_bytes(b"data")
+    (data_dir / "000001.bin").write_bytes(b"data")
+
+    uploader = create_uploader()
+    uploader.prepare([])
+
+    assert uploader.s3_key_exists("prefix/velodyne/000000.bin")
+    assert not uploader.s3_key_exists("prefix/velodyne/000001.bin")
+    with pytest.raises(RuntimeError):
+        uploader.upload_tempdata(data_dir / "000000.bin")
+
+    uploader.upload_tempdata(data_dir / "000001.bin")
+    assert uploader.s3_key_exists("prefix/velodyne/000001.bin")
+
+
+@pytest.mark.usefixtures("s3")
+def test_メモリ上のデータをアップロードできる():
+    uri = create_uploader().upload_tempdata(b'{"a": 1}', content_type="application/json", name="000000.meta")
+
+    assert uri.startswith(f"s3://{bucket}/prefix/")
+    assert uri.endswith("/000000.meta")
+    key = uri[len(f"s3://{bucket}/") :]
+    obj = boto3.client("s3").get_object(Bucket=bucket, Key=key)
+    assert obj["Body"].read() == b'{"a": 1}'
+    assert obj["ContentType"] == "application/json"
+
+
+@pytest.mark.usefixtures("s3")
+def test_同じ内容のメモリ上のデータは1度だけアップロードする():
+    uploader = create_uploader()
+
+    first = uploader.upload_tempdata(b'{"a": 1}', content_type="application/json", name="000000.meta")
+    second = uploader.upload_tempdata(b'{"a": 1}', content_type="application/json", name="000001.meta")
+    other = uploader.upload_tempdata(b'{"a": 2}', content_type="application/json", name="000001.meta")
+
+    assert second == first
+    assert other != first
+    assert boto3.client("s3").list_objects_v2(Bucket=bucket, Prefix="prefix/")["KeyCount"] == 2
@@ -0,0 +1,224 @@
+import asyncio
+import itertools
+import threading
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar, cast
+
+import aiohttp
+import pytest
+from aiohttp import web
+from annofabapi import AnnofabApi
+
+from anno3d.annofab import uploader as uploader_module
+from anno3d.annofab.concurrency import AdaptiveLimiter
+from anno3d.annofab.uploader import AnnofabStorageUploader, DataPath, TempPathPool, Uploader, UploadSource
+
+T = TypeVar("T")
+
+
+class _FakeClient:
+    """`create_temp_path`のみを持つ`AnnofabApi`の代わりです。 `base_url`への一時データ保存先を払い出します。"""
+
+    def __init__(self, base_url: str = "https://example.com"):
+        self.base_url = base_url
+        self.created = 0
+
+    def create_temp_path(self, _project: str) -> Tuple[Dict[str, str], None]:
+        self.created += 1
+        return {"url": f"{self.base_url}/{self.created}", "path": f"s3://example/{self.created}"}, None
+
+
+class _RegisteringClient:
+    """入力データと補助情報の登録APIのみを持つ`AnnofabApi`の代わりです。"""
+
+    def put_input_data(self, _project: str, input_data_id: str, **_kwargs: Any) -> Tuple[Dict[str, str], None]:
+        return {"input_data_id": input_data_id, "updated_datetime": ""}, None
+
+    def put_supplementary_data(
+        self, _project: str, _input_data_id: str, supplementary_id: str, _body: Any
+    ) -> Tuple[Dict[str, str], None]:
+        return {"supplementary_data_id": supplementary_id, "updated_datetime": ""}, None
+
+
+class _MemoryUploader(Uploader):
+    def upload_tempdata(
+        self, source: UploadSource, *, content_type: Optional[str] = None, name: Optional[str] = None
+    ) -> str:
+        return f"s3://example/{name}"
+
+
+class _RecordingLimiter(AdaptiveLimiter):
+    def __init__(self) -> None:
+        super().__init__(8)
+        self.kinds: List[str] = []
+
+    async def run(self, func: Callable[[], Awaitable[T]], kind: str) -> T:
+        self.kinds.append(kind)
+        return await super().run(func, kind)
+
+
+def _prefetcher_threads() -> int:
+    return len([thread for thread in threading.enumerate() if thread.name.startswith("temp-path-prefetcher")])
+
+
+def test_TempPathPoolから取り出した一時データ保存先は重複しない():
+    counter = itertools.count()
+
+    def allocate() -> DataPath:
+        i = next(counter)
+        return DataPath(f"https://example.com/{i}", f"s3://example/{i}")
+
+    pool = TempPathPool(allocate, size=4, workers=2)
+    try:
+        paths = [pool.get() for _ in range(20)]
+    finally:
+        pool.close()
+
+    assert len({path.path for path in paths}) == 20
+
+
+def test_TempPathPoolはclose後に再利用できる():
+    counter = itertools.count()
+
+    def allocate() -> DataPath:
+        i = next(counter)
+        return DataPath(f"https://example.com/{i}", f"s3://example/{i}")
+
+    pool = TempPathPool(allocate, size=2, workers=1)
+    first = pool.get()
+    pool.close()
+    second = pool.get()
+    pool.close()
+
+    assert first != second
+
+
+def test_同期版のアップロードでは一時データ保存先の補充スレッドを起動しない(monkeypatch: pytest.MonkeyPatch):
+    put_urls = []
+
+    def put(url: str, _data: Any, **_kwargs: Any) -> None:
+        put_urls.append(url)
+
+    monkeypatch.setattr(uploader_module.requests, "put", put)
+    client = _FakeClient()
+    uploader = AnnofabStorageUploader(cast(AnnofabApi, client), "prj")
+
+    path = uploader.upload_tempdata(b"data", content_type="application/octet-stream")
+
+    assert path == "s3://example/1"
+    assert put_urls == ["https://example.com/1"]
+    assert client.created == 1
+    assert _prefetcher_threads() == 0
+
+
+def test_limiterを指定した場合はストレージへのアップロードとAPI呼び出しの1件ごとに並行数を制限する(tmp_path: Path):
+    file = tmp_path / "000000.bin"
+    file.write_bytes(b"data")
+    uploader = _MemoryUploader(cast(AnnofabApi, _RegisteringClient()), "prj")
+    limiter = _RecordingLimiter()
+
+    async def main() -> None:
+        await uploader.upload_input_data_async("000000", file, limiter=limiter)
+        await uploader.upload_supplementary_async("000000", "meta", b"{}", "custom", limiter=limiter)
+        await uploader.upload_supplementary_async("000000", "meta2", b"{}", "custom")
+
+    asyncio.run(main())
+
+    assert limiter.kinds == ["tempdata", "input_data", "tempdata", "supplementary"]
+    assert limiter.stats().requests == 4
+
+
+class _StorageServer:
+    """一時データ保存先へのPUTを受け付けるローカルのHTTPサーバです。 `status`のステータスで応答します。"""
+
+    def __init__(self) -> None:
+        self.status = 200
+        self.received: List[Tuple[str, bytes, str]] = []
+        self.base_url = ""
+        self._runner: Optional[web.AppRunner] = None
+
+    async def _put(self, request: web.Request) -> web.Response:
+        self.received.append((request.path, await request.read(), request.headers["Content-Type"]))
+        return web.Response(status=self.status)
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_put("/{name}", self._put)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        host, port = self._runner.addresses[0][:2]
+        self.base_url = f"http://{host}:{port}"
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+
+def _run_with_storage(main: Callable[[_StorageServer, AnnofabStorageUploader], Awaitable[None]]) -> None:
+    async def run() -> None:
+        server = _StorageServer()
+        await server.start()
+        uploader = AnnofabStorageUploader(cast(AnnofabApi, _FakeClient(server.base_url)), "prj", temp_path_pool_size=2)
+        try:
+            await main(server, uploader)
+        finally:
+            await uploader.close_async()
+            await server.stop()
+
+    asyncio.run(run())
+
+
+def test_upload_tempdata_asyncはaiohttpでデータをPUTして一時データ保存先のパスを返す(tmp_path: Path):
+    file = tmp_path / "000000.bin"
+    file.write_bytes(b"point cloud")
+
+    async def main(server: _StorageServer, uploader: AnnofabStorageUploader) -> None:
+        file_path = await uploader.upload_tempdata_async(file)
+        memory_path = await uploader.upload_tempdata_async(b"{}", content_type="application/json")
+
+        assert file_path.startswith("s3://example/")
+        assert memory_path.startswith("s3://example/")
+        assert file_path != memory_path
+        assert [(body, content_type) for _, body, content_type in server.received] == [
+            (b"point cloud", "application/octet-stream"),
+            (b"{}", "application/json"),
+        ]
+
+    _run_with_storage(main)
+
+
+def test_upload_tempdata_asyncは2xx以外の応答で例外を送出する():
+    async def main(server: _StorageServer, uploader: AnnofabStorageUploader) -> None:
+        server.status = 503
+        with pytest.raises(aiohttp.ClientResponseError) as e:
+            await uploader.upload_tempdata_async(b"data")
+        assert e.value.status == 503
+        assert len(server.received) == 1
+
+    _run_with_storage(main)
+
+
+def test_upload_tempdata_asyncはセッションを使い回しclose_asyncで閉じる():
+    async def main(server: _StorageServer, uploader: AnnofabStorageUploader) -> None:
+        sessions = []
+        for _ in range(3):
+            await uploader.upload_tempdata_async(b"data")
+            sessions.append(uploader._session)  # pylint: disable=protected-access
+
+        session = sessions[0]
+        assert session is not None
+        assert all(s is session for s in sessions)
+        assert len(server.received) == 3
+
+        await uploader.close_async()
+        assert session.closed
+        assert _prefetcher_threads() == 0
+
+        # 閉じた後に再度利用した場合は、新たなセッションを作成する
+        await uploader.upload_tempdata_async(b"data")
+        assert uploader._session is not session  # pylint: disable=protected-access
+        assert len(server.received) == 4
+
+    _run_with_storage(main)
@@ -0,0 +1,52 @@
+from pathlib import Path
+
+import numpy as np
+
+from anno3d.kitti.accumulate import accumulate_scene, read_poses
+from anno3d.kitti.point_cloud import as_float_array, open_point_cloud
+from anno3d.model.scene import Defaults, KittiVelodyneSeries, Scene
+
+
+def _write_poses(file: Path) -> None:
+    # frame 0: 原点 / frame 1: x方向に10移動 / frame 2: x方向に20移動し、z軸周りに90度回転
+    lines = [
+        "1 0 0 0 0 1 0 0 0 0 1 0",
+        "1 0 0 10 0 1 0 0 0 0 1 0",
+        "0 -1 0 20 1 0 0 0 0 0 1 0",
+    ]
+    file.write_text("\n".join(lines) + "\n")
+
+
+def test_read_posesはKITTI_odometry形式のポーズを同次変換行列として読み込む(tmp_path: Path):
+    file = tmp_path / "poses.txt"
+    _write_poses(file)
+
+    poses = read_poses(file)
+
+    assert poses.shape == (3, 4, 4)
+    np.testing.assert_array_equal(poses[1, :3, 3], [10, 0, 0])
+    np.testing.assert_array_equal(poses[:, 3], np.tile([0, 0, 0, 1], (3, 1)))
+
+
+def test_accumulate_sceneは前後のフレームの点群を対象フレームの座標系に重ね合わせる(tmp_path: Path):
+    velodyne_dir = tmp_path / "input" / "velodyne"
+    velodyne_dir.mkdir(parents=True)
+    for i in range(3):
+        np.array([[1, 0, 0, i]], dtype=np.float32).tofile(velodyne_dir / f"{i:06}.bin")
+    poses_file = tmp_path / "poses.txt"
+    _write_poses(poses_file)
+    scene = Scene(["000000", "000001", "000002"], KittiVelodyneSeries(velodyne_dir.as_posix()), [], [])
+    output_dir = tmp_path / "output"
+
+    accumulate_scene(scene, read_poses(poses_file), output_dir, sweeps_before=1, sweeps_after=1)
+
+    accumulated = Scene.decode_path(output_dir / Defaults.scene_meta_file)
+    assert accumulated.id_list == scene.id_list
+
+    def read(frame_id: str) -> np.ndarray:
+        file = Path(accumulated.velodyne.velodyne_dir) / f"{frame_id}.bin"
+        return as_float_array(open_point_cloud(file, "xyzi"))
+
+    np.testing.assert_allclose(read("000000"), [[1, 0, 0, 0], [11, 0, 0, 1]])
+    np.testing.assert_allclose(read("000001"), [[1, 0, 0, 1], [-9, 0, 0, 0], [10, 1, 0, 2]], atol=1e-6)
+    np.testing.assert_allclose(read("000002"), [[1, 0, 0, 2], [0, 9, 0, 1]], atol=1e-6)
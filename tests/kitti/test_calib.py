@@ -1,7 +1,10 @@
 import math
 from pathlib import Path
 
-from anno3d.kitti.calib import read_calibration
+import numpy as np
+
+from anno3d.kitti.calib import read_calibration, transform_label_arrays_into_lidar_coordinates
+from anno3d.model.kitti_label import KittiLabelArrays
 
 test_ressources_path = Path(__file__).parent.parent / "resources" / "tm20_calib.txt"
 
@@ -12,3 +15,27 @@ def test_read_calib():
 
     assert fov_degree > 46
     assert fov_degree < 48
+
+
+def test_transform_label_arrays_into_lidar_coordinatesは全ラベルをまとめてLiDAR座標系に変換する():
+    calib = read_calibration(test_ressources_path)
+    labels = KittiLabelArrays.decode_many(
+        "\n".join(
+            [
+                "Car 0.00 0 -1.57 599.41 156.40 629.75 189.25 2.85 2.63 12.34 0.47 1.49 69.44 -1.56",
+                "DontCare -1 -1 -10 503.89 169.71 590.61 190.13 -1 -1 -1 -1000 -1000 -1000 -10",
+                "Truck 0.00 0 -1.57 599.41 156.40 629.75 189.25 3.2 2.5 8.1 -5.0 1.7 30.0 3.14159",
+                "Cyclist 0.00 3 -1.65 676.60 163.95 688.98 193.93 1.86 0.60 2.02 4.59 1.32 45.84 1.5707963 0.99 id",
+            ]
+        )
+    )
+
+    actual = transform_label_arrays_into_lidar_coordinates(labels, calib)
+
+    assert actual.types == ["Car", "Truck", "Cyclist"]
+    assert actual.annotation_ids == [None, None, "id"]
+    np.testing.assert_array_equal(actual.sizes, labels.sizes)
+    for i in range(len(labels)):
+        expected = np.dot(np.linalg.inv(calib.V2C_R), labels.locations[i] - calib.V2C_t)
+        np.testing.assert_allclose(actual.locations[i], expected, rtol=1e-12)
+    np.testing.assert_allclose(actual.yaws, [1.56 - np.pi / 2, np.pi * 1.5 - 3.14159, -1.5707963 - np.pi / 2])
@@ -0,0 +1,56 @@
+from pathlib import Path
+
+import numpy as np
+
+from anno3d.kitti.crop import AreaCropSettings, crop_file, crop_points
+from anno3d.kitti.point_cloud import as_float_array, open_point_cloud, point_dtype
+from anno3d.model.annotation_area import RectAnnotationArea, SphereAnnotationArea, WholeAnnotationArea
+
+test_velodyne_path = Path(__file__).parent.parent / "resources" / "kitti3dobj" / "testing" / "velodyne" / "000000.bin"
+
+points = (
+    np.array(
+        [
+            [0.0, 0.0, 0.0, 1.0],
+            [9.0, 0.0, 4.0, 2.0],
+            [10.5, 0.0, 0.0, 3.0],
+            [-20.0, 3.0, 0.0, 4.0],
+        ],
+        dtype=np.float32,
+    )
+    .view(point_dtype("xyzi"))
+    .reshape(-1)
+)
+
+
+def test_crop_pointsは球の外側の点を取り除く():
+    actual = crop_points(points, SphereAnnotationArea(area_radius="10"), 0.0)
+    assert as_float_array(actual)[:, 3].tolist() == [1.0, 2.0]
+
+    with_margin = crop_points(points, SphereAnnotationArea(area_radius="10"), 1.0)
+    assert as_float_array(with_margin)[:, 3].tolist() == [1.0, 2.0, 3.0]
+
+
+def test_crop_pointsは矩形の外側の点を取り除く():
+    area = RectAnnotationArea(area_max_x="10", area_max_y="2", area_min_x="-20", area_min_y="-2")
+
+    actual = crop_points(points, area, 0.0)
+    assert as_float_array(actual)[:, 3].tolist() == [1.0, 2.0]
+
+    with_margin = crop_points(points, area, 1.0)
+    assert as_float_array(with_margin)[:, 3].tolist() == [1.0, 2.0, 3.0, 4.0]
+
+
+def test_crop_pointsは全体が対象の場合は点を取り除かない():
+    assert len(crop_points(points, WholeAnnotationArea(), 0.0)) == len(points)
+
+
+def test_crop_fileは切り抜いた点群を書き出す(tmp_path: Path):
+    settings = AreaCropSettings(SphereAnnotationArea(area_radius="20"), 0.0, tmp_path)
+
+    output = crop_file(test_velodyne_path, "xyzi", settings)
+
+    cropped = as_float_array(open_point_cloud(output, "xyzi"))
+    assert 0 < len(cropped) < len(open_point_cloud(test_velodyne_path, "xyzi"))
+    assert np.all(np.linalg.norm(cropped[:, :3], axis=1) <= 20.0)
+    assert crop_file(test_velodyne_path, "xyzi", settings) == output
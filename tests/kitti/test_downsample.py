@@ -0,0 +1,54 @@
+from pathlib import Path
+
+import numpy as np
+
+from anno3d.kitti.downsample import VoxelDownsampleSettings, downsample_file, voxel_downsample
+from anno3d.kitti.point_cloud import as_float_array, open_point_cloud, point_dtype
+
+test_velodyne_path = Path(__file__).parent.parent / "resources" / "kitti3dobj" / "testing" / "velodyne" / "000000.bin"
+
+
+def _points(values: np.ndarray, pcd_format: str) -> np.ndarray:
+    return np.ascontiguousarray(values, dtype=np.float32).view(point_dtype(pcd_format)).reshape(-1)
+
+
+def test_voxel_downsampleは同じボクセルの点を平均した1点にまとめる():
+    points = _points(
+        np.array(
+            [
+                [0.1, 0.1, 0.1, 1.0],
+                [0.3, 0.3, 0.3, 3.0],
+                [-0.1, 0.1, 0.1, 5.0],
+                [1.2, 0.1, 0.1, 7.0],
+            ]
+        ),
+        "xyzi",
+    )
+
+    actual = as_float_array(voxel_downsample(points, 0.5))
+
+    expected = np.array([[-0.1, 0.1, 0.1, 5.0], [0.2, 0.2, 0.2, 2.0], [1.2, 0.1, 0.1, 7.0]], dtype=np.float32)
+    np.testing.assert_allclose(actual, expected, rtol=1e-6)
+
+
+def test_voxel_downsampleはxyzirgbの色も平均する():
+    points = _points(np.array([[0.1, 0.1, 0.1, 1.0, 10, 20, 30], [0.2, 0.2, 0.2, 3.0, 30, 40, 50]]), "xyzirgb")
+
+    actual = voxel_downsample(points, 1.0)
+
+    assert actual.dtype == point_dtype("xyzirgb")
+    assert len(actual) == 1
+    np.testing.assert_allclose(as_float_array(actual)[0, 3:], [2.0, 20, 30, 40])
+
+
+def test_downsample_fileは出力済みのファイルを再利用する(tmp_path: Path):
+    settings = VoxelDownsampleSettings(0.5, tmp_path)
+
+    output = downsample_file(test_velodyne_path, "xyzi", settings)
+    mtime = output.stat().st_mtime_ns
+
+    assert output.name == test_velodyne_path.name
+    assert 0 < len(open_point_cloud(output, "xyzi")) < len(open_point_cloud(test_velodyne_path, "xyzi"))
+    assert downsample_file(test_velodyne_path, "xyzi", settings) == output
+    assert output.stat().st_mtime_ns == mtime
+    assert downsample_file(test_velodyne_path, "xyzi", VoxelDownsampleSettings(1.0, tmp_path)) != output
@@ -0,0 +1,49 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from anno3d.kitti.point_cloud import as_float_array, count_points, open_point_cloud, point_cloud_stats
+
+test_velodyne_path = Path(__file__).parent.parent / "resources" / "kitti3dobj" / "testing" / "velodyne" / "000000.bin"
+
+
+def test_open_point_cloudはnp_fromfileと同じ値を参照する():
+    expected = np.fromfile(test_velodyne_path, dtype=np.float32).reshape(-1, 4)
+    points = open_point_cloud(test_velodyne_path, "xyzi")
+
+    assert isinstance(points, np.memmap)
+    assert len(points) == len(expected)
+    assert points.dtype.names == ("x", "y", "z", "i")
+    np.testing.assert_array_equal(as_float_array(points), expected)
+
+
+def test_point_cloud_statsはチャンクに分けても全体の範囲を求める():
+    expected = np.fromfile(test_velodyne_path, dtype=np.float32).reshape(-1, 4)
+    stats = point_cloud_stats(test_velodyne_path, "xyzi", chunk_size=1000)
+
+    assert stats.count == len(expected)
+    assert stats.min is not None and stats.max is not None
+    assert (stats.min.x, stats.min.y, stats.min.z) == tuple(expected[:, :3].min(axis=0))
+    assert (stats.max.x, stats.max.y, stats.max.z) == tuple(expected[:, :3].max(axis=0))
+
+
+def test_xyzirgbの点群を開ける(tmp_path: Path):
+    expected = np.arange(7 * 5, dtype=np.float32).reshape(5, 7)
+    file = tmp_path / "000000.bin"
+    expected.tofile(file)
+
+    points = open_point_cloud(file, "xyzirgb")
+
+    assert len(points) == 5
+    np.testing.assert_array_equal(points["g"], expected[:, 5])
+    with pytest.raises(RuntimeError):
+        count_points(file, "xyzi")
+
+
+def test_空の点群(tmp_path: Path):
+    file = tmp_path / "000000.bin"
+    file.write_bytes(b"")
+
+    assert len(open_point_cloud(file, "xyzi")) == 0
+    assert point_cloud_stats(file, "xyzi").min is None
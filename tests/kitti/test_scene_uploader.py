@@ -0,0 +1,236 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, cast
+from unittest import mock
+
+import pytest
+import requests
+from annofabapi import AnnofabApi
+
+from anno3d.annofab.concurrency import AdaptiveLimiter
+from anno3d.annofab.retry import RetrySettings
+from anno3d.annofab.uploader import Uploader
+from anno3d.kitti import scene_uploader
+from anno3d.kitti.calib import read_calibration, transform_label_arrays_into_lidar_coordinates
+from anno3d.kitti.camera_horizontal_fov_provider import CameraHorizontalFovKind
+from anno3d.kitti.scene_uploader import (
+    SceneUploader,
+    SceneUploaderInput,
+    UploadKind,
+    _load_frame_labels,
+    _run_stages,
+)
+from anno3d.model.file_paths import FilePaths, LabelPaths
+from anno3d.model.kitti_label import KittiLabelArrays
+from anno3d.model.scene import KittiVelodyneSeries, Scene
+from anno3d.simple_data_uploader import PreparedFrame, create_input_data_id
+
+UploadFunc = Callable[[PreparedFrame], Awaitable[None]]
+
+
+class _FakeUploader:
+    def __init__(self):
+        self.closed = False
+
+    def prepare(self, input_data_ids: Any) -> None:
+        pass
+
+    async def close_async(self) -> None:
+        self.closed = True
+
+
+class _FakeTaskApi:
+    """`TaskApi`の代わりに、作成したタスクを記録します。 `TaskApi(client, project_id)`の呼び出しで自身を返します。"""
+
+    def __init__(self, existing: Optional[Dict[str, List[str]]] = None, failures: Optional[List[Exception]] = None):
+        self.existing = existing if existing is not None else {}
+        self.failures = failures if failures is not None else []
+        self.created: List[Tuple[str, List[str]]] = []
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, client: Any, project_id: str) -> "_FakeTaskApi":
+        return self
+
+    def get_task_input_data_ids(self, _task_id_prefix: Optional[str] = None) -> Dict[str, List[str]]:
+        return self.existing
+
+    def get_task(self, _task_id: str) -> None:
+        return None
+
+    def put_task(self, task_id: str, input_data_ids: List[str]) -> None:
+        with self._lock:
+            self.calls += 1
+            if self.failures:
+                raise self.failures.pop(0)
+            self.created.append((task_id, list(input_data_ids)))
+
+
+class _Recorder:
+    def __init__(self):
+        self.prepared: List[str] = []
+        self.uploaded: List[str] = []
+
+
+async def _upload(
+    frame_count: int,
+    frame_per_task: Optional[int],
+    task_api: _FakeTaskApi,
+    recorder: _Recorder,
+    upload: Optional[UploadFunc] = None,
+    workers: int = 4,
+) -> None:
+    """
+    補助情報の準備・アップロード・タスクの作成をフェイクに置き換えて、`SceneUploader`のパイプラインを実行します。
+    """
+    scene = Scene([f"{i:06d}" for i in range(frame_count)], KittiVelodyneSeries("velodyne"), [], [])
+
+    def prepare_upload(input_data_id_prefix: str, paths: FilePaths, *_args: Any) -> PreparedFrame:
+        input_data_id = create_input_data_id(input_data_id_prefix, paths)
+        recorder.prepared.append(input_data_id)
+        return PreparedFrame(input_data_id, paths, [])
+
+    async def upload_prepared_async(
+        _uploader: Uploader, prepared: PreparedFrame, _limiter: Optional[AdaptiveLimiter] = None
+    ) -> Tuple[str, int]:
+        if upload is not None:
+            await upload(prepared)
+        recorder.uploaded.append(prepared.input_data_id)
+        return prepared.input_data_id, 0
+
+    with ExitStack() as stack:
+        project_api = stack.enter_context(mock.patch.object(scene_uploader, "ProjectApi"))
+        stack.enter_context(mock.patch.object(scene_uploader, "TaskApi", task_api))
+        # 補助情報の準備を、フェイクに置き換えられるように同じプロセスのスレッドで行う
+        stack.enter_context(mock.patch.object(scene_uploader, "create_prepare_executor", ThreadPoolExecutor))
+        stack.enter_context(mock.patch.object(scene_uploader, "prepare_upload", prepare_upload))
+        stack.enter_context(mock.patch.object(scene_uploader, "upload_prepared_async", upload_prepared_async))
+        project_api.return_value.get_annotation_specs.return_value.labels = []
+        uploader = SceneUploader(
+            cast(AnnofabApi, None),
+            cast(Uploader, _FakeUploader()),
+            workers,
+            prepare_workers=1,
+            retry=RetrySettings(max_attempts=3, initial_delay=0.0),
+        )
+        uploader_input = SceneUploaderInput(
+            "prj", "", frame_per_task, CameraHorizontalFovKind.SETTINGS, None, "task", UploadKind.CREATE_TASK
+        )
+        await asyncio.wait_for(uploader.upload_scene_async(scene, uploader_input), timeout=30)
+
+
+def test_run_stagesは最初の例外で残りのステージをキャンセルする():
+    cancelled: List[int] = []
+
+    async def failing() -> None:
+        await asyncio.sleep(0.01)
+        raise ValueError("failed")
+
+    async def waiting(number: int) -> None:
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            cancelled.append(number)
+            raise
+
+    with pytest.raises(ValueError, match="failed"):
+        asyncio.run(asyncio.wait_for(_run_stages([waiting(1), failing(), waiting(2)]), timeout=5))
+    assert sorted(cancelled) == [1, 2]
+
+
+def test_アップロードが進まない間は後段のキューの大きさを超えて準備しない():
+    recorder = _Recorder()
+
+    async def main() -> List[str]:
+        released = asyncio.Event()
+
+        async def upload(_prepared: PreparedFrame) -> None:
+            await released.wait()
+
+        uploading = asyncio.ensure_future(_upload(50, None, _FakeTaskApi(), recorder, upload=upload, workers=1))
+        await asyncio.sleep(0.3)
+        prepared_while_blocked = list(recorder.prepared)
+        released.set()
+        await uploading
+        return prepared_while_blocked
+
+    prepared_while_blocked = asyncio.run(main())
+
+    # アップロード中の1件、キュー(=ワーカー数×2)の2件、キューへの追加を待っている1件のみ準備する
+    assert 0 < len(prepared_while_blocked) <= 4
+    assert len(recorder.uploaded) == 50
+
+
+def test_アップロードの完了順に関わらずタスクの入力データはフレームの順に並ぶ():
+    recorder = _Recorder()
+    task_api = _FakeTaskApi()
+
+    async def upload(prepared: PreparedFrame) -> None:
+        # 後ろのフレームほど早く完了する
+        await asyncio.sleep(0.002 * (8 - int(prepared.input_data_id)))
+
+    asyncio.run(_upload(8, 4, task_api, recorder, upload=upload, workers=8))
+
+    assert recorder.uploaded != sorted(recorder.uploaded)
+    assert sorted(task_api.created) == [
+        ("task_0", ["000000", "000001", "000002", "000003"]),
+        ("task_1", ["000004", "000005", "000006", "000007"]),
+    ]
+
+
+def test_最後のタスクはフレーム数の端数で作成され入力データが揃ったタスクから作成する():
+    recorder = _Recorder()
+    task_api = _FakeTaskApi()
+
+    async def upload(prepared: PreparedFrame) -> None:
+        # 最初のタスクのフレームのみ遅れて完了する
+        if prepared.input_data_id in ["000000", "000001"]:
+            await asyncio.sleep(0.1)
+
+    asyncio.run(_upload(5, 2, task_api, recorder, upload=upload, workers=8))
+
+    assert task_api.created[-1] == ("task_0", ["000000", "000001"])
+    assert sorted(task_api.created) == [
+        ("task_0", ["000000", "000001"]),
+        ("task_1", ["000002", "000003"]),
+        ("task_2", ["000004"]),
+    ]
+
+
+def test_同じ入力データで作成済みのタスクはスキップし異なる入力データのタスクは失敗とする():
+    task_api = _FakeTaskApi(existing={"task_0": ["000000", "000001"]})
+    asyncio.run(_upload(4, 2, task_api, _Recorder()))
+    assert task_api.created == [("task_1", ["000002", "000003"])]
+
+    conflicting = _FakeTaskApi(existing={"task_1": ["000099"]})
+    with pytest.raises(RuntimeError, match="1件のタスクの作成に失敗しました"):
+        asyncio.run(_upload(4, 2, conflicting, _Recorder()))
+    assert conflicting.created == [("task_0", ["000000", "000001"])]
+
+
+def test_再試行可能なエラーで失敗したタスクの作成は再試行する():
+    response = requests.Response()
+    response.status_code = 503
+    task_api = _FakeTaskApi(failures=[requests.HTTPError(response=response), requests.ConnectionError()])
+
+    asyncio.run(_upload(2, None, task_api, _Recorder()))
+
+    assert task_api.calls == 3
+    assert task_api.created == [("task", ["000000", "000001"])]
+
+
+def test_1フレーム分のラベルファイルを順に読み込んで点群の座標系に変換する(tmp_path: Path):
+    calib = Path(__file__).parent.parent / "resources" / "tm20_calib.txt"
+    label = tmp_path / "000000.txt"
+    label.write_text("Car 0.00 0 -1.57 599.41 156.40 629.75 189.25 2.85 2.63 12.34 0.47 1.49 69.44 -1.56\n")
+
+    loaded = _load_frame_labels([LabelPaths(label, calib), LabelPaths(tmp_path / "missing.txt", calib)])
+
+    expected = transform_label_arrays_into_lidar_coordinates(
+        KittiLabelArrays.decode_path(label), read_calibration(calib)
+    )
+    assert [len(labels) for labels in loaded] == [1, 0]
+    assert loaded[0].to_labels() == expected.to_labels()
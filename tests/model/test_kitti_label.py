@@ -0,0 +1,60 @@
+from pathlib import Path
+
+import numpy as np
+
+from anno3d.model.kitti_label import KittiLabel, KittiLabelArrays
+
+_LINES = [
+    "Car 0.00 0 -1.57 599.41 156.40 629.75 189.25 2.85 2.63 12.34 0.47 1.49 69.44 -1.56",
+    "DontCare -1 -1 -10 503.89 169.71 590.61 190.13 -1 -1 -1 -1000 -1000 -1000 -10",
+    "Cyclist 0.00 3 -1.65 676.60 163.95 688.98 193.93 1.86 0.60 2.02 4.59 1.32 45.84 1.57 0.99 id",
+    "Car 0.00 0 1.55 614.24 181.78 727.31 284.77 1.57 1.73 4.15 1.00 1.75 13.22 1.62",
+]
+
+
+def test_decode_manyは行ごとに読み込んだ結果と一致する():
+    csv = "\n".join(_LINES) + "\n"
+
+    arrays = KittiLabelArrays.decode_many(csv)
+
+    expected = [label for label in (KittiLabel.decode(line) for line in _LINES) if label is not None]
+    assert arrays.type_names == ("Car", "Cyclist")
+    assert arrays.type_codes.tolist() == [0, 1, 0]
+    assert arrays.to_labels() == expected
+    assert KittiLabel.decode_many(csv) == expected
+
+
+def test_decode_manyは行数が多い場合も行ごとに読み込んだ結果と一致する():
+    lines = [_LINES[i % len(_LINES)] for i in range(100)]
+    expected = [label for label in (KittiLabel.decode(line) for line in lines) if label is not None]
+
+    assert KittiLabelArrays.decode_many("\n".join(lines)).to_labels() == expected
+    # スコアとアノテーションIDの列を持つ行が無い場合
+    kitti_lines = [line for line in lines if len(line.split()) == 15]
+    arrays = KittiLabelArrays.decode_many("\n".join(kitti_lines) + "\n\n")
+    assert arrays.annotation_ids is None
+    assert arrays.to_labels() == [label for label in expected if label.annotation_id is None]
+
+
+def test_decode_manyはアノテーションIDが無い場合に列を持たない():
+    arrays = KittiLabelArrays.decode_many(_LINES[0] + "\n" + _LINES[1])
+
+    assert arrays.annotation_ids is None
+    assert [label.annotation_id for label in arrays.iter_labels()] == [None]
+    assert len(KittiLabelArrays.decode_many(_LINES[1])) == 0
+
+
+def test_decode_dirはディレクトリ内のラベルファイルをまとめて読み込む(tmp_path: Path):
+    (tmp_path / "000001.txt").write_text("\n".join(_LINES[:2]))
+    (tmp_path / "000002.txt").write_text("\n".join(_LINES[2:]))
+    (tmp_path / "000003.txt").write_text("")
+
+    arrays = KittiLabelArrays.decode_dir(tmp_path, max_workers=2)
+
+    assert list(arrays.keys()) == ["000001", "000002", "000003"]
+    assert [len(labels) for labels in arrays.values()] == [1, 2, 0]
+    merged = KittiLabelArrays.concat(list(arrays.values()))
+    assert merged.types == ["Car", "Cyclist", "Car"]
+    assert merged.annotation_ids == [None, "id", None]
+    np.testing.assert_array_equal(merged.type_mask(["Cyclist"]), [False, True, False])
+    assert merged.select(merged.type_mask(["Car"])).annotation_ids == [None, None]
@@ -153,3 +153,37 @@ def test_decode_scene_with_invalid_format():
     comment_removed = "\n".join([re.sub("//.*", "", line) for line in json.split("\n")])
     with pytest.raises(Exception, match="kitti_velodyneのformatは.+である必要がありますが、hogehogeが指定されています"):
         Scene.decode(Path("/root/"), comment_removed)
+
+
+def test_decode_scene_with_calib_file():
+    """シーン全体で共通のキャリブレーションファイルを指定できることのテスト"""
+    json = """{
+  "id_list": ["006497", "012187"],
+  "serieses": [
+    {"type": "kitti_velodyne", "velodyne_dir": "velodyne"},
+    {"type": "kitti_image", "image_dir": "image_2", "calib_dir": "calib", "calib_file": "calib.txt"},
+    {"type": "kitti_image", "image_dir": "image_3", "calib_dir": "calib"},
+    {"type": "kitti_label", "label_dir": "label_2", "image_dir": "image_2", "calib_file": "calib.txt"}
+  ]
+}"""
+    scene = Scene.decode(Path("/root/"), json)
+
+    assert scene.images[0].calib_file == "/root/calib.txt"
+    assert scene.images[0].calib_path("006497") == Path("/root/calib.txt")
+    assert scene.images[1].calib_path("006497") == Path("/root/calib/006497.txt")
+    assert scene.labels[0].calib_dir is None
+    assert scene.labels[0].calib_path("012187") == Path("/root/calib.txt")
+    assert Scene.decode(Path("/other/"), scene.encode()) == scene
+
+
+def test_decode_scene_with_label_without_calib():
+    """kitti_labelにキャリブレーションデータの指定が無い場合に読み込みに失敗することのテスト"""
+    json = """{
+  "id_list": ["006497"],
+  "serieses": [
+    {"type": "kitti_velodyne", "velodyne_dir": "velodyne"},
+    {"type": "kitti_label", "label_dir": "label_2", "image_dir": "image_2"}
+  ]
+}"""
+    with pytest.raises(RuntimeError, match="calib_dirかcalib_fileが必要です"):
+        Scene.decode(Path("/root/"), json)
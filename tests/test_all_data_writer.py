@@ -0,0 +1,100 @@
+from pathlib import Path
+
+import pytest
+
+from anno3d.all_data_writer import ALL_DATA_FILE, AllDataWriter, OutputLayout, ShardedAllDataWriter, ShardingKind
+from anno3d.model.input_files import InputData, InputDataBody
+
+
+def _input_data(input_data_id: str) -> InputData:
+    return InputData(input_data_id, InputDataBody(f"{input_data_id}.bin", f"/data/{input_data_id}.bin"), [])
+
+
+def test_AllDataWriterは出力済みの入力データを読み込んで続きから追記する(tmp_path: Path):
+    writer = AllDataWriter(tmp_path)
+    writer.write(_input_data("000001"))
+    writer.write(_input_data("000002"))
+    writer.close()
+    # 書き込み途中で中断された行
+    with (tmp_path / ALL_DATA_FILE).open("a", encoding="UTF-8") as f:
+        f.write('{"id": "000003", "bo')
+
+    resumed = AllDataWriter(tmp_path)
+    assert resumed.is_written("000002")
+    assert not resumed.is_written("000003")
+    resumed.write(_input_data("000002"))
+    resumed.write(_input_data("000003"))
+    resumed.close()
+
+    lines = (tmp_path / ALL_DATA_FILE).read_text(encoding="UTF-8").splitlines()
+    assert [InputData.from_json(line).id for line in lines] == ["000001", "000002", "000003"]
+
+
+def test_ShardedAllDataWriterはシャードごとの一覧と全体の一覧に追記する(tmp_path: Path):
+    writer = ShardedAllDataWriter(tmp_path, OutputLayout(ShardingKind.BUCKET, bucket_size=2))
+    for index, frame_id in enumerate(["000001", "000002", "000003"]):
+        assert writer.frame_parent_dir(frame_id, index) == tmp_path / f"{index // 2:06d}"
+        writer.write(_input_data(frame_id), frame_id, index)
+    writer.close()
+
+    def ids(file: Path) -> list:
+        return [InputData.from_json(line).id for line in file.read_text(encoding="UTF-8").splitlines()]
+
+    assert ids(tmp_path / ALL_DATA_FILE) == ["000001", "000002", "000003"]
+    assert ids(tmp_path / "000000" / ALL_DATA_FILE) == ["000001", "000002"]
+    assert ids(tmp_path / "000001" / ALL_DATA_FILE) == ["000003"]
+
+    hashed = OutputLayout(ShardingKind.HASH, hash_length=3)
+    assert hashed.shard("000001", 0) == hashed.shard("000001", 5)
+    assert len(hashed.shard("000001", 0) or "") == 3
+    assert OutputLayout().shard("000001", 0) is None
+
+
+def test_ShardedAllDataWriterはシャードが多くてもファイルディスクリプタを使い切らない(tmp_path: Path):
+    resource = pytest.importorskip("resource")
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    limit = 256 if hard == resource.RLIM_INFINITY else min(hard, 256)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (limit, hard))
+    try:
+        # 4096個のシャードに分かれるため、全シャードのファイルを開いたままにするとファイルディスクリプタが足りなくなる
+        writer = ShardedAllDataWriter(tmp_path, OutputLayout(ShardingKind.HASH, hash_length=3))
+        frame_ids = [f"{i:06d}" for i in range(3000)]
+        for index, frame_id in enumerate(frame_ids):
+            writer.write(_input_data(frame_id), frame_id, index)
+        writer.close()
+    finally:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
+
+    shard_ids = [
+        InputData.from_json(line).id
+        for file in tmp_path.glob(f"*/{ALL_DATA_FILE}")
+        for line in file.read_text(encoding="UTF-8").splitlines()
+    ]
+    assert sorted(shard_ids) == frame_ids
+    assert len((tmp_path / ALL_DATA_FILE).read_text(encoding="UTF-8").splitlines()) == len(frame_ids)
+
+
+def test_ShardedAllDataWriterは出力が完了していないフレームのディレクトリのみを削除する(tmp_path: Path):
+    writer = ShardedAllDataWriter(tmp_path, OutputLayout())
+    for index, frame_id in enumerate(["000001", "000002"]):
+        parent_dir = writer.start_frame(frame_id, index)
+        (parent_dir / frame_id).mkdir()
+        (parent_dir / frame_id / "data.bin").write_bytes(b"")
+    # 000001のみ出力が完了した状態で中断する
+    writer.write(_input_data("000001"), "000001", 0)
+    writer.close()
+    # このクラスが出力したものではないディレクトリ
+    (tmp_path / "000003").mkdir()
+
+    resumed = ShardedAllDataWriter(tmp_path, OutputLayout())
+    assert resumed.start_frame("000002", 1) == tmp_path
+    with pytest.raises(RuntimeError, match="データ生成先ディレクトリがすでに存在します"):
+        resumed.start_frame("000003", 2)
+    resumed.close()
+
+    assert (tmp_path / "000001" / "data.bin").exists()
+    assert not (tmp_path / "000002").exists()
+    assert (tmp_path / "000003").exists()
+    assert not (tmp_path / ".000001.in_progress").exists()
+    # 削除しなかったディレクトリは、再実行しても出力途中のものとして扱わない
+    assert not (tmp_path / ".000003.in_progress").exists()
@@ -0,0 +1,53 @@
+import os
+import shutil
+from pathlib import Path
+
+from anno3d.calib_cache import CalibCache, CalibCacheStats, CalibCacheStatsCollector, calib_cache
+
+test_calib_path = Path(__file__).parent / "resources" / "kitti_calib.txt"
+
+
+def test_同じ内容のファイルは1度だけ解析する(tmp_path: Path):
+    cache = CalibCache()
+    copied = tmp_path / "000001.txt"
+    shutil.copyfile(test_calib_path, copied)
+    parsed = []
+
+    def parse(content: str) -> int:
+        parsed.append(content)
+        return len(parsed)
+
+    first = cache.get(test_calib_path, "test", parse)
+    assert cache.get(copied, "test", parse) == first
+    assert cache.get(test_calib_path, "test", parse) == first
+    assert len(parsed) == 1
+    assert cache.stats() == CalibCacheStats(hits=2, misses=1)
+
+    assert cache.get(copied, "other", parse) == 2
+    assert cache.stats() == CalibCacheStats(hits=2, misses=2)
+
+
+def test_内容が変更されたファイルは解析し直す(tmp_path: Path):
+    cache = CalibCache()
+    file = tmp_path / "000000.txt"
+    file.write_text("a")
+
+    assert cache.get(file, "test", lambda content: content) == "a"
+    file.write_text("bb")
+    assert cache.get(file, "test", lambda content: content) == "bb"
+    assert cache.stats() == CalibCacheStats(hits=0, misses=2)
+
+
+def test_CalibCacheStatsCollectorはプロセスごとの最新の統計とこのプロセスの統計を合計する():
+    collector = CalibCacheStatsCollector()
+    collector.add((-1, CalibCacheStats(hits=1, misses=1)))
+    collector.add((-1, CalibCacheStats(hits=5, misses=2)))
+    # 完了順が前後して、古い統計を後から受け取った場合
+    collector.add((-1, CalibCacheStats(hits=3, misses=2)))
+    collector.add((-2, CalibCacheStats(hits=0, misses=1)))
+    collector.add(None)
+    # このプロセスの統計は、受け取った値ではなく現在の値を用いる
+    collector.add((os.getpid(), CalibCacheStats(hits=100, misses=100)))
+
+    current = calib_cache.stats()
+    assert collector.total() == CalibCacheStats(hits=5 + current.hits, misses=3 + current.misses)
@@ -34,3 +34,13 @@ def test_load_testing():
         assert paths.images[0].image.exists()
         assert paths.images[0].calib is not None
         assert paths.images[0].calib.exists()
+
+
+def test_iter_pathsは指定した範囲のみを返す():
+    path = test_ressources_path
+    loader = FilePathsLoader(path, path, path)
+    all_ids = [paths.key.id for paths in loader.load(FrameKind.testing)]
+
+    assert [paths.key.id for paths in loader.iter_paths(FrameKind.testing, skip=1)] == all_ids[1:]
+    assert [paths.key.id for paths in loader.iter_paths(FrameKind.testing, size=1)] == all_ids[:1]
+    assert not list(loader.iter_paths(FrameKind.testing, skip=2, size=10))
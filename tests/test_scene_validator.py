@@ -0,0 +1,75 @@
+import json
+from pathlib import Path
+
+from anno3d.model.scene import KittiImageSeries, KittiLabelSeries, KittiVelodyneSeries, Scene
+from anno3d.scene_validator import FileProblem, FileRole, validate_scene
+
+
+def _create_scene(root: Path) -> Scene:
+    for name in ["velodyne", "image_2", "label_2"]:
+        (root / name).mkdir()
+    calib = root / "calib.txt"
+    calib.write_text("", encoding="UTF-8")
+    for frame_id in ["000000", "000001", "000002"]:
+        (root / "velodyne" / f"{frame_id}.bin").write_bytes(bytes(16 * 3))
+        (root / "image_2" / f"{frame_id}.png").write_bytes(b"")
+        (root / "label_2" / f"{frame_id}.txt").write_text("", encoding="UTF-8")
+
+    return Scene(
+        id_list=["000000", "000001", "000002"],
+        velodyne=KittiVelodyneSeries(str(root / "velodyne")),
+        images=[KittiImageSeries(str(root / "image_2"), calib_file=str(calib))],
+        labels=[KittiLabelSeries(str(root / "label_2"), str(root / "image_2"), calib_file=str(calib))],
+    )
+
+
+def test_validate_sceneは問題の無いシーンで問題を報告しない(tmp_path: Path):
+    report = validate_scene(_create_scene(tmp_path))
+
+    assert report.ok
+    assert report.frames == 3
+    # 画像とラベルで共通のキャリブレーションファイルは、1回のみstatする
+    assert report.files == 3 * 3 + 1
+    assert report.invalid_frames == 0
+
+
+def test_validate_sceneは欠けているファイルとサイズの不正な点群ファイルを報告する(tmp_path: Path):
+    scene = _create_scene(tmp_path)
+    (tmp_path / "image_2" / "000001.png").unlink()
+    (tmp_path / "label_2" / "000002.txt").unlink()
+    (tmp_path / "velodyne" / "000002.bin").write_bytes(bytes(20))
+
+    report = validate_scene(scene, max_workers=2)
+
+    assert not report.ok
+    assert report.invalid_frames == 2
+    actual = {(issue.role, issue.problem, Path(issue.path).name, tuple(issue.frame_ids)) for issue in report.issues}
+    assert actual == {
+        (FileRole.IMAGE, FileProblem.MISSING, "000001.png", ("000001",)),
+        (FileRole.LABEL, FileProblem.MISSING, "000002.txt", ("000002",)),
+        (FileRole.VELODYNE, FileProblem.INVALID_SIZE, "000002.bin", ("000002",)),
+    }
+    assert {issue["problem"] for issue in json.loads(report.to_json())["issues"]} == {"missing", "invalid_size"}
+
+
+def test_validate_sceneは共通のキャリブレーションファイルが無い場合に全フレームを報告する(tmp_path: Path):
+    scene = _create_scene(tmp_path)
+    (tmp_path / "calib.txt").unlink()
+
+    report = validate_scene(scene)
+
+    assert report.invalid_frames == 3
+    assert {(issue.role, tuple(issue.frame_ids)) for issue in report.issues} == {
+        (FileRole.IMAGE_CALIB, ("000000", "000001", "000002")),
+        (FileRole.LABEL_CALIB, ("000000", "000001", "000002")),
+    }
+
+
+def test_validate_sceneはラベルを検証しない場合にラベルのファイルを報告しない(tmp_path: Path):
+    scene = _create_scene(tmp_path)
+    (tmp_path / "label_2" / "000002.txt").unlink()
+
+    report = validate_scene(scene, include_labels=False)
+
+    assert report.ok
+    assert report.files == 2 * 3 + 1
@@ -0,0 +1,73 @@
+import asyncio
+import hashlib
+import threading
+from pathlib import Path
+
+import pytest
+
+from anno3d import upload_cache
+from anno3d.upload_cache import UploadCache, file_digest
+
+
+def test_file_digestはファイル全体のハッシュ値を返す(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(upload_cache, "_CHUNK_SIZE", 7)
+    content = bytes(range(256)) * 3
+    file = tmp_path / "data.bin"
+    file.write_bytes(content)
+    empty = tmp_path / "empty.bin"
+    empty.write_bytes(b"")
+
+    assert file_digest(file) == hashlib.blake2b(content, digest_size=32).hexdigest()
+    assert file_digest(empty) == hashlib.blake2b(b"", digest_size=32).hexdigest()
+
+
+def test_記録したハッシュ値と一致する場合のみ登録済みとなる(tmp_path: Path):
+    file = tmp_path / "data.bin"
+    file.write_bytes(b"before")
+    cache = UploadCache.open(tmp_path / "cache", "project")
+    digest = cache.digest(file)
+    cache.put("input_data", "data1", digest)
+    cache.close()
+
+    reopened = UploadCache.open(tmp_path / "cache", "project")
+    assert reopened.contains("input_data", "data1", digest)
+    assert not reopened.contains("supplementary", "data1", digest)
+
+    file.write_bytes(b"after")
+    assert not reopened.contains("input_data", "data1", reopened.digest(file))
+    reopened.close()
+
+
+def test_無効なキャッシュはハッシュ値を計算しない(tmp_path: Path):
+    file = tmp_path / "data.bin"
+    file.write_bytes(b"data")
+    cache = UploadCache()
+    digest = cache.digest(file)
+    cache.put("input_data", "data1", digest)
+
+    assert digest is None
+    assert not cache.contains("input_data", "data1", digest)
+
+
+def _hash_threads() -> int:
+    return len([thread for thread in threading.enumerate() if thread.name.startswith("upload-cache-hash")])
+
+
+def test_ハッシュ値の計算スレッドはdigest_asyncの呼び出し時のみ起動する(tmp_path: Path):
+    file = tmp_path / "data.bin"
+    file.write_bytes(b"data")
+    disabled = UploadCache()
+    enabled = UploadCache.open(tmp_path / "cache", "project")
+    before = _hash_threads()
+    try:
+        assert asyncio.run(disabled.digest_async(file)) is None
+        assert _hash_threads() == before
+
+        assert asyncio.run(enabled.digest_async(file)) == file_digest(file)
+        assert _hash_threads() == before + 1
+
+        enabled.shutdown_executor()
+        assert asyncio.run(enabled.digest_async(file)) == file_digest(file)
+    finally:
+        enabled.close()
+        disabled.close()
@@ -0,0 +1,33 @@
+from pathlib import Path
+
+from anno3d.upload_journal import UploadJournal
+
+
+def test_記録した処理は再度開いたジャーナルでも完了済みとなる(tmp_path: Path):
+    journal = UploadJournal.open(tmp_path, Path("scene"), "project")
+    journal.record("input_data", "data1")
+    journal.record("task", "task1", {"input_data_id_list": ["data1"]})
+    journal.close()
+
+    reopened = UploadJournal.open(tmp_path, Path("scene"), "project")
+    assert reopened.is_done("input_data", "data1")
+    assert not reopened.is_done("input_data", "data2")
+    assert not reopened.is_done("supplementary", "data1")
+    assert reopened.get_detail("task", "task1") == {"input_data_id_list": ["data1"]}
+
+    other = UploadJournal.open(tmp_path, Path("scene"), "other_project")
+    assert not other.is_done("input_data", "data1")
+
+
+def test_書き込み途中で中断された行は無視して追記できる(tmp_path: Path):
+    file = tmp_path / "journal.jsonl"
+    file.write_text('{"kind": "input_data", "key": "data1", "detail": null}\n{"kind": "inpu', encoding="UTF-8")
+
+    journal = UploadJournal(file)
+    assert journal.is_done("input_data", "data1")
+    journal.record("input_data", "data2")
+    journal.close()
+
+    reopened = UploadJournal(file)
+    assert reopened.is_done("input_data", "data1")
+    assert reopened.is_done("input_data", "data2")
@@ -0,0 +1,40 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from anno3d.util.file_link import LinkMode, place_file
+
+
+@pytest.fixture
+def src(tmp_path: Path) -> Path:
+    path = tmp_path / "src.bin"
+    path.write_bytes(b"point cloud")
+    return path
+
+
+def test_place_fileは指定した方法でファイルを配置する(tmp_path: Path, src: Path):
+    assert place_file(src, tmp_path / "hardlink.bin", LinkMode.HARDLINK) == LinkMode.HARDLINK
+    assert os.path.samefile(src, tmp_path / "hardlink.bin")
+
+    assert place_file(src, tmp_path / "symlink.bin", LinkMode.SYMLINK) == LinkMode.SYMLINK
+    assert (tmp_path / "symlink.bin").resolve() == src.resolve()
+
+    assert place_file(src, tmp_path / "copy.bin", LinkMode.COPY) == LinkMode.COPY
+    assert not os.path.samefile(src, tmp_path / "copy.bin")
+
+    # reflinkはファイルシステムが対応していない場合はコピーになる
+    assert place_file(src, tmp_path / "reflink.bin", LinkMode.REFLINK) in (LinkMode.REFLINK, LinkMode.COPY)
+    for name in ["hardlink.bin", "symlink.bin", "copy.bin", "reflink.bin"]:
+        assert (tmp_path / name).read_bytes() == b"point cloud"
+
+
+def test_place_fileはリンクを作成できない場合にコピーする(tmp_path: Path, src: Path, monkeypatch: pytest.MonkeyPatch):
+    def fail(*_) -> None:
+        raise OSError("Invalid cross-device link")
+
+    monkeypatch.setattr(os, "link", fail)
+
+    assert place_file(src, tmp_path / "auto.bin", LinkMode.AUTO) in (LinkMode.REFLINK, LinkMode.COPY)
+    assert (tmp_path / "auto.bin").read_bytes() == b"point cloud"
+    assert not os.path.samefile(src, tmp_path / "auto.bin")